@@ -32,6 +32,10 @@
 
 """Ganeti python modules"""
 
+from ganeti import importprofile
+
+importprofile.InstallFromEnvironment()
+
 try:
   from ganeti import ganeti
 except ImportError:
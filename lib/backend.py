@@ -78,6 +78,7 @@ from ganeti import objects
 from ganeti import ssconf
 from ganeti import serializer
 from ganeti import netutils
+from ganeti import nodecache
 from ganeti import runtime
 from ganeti import compat
 from ganeti import pathutils
@@ -123,6 +124,17 @@ _RCMD_INVALID_DELAY = 10
 #: command requests arrive
 _RCMD_LOCK_TIMEOUT = _RCMD_INVALID_DELAY * 0.8
 
+#: Seconds for which the results of scanning the OS and ExtStorage search
+#: paths are cached; changes are usually noticed earlier through inotify
+_DIAGNOSE_CACHE_TTL = 60
+
+#: Seconds for which information about volume groups is cached; changes made
+#: through the node daemon invalidate it earlier
+_LVM_CACHE_TTL = 10
+
+#: Seconds for which the DRBD kernel module version is cached
+_DRBD_VERSION_CACHE_TTL = 300
+
 
 class RPCFail(Exception):
   """Class denoting RPC failure.
@@ -638,7 +650,9 @@ def _GetVgInfo(
 
   """
   # TODO: GetVGInfo supports returning information for multiple VGs at once
-  vginfo = info_fn([name], excl_stor)
+  vginfo = nodecache.Get(nodecache.CN_LVM, ("vginfo", name, excl_stor),
+                         compat.partial(info_fn, [name], excl_stor),
+                         _LVM_CACHE_TTL)
   if vginfo:
     vg_free = int(round(vginfo[0][0], 0))
     vg_size = int(round(vginfo[0][1], 0))
@@ -678,7 +692,9 @@ def _GetVgSpindlesInfo(
 
   """
   if excl_stor:
-    (vg_free, vg_size) = info_fn(name)
+    (vg_free, vg_size) = \
+      nodecache.Get(nodecache.CN_LVM, ("spindles", name),
+                    compat.partial(info_fn, name), _LVM_CACHE_TTL)
   else:
     vg_free = 0
     vg_size = 0
@@ -1247,7 +1263,7 @@ def VerifyNode(what, cluster_name, all_hvparams, node_groups, groups_cfg):
 
   if constants.NV_LVLIST in what and vm_capable:
     try:
-      val = GetVolumeList(utils.ListVolumeGroups().keys())
+      val = GetVolumeList(ListVolumeGroups().keys())
     except RPCFail, err:
       val = str(err)
     result[constants.NV_LVLIST] = val
@@ -1255,7 +1271,7 @@ def VerifyNode(what, cluster_name, all_hvparams, node_groups, groups_cfg):
   _VerifyInstanceList(what, vm_capable, result, all_hvparams)
 
   if constants.NV_VGLIST in what and vm_capable:
-    result[constants.NV_VGLIST] = utils.ListVolumeGroups()
+    result[constants.NV_VGLIST] = ListVolumeGroups()
 
   if constants.NV_PVLIST in what and vm_capable:
     check_exclusive_pvs = constants.NV_EXCLUSIVEPVS in what
@@ -1277,7 +1293,10 @@ def VerifyNode(what, cluster_name, all_hvparams, node_groups, groups_cfg):
 
   if constants.NV_DRBDVERSION in what and vm_capable:
     try:
-      drbd_version = DRBD8.GetProcInfo().GetVersionString()
+      drbd_version = \
+        nodecache.Get(nodecache.CN_DRBD, "version",
+                      lambda: DRBD8.GetProcInfo().GetVersionString(),
+                      _DRBD_VERSION_CACHE_TTL)
     except errors.BlockDeviceError, err:
       logging.warning("Can't get DRBD version", exc_info=True)
       drbd_version = str(err)
@@ -2154,7 +2173,8 @@ def ListVolumeGroups():
       size of the volume
 
   """
-  return utils.ListVolumeGroups()
+  return nodecache.Get(nodecache.CN_LVM, "vglist", utils.ListVolumeGroups,
+                       _LVM_CACHE_TTL)
 
 
 def NodeVolumes():
@@ -2997,6 +3017,7 @@ def ModifyInstanceMetadata(metadata):
     client.UpdateConfig(metadata)
 
 
+@nodecache.Invalidates(nodecache.CN_LVM)
 def BlockdevCreate(disk, size, owner, on_primary, info, excl_stor):
   """Creates a block device for an instance.
 
@@ -3155,6 +3176,7 @@ def _DownloadAndDumpDevice(source_url, target_path, size):
   target_file.close()
 
 
+@nodecache.Invalidates(nodecache.CN_LVM)
 def BlockdevConvert(src_disk, target_disk):
   """Copies data from source block device to target.
 
@@ -3297,6 +3319,7 @@ def BlockdevPauseResumeSync(disks, pause):
   return success
 
 
+@nodecache.Invalidates(nodecache.CN_LVM)
 def BlockdevRemove(disk):
   """Remove a block device.
 
@@ -3783,6 +3806,17 @@ def DiagnoseOS(top_dirs=None):
   if top_dirs is None:
     top_dirs = pathutils.OS_SEARCH_PATH
 
+  return nodecache.Get(nodecache.CN_OS, tuple(top_dirs),
+                       compat.partial(_DiagnoseOS, top_dirs),
+                       _DIAGNOSE_CACHE_TTL, paths=top_dirs)
+
+
+def _DiagnoseOS(top_dirs):
+  """Computes the validity for all OSes.
+
+  @see: L{DiagnoseOS}
+
+  """
   result = []
   for dir_name in top_dirs:
     if os.path.isdir(dir_name):
@@ -4089,6 +4123,17 @@ def DiagnoseExtStorage(top_dirs=None):
   if top_dirs is None:
     top_dirs = pathutils.ES_SEARCH_PATH
 
+  return nodecache.Get(nodecache.CN_EXTSTORAGE, tuple(top_dirs),
+                       compat.partial(_DiagnoseExtStorage, top_dirs),
+                       _DIAGNOSE_CACHE_TTL, paths=top_dirs)
+
+
+def _DiagnoseExtStorage(top_dirs):
+  """Computes the validity for all ExtStorage Providers.
+
+  @see: L{DiagnoseExtStorage}
+
+  """
   result = []
   for dir_name in top_dirs:
     if os.path.isdir(dir_name):
@@ -4112,6 +4157,7 @@ def DiagnoseExtStorage(top_dirs=None):
   return result
 
 
+@nodecache.Invalidates(nodecache.CN_LVM)
 def BlockdevGrow(disk, amount, dryrun, backingstore, excl_stor):
   """Grow a stack of block devices.
 
@@ -4145,6 +4191,7 @@ def BlockdevGrow(disk, amount, dryrun, backingstore, excl_stor):
     _Fail("Failed to grow block device: %s", err, exc=True)
 
 
+@nodecache.Invalidates(nodecache.CN_LVM)
 def BlockdevSnapshot(disk, snap_name, snap_size):
   """Create a snapshot copy of a block device.
 
@@ -4356,6 +4403,7 @@ def RemoveExport(export):
     _Fail("Error while removing the export: %s", err, exc=True)
 
 
+@nodecache.Invalidates(nodecache.CN_LVM)
 def BlockdevRename(devlist):
   """Rename a list of block devices.
 
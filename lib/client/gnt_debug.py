@@ -48,7 +48,11 @@ from ganeti import errors
 from ganeti import compat
 from ganeti import ht
 from ganeti import metad
+from ganeti import nodecache
+from ganeti import pathutils
 from ganeti import wconfd
+from ganeti.rpc import node as rpc
+from ganeti.rpc import stats as rpc_stats
 
 
 #: Default fields for L{ListLocks}
@@ -59,6 +63,28 @@ _LIST_LOCKS_DEF_FIELDS = [
   "pending",
   ]
 
+#: Fields and headers shown by L{RpcStats}
+_RPC_STATS_FIELDS = [
+  ("name", "Name"),
+  ("count", "Calls"),
+  ("failed", "Failed"),
+  ("latency_avg", "AvgTime"),
+  ("latency_p90", "P90Time"),
+  ("latency_max", "MaxTime"),
+  ("req_bytes", "ReqBytes"),
+  ("resp_bytes", "RespBytes"),
+  ("compression_ratio", "Ratio"),
+  ]
+
+#: Fields and headers shown by L{NodeCacheStats}
+_NODE_CACHE_STATS_FIELDS = [
+  ("name", "Name"),
+  (nodecache.STAT_HITS, "Hits"),
+  (nodecache.STAT_MISSES, "Misses"),
+  (nodecache.STAT_INVALIDATIONS, "Invalidations"),
+  ("hit_ratio", "HitRatio"),
+  ]
+
 
 def Delay(opts, args):
   """Sleeps for a while
@@ -643,6 +669,140 @@ def ListLocks(opts, args): # pylint: disable=W0613
   return 0
 
 
+def _FormatRpcStats(opts, data):
+  """Prints a table with RPC statistics.
+
+  @param opts: the command line options selected by the user
+  @type data: dict
+  @param data: statistics as returned by L{rpc_stats.ReadFile}
+
+  """
+  if opts.by_node:
+    entries = data[rpc_stats.SK_NODES]
+  else:
+    entries = data[rpc_stats.SK_PROCEDURES]
+
+  def _FormatTime(value):
+    if value is None:
+      return "-"
+    return "%.3f" % value
+
+  rows = []
+  for name in utils.NiceSort(entries.keys()):
+    summary = rpc_stats.Summarize(entries[name])
+    rows.append([
+      name,
+      str(summary["count"]),
+      str(summary["failed"]),
+      _FormatTime(summary["latency_avg"]),
+      _FormatTime(summary["latency_p90"]),
+      _FormatTime(summary["latency_max"]),
+      str(summary["req_bytes"]),
+      str(summary["resp_bytes"]),
+      "%.2f" % summary["compression_ratio"],
+      ])
+
+  if opts.no_headers:
+    headers = None
+  else:
+    headers = dict(_RPC_STATS_FIELDS)
+
+  fields = [field for (field, _) in _RPC_STATS_FIELDS]
+
+  for line in GenerateTable(separator=opts.separator, headers=headers,
+                            fields=fields, data=rows,
+                            numfields=fields[1:]):
+    ToStdout(line)
+
+
+@UsesRPC
+def RpcStats(opts, args): # pylint: disable=W0613
+  """Shows statistics about RPC calls.
+
+  Without node names, the statistics of RPC calls made by the master daemon
+  and job processes on this node are shown. Otherwise the statistics of the
+  RPC calls handled by the node daemons on the given nodes are shown.
+
+  @param opts: the command line options selected by the user
+  @type args: list
+  @param args: should be an empty list
+  @rtype: int
+  @return: the desired exit code
+
+  """
+  if not opts.nodes:
+    _FormatRpcStats(opts, rpc_stats.ReadFile(pathutils.RPC_CLIENT_STATS_FILE))
+    return constants.EXIT_SUCCESS
+
+  retcode = constants.EXIT_SUCCESS
+  results = rpc.DnsOnlyRunner().call_rpc_stats(opts.nodes)
+
+  for node in opts.nodes:
+    result = results[node]
+    if result.fail_msg:
+      ToStderr("Failed to query node %s: %s", node, result.fail_msg)
+      retcode = constants.EXIT_FAILURE
+      continue
+
+    ToStdout("Node %s:", node)
+    _FormatRpcStats(opts, result.payload)
+
+  return retcode
+
+
+@UsesRPC
+def NodeCacheStats(opts, args):
+  """Shows statistics about the node daemon's cache.
+
+  @param opts: the command line options selected by the user
+  @type args: list
+  @param args: names of the nodes to query
+  @rtype: int
+  @return: the desired exit code
+
+  """
+  retcode = constants.EXIT_SUCCESS
+  results = rpc.DnsOnlyRunner().call_node_cache_stats(args)
+
+  if opts.no_headers:
+    headers = None
+  else:
+    headers = dict(_NODE_CACHE_STATS_FIELDS)
+
+  fields = [field for (field, _) in _NODE_CACHE_STATS_FIELDS]
+
+  for node in args:
+    result = results[node]
+    if result.fail_msg:
+      ToStderr("Failed to query node %s: %s", node, result.fail_msg)
+      retcode = constants.EXIT_FAILURE
+      continue
+
+    rows = []
+    for (name, entry) in sorted(result.payload.items()):
+      hits = entry[nodecache.STAT_HITS]
+      lookups = hits + entry[nodecache.STAT_MISSES]
+      if lookups:
+        ratio = float(hits) / lookups
+      else:
+        ratio = 0.0
+      rows.append([
+        name,
+        str(hits),
+        str(entry[nodecache.STAT_MISSES]),
+        str(entry[nodecache.STAT_INVALIDATIONS]),
+        "%.2f" % ratio,
+        ])
+
+    ToStdout("Node %s:", node)
+    for line in GenerateTable(separator=opts.separator, headers=headers,
+                              fields=fields, data=rows,
+                              numfields=fields[1:]):
+      ToStdout(line)
+
+  return retcode
+
+
 def Metad(opts, args): # pylint: disable=W0613
   """Send commands to Metad.
 
@@ -803,6 +963,19 @@ commands = {
     ListLocks, ARGS_NONE,
     [NOHDR_OPT, SEP_OPT, FIELDS_OPT, INTERVAL_OPT, VERBOSE_OPT],
     "[--interval N]", "Show a list of locks in the master daemon"),
+  "rpc-stats": (
+    RpcStats, ARGS_NONE,
+    [NOHDR_OPT, SEP_OPT,
+     cli_option("--by-node", dest="by_node", default=False,
+                action="store_true",
+                help="Group statistics by node instead of by procedure"),
+     cli_option("-n", "--node", dest="nodes", default=[], action="append",
+                help="Show the statistics of the node daemon on this node"
+                " (can be given multiple times)")],
+    "[--by-node] [-n <node>...]", "Show statistics about RPC calls"),
+  "node-cache-stats": (
+    NodeCacheStats, [ArgNode(min=1)], [NOHDR_OPT, SEP_OPT],
+    "<node>...", "Show statistics about the node daemon's cache"),
   "wconfd": (
     Wconfd, [ArgUnknown(min=1)], [],
     "<cmd> <args...>", "Directly talk to WConfD"),
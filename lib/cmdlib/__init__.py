@@ -30,105 +30,157 @@
 
 """Module implementing the master-side code.
 
-This file only imports all LU's (and other classes) in order to re-export them
-to clients of cmdlib.
+This file only lists all LU's (and other classes) in order to make them
+available to clients of cmdlib. The modules defining the LU's are imported
+only once an LU is needed, see L{GetLogicalUnit}.
 
 """
 
+import sys
+
+from ganeti import errors
+
 from ganeti.cmdlib.base import \
   LogicalUnit, \
   NoHooksLU, \
   ResultWithJobs
 
-from ganeti.cmdlib.cluster import \
-  LUClusterActivateMasterIp, \
-  LUClusterDeactivateMasterIp, \
-  LUClusterConfigQuery, \
-  LUClusterDestroy, \
-  LUClusterPostInit, \
-  LUClusterQuery, \
-  LUClusterRedistConf, \
-  LUClusterRename, \
-  LUClusterRepairDiskSizes, \
-  LUClusterSetParams, \
-  LUClusterRenewCrypto
-from ganeti.cmdlib.cluster.verify import \
-  LUClusterVerify, \
-  LUClusterVerifyConfig, \
-  LUClusterVerifyGroup, \
-  LUClusterVerifyDisks
-from ganeti.cmdlib.group import \
-  LUGroupAdd, \
-  LUGroupAssignNodes, \
-  LUGroupSetParams, \
-  LUGroupRemove, \
-  LUGroupRename, \
-  LUGroupEvacuate, \
-  LUGroupVerifyDisks
-from ganeti.cmdlib.node import \
-  LUNodeAdd, \
-  LUNodeSetParams, \
-  LUNodePowercycle, \
-  LUNodeEvacuate, \
-  LUNodeMigrate, \
-  LUNodeModifyStorage, \
-  LUNodeQueryvols, \
-  LUNodeQueryStorage, \
-  LUNodeRemove, \
-  LURepairNodeStorage
-from ganeti.cmdlib.instance import \
-  LUInstanceRename, \
-  LUInstanceRemove, \
-  LUInstanceMove, \
-  LUInstanceMultiAlloc, \
-  LUInstanceChangeGroup
-from ganeti.cmdlib.instance_create import \
-  LUInstanceCreate
-from ganeti.cmdlib.instance_storage import \
-  LUInstanceRecreateDisks, \
-  LUInstanceGrowDisk, \
-  LUInstanceReplaceDisks, \
-  LUInstanceActivateDisks, \
-  LUInstanceDeactivateDisks
-from ganeti.cmdlib.instance_migration import \
-  LUInstanceFailover, \
-  LUInstanceMigrate
-from ganeti.cmdlib.instance_operation import \
-  LUInstanceStartup, \
-  LUInstanceShutdown, \
-  LUInstanceReinstall, \
-  LUInstanceReboot, \
-  LUInstanceConsole
-from ganeti.cmdlib.instance_set_params import \
-  LUInstanceSetParams
-from ganeti.cmdlib.instance_query import \
-  LUInstanceQueryData
-from ganeti.cmdlib.backup import \
-  LUBackupPrepare, \
-  LUBackupExport, \
-  LUBackupRemove
-from ganeti.cmdlib.query import \
-  LUQuery, \
-  LUQueryFields
-from ganeti.cmdlib.operating_system import \
-  LUOsDiagnose
-from ganeti.cmdlib.tags import \
-  LUTagsGet, \
-  LUTagsSearch, \
-  LUTagsSet, \
-  LUTagsDel
-from ganeti.cmdlib.network import \
-  LUNetworkAdd, \
-  LUNetworkRemove, \
-  LUNetworkSetParams, \
-  LUNetworkConnect, \
-  LUNetworkDisconnect
-from ganeti.cmdlib.misc import \
-  LUOobCommand, \
-  LUExtStorageDiagnose, \
-  LURestrictedCommand
-from ganeti.cmdlib.test import \
-  LUTestOsParams, \
-  LUTestDelay, \
-  LUTestJqueue, \
-  LUTestAllocator
+
+#: The names of all LU's, grouped by the module (relative to this package)
+#: defining them
+_LU_MODULES = [
+  ("cluster", [
+    "LUClusterActivateMasterIp",
+    "LUClusterDeactivateMasterIp",
+    "LUClusterConfigQuery",
+    "LUClusterDestroy",
+    "LUClusterPostInit",
+    "LUClusterQuery",
+    "LUClusterRedistConf",
+    "LUClusterRename",
+    "LUClusterRepairDiskSizes",
+    "LUClusterSetParams",
+    "LUClusterRenewCrypto",
+    ]),
+  ("cluster.verify", [
+    "LUClusterVerify",
+    "LUClusterVerifyConfig",
+    "LUClusterVerifyGroup",
+    "LUClusterVerifyDisks",
+    ]),
+  ("group", [
+    "LUGroupAdd",
+    "LUGroupAssignNodes",
+    "LUGroupSetParams",
+    "LUGroupRemove",
+    "LUGroupRename",
+    "LUGroupEvacuate",
+    "LUGroupVerifyDisks",
+    ]),
+  ("node", [
+    "LUNodeAdd",
+    "LUNodeSetParams",
+    "LUNodePowercycle",
+    "LUNodeEvacuate",
+    "LUNodeMigrate",
+    "LUNodeModifyStorage",
+    "LUNodeQueryvols",
+    "LUNodeQueryStorage",
+    "LUNodeRemove",
+    "LURepairNodeStorage",
+    ]),
+  ("instance", [
+    "LUInstanceRename",
+    "LUInstanceRemove",
+    "LUInstanceMove",
+    "LUInstanceMultiAlloc",
+    "LUInstanceChangeGroup",
+    ]),
+  ("instance_create", [
+    "LUInstanceCreate",
+    ]),
+  ("instance_storage", [
+    "LUInstanceRecreateDisks",
+    "LUInstanceGrowDisk",
+    "LUInstanceReplaceDisks",
+    "LUInstanceActivateDisks",
+    "LUInstanceDeactivateDisks",
+    ]),
+  ("instance_migration", [
+    "LUInstanceFailover",
+    "LUInstanceMigrate",
+    ]),
+  ("instance_operation", [
+    "LUInstanceStartup",
+    "LUInstanceShutdown",
+    "LUInstanceReinstall",
+    "LUInstanceReboot",
+    "LUInstanceConsole",
+    ]),
+  ("instance_set_params", [
+    "LUInstanceSetParams",
+    ]),
+  ("instance_query", [
+    "LUInstanceQueryData",
+    ]),
+  ("backup", [
+    "LUBackupPrepare",
+    "LUBackupExport",
+    "LUBackupRemove",
+    ]),
+  ("query", [
+    "LUQuery",
+    "LUQueryFields",
+    ]),
+  ("operating_system", [
+    "LUOsDiagnose",
+    ]),
+  ("tags", [
+    "LUTagsGet",
+    "LUTagsSearch",
+    "LUTagsSet",
+    "LUTagsDel",
+    ]),
+  ("network", [
+    "LUNetworkAdd",
+    "LUNetworkRemove",
+    "LUNetworkSetParams",
+    "LUNetworkConnect",
+    "LUNetworkDisconnect",
+    ]),
+  ("misc", [
+    "LUOobCommand",
+    "LUExtStorageDiagnose",
+    "LURestrictedCommand",
+    ]),
+  ("test", [
+    "LUTestOsParams",
+    "LUTestDelay",
+    "LUTestJqueue",
+    "LUTestAllocator",
+    ]),
+  ]
+
+#: Maps the name of each LU to the module defining it
+_LU_TO_MODULE = dict((lu_name, "ganeti.cmdlib.%s" % module)
+                     for (module, lu_names) in _LU_MODULES
+                     for lu_name in lu_names)
+
+
+def GetLogicalUnit(name):
+  """Returns the class of a logical unit.
+
+  The module defining the logical unit is imported on first use.
+
+  @type name: string
+  @param name: the name of the logical unit, e.g. C{LUClusterQuery}
+  @raise errors.ProgrammerError: if the logical unit is unknown
+
+  """
+  try:
+    module_name = _LU_TO_MODULE[name]
+  except KeyError:
+    raise errors.ProgrammerError("Unknown logical unit '%s'" % name)
+
+  __import__(module_name)
+  return getattr(sys.modules[module_name], name)
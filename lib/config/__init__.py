@@ -52,13 +52,15 @@ import threading
 import itertools
 
 from ganeti.config.temporary_reservations import TemporaryReservationManager
+from ganeti.config.indexes import NameIndex, InstanceIndex
 from ganeti.config.utils import ConfigSync, ConfigManager
 from ganeti.config.verify import (VerifyType, VerifyNic, VerifyIpolicy,
-                                  ValidateConfig)
+                                  ValidateConfig, VerifyCache)
 
 from ganeti import errors
 from ganeti import utils
 from ganeti import constants
+from ganeti import compat
 import ganeti.wconfd as wc
 from ganeti import objects
 from ganeti import serializer
@@ -119,12 +121,10 @@ def GetConfig(ec_id, livelock, **kwargs):
 # job id used for resource management at config upgrade time
 _UPGRADE_CONFIG_JID = "jid-cfg-upgrade"
 
-
-def _MatchNameComponentIgnoreCase(short_name, names):
-  """Wrapper around L{utils.text.MatchNameComponent}.
-
-  """
-  return utils.MatchNameComponent(short_name, names, case_sensitive=False)
+# the containers of the configuration that can be written as a delta, in the
+# order expected by WConfd
+_CONFIG_DELTA_CONTAINERS = ("nodes", "nodegroups", "instances", "networks",
+                            "disks")
 
 
 def _CheckInstanceDiskIvNames(disks):
@@ -165,6 +165,15 @@ class ConfigWriter(object):
                accept_foreign=False, wconfdcontext=None, wconfd=None):
     self.write_count = 0
     self._config_data = None
+    self._name_indexes = {}
+    self._instance_index = None
+    self._config_changes = None
+    self._config_sections = 0
+    self._config_tracked_sections = set()
+    self._config_unmodified = False
+    self._config_outdated = False
+    self._config_upgraded = False
+    self._verify_cache = VerifyCache()
     self._SetConfigData(None)
     self._offline = offline
     if cfg_file is None:
@@ -191,10 +200,182 @@ class ConfigWriter(object):
     return self._config_data
 
   def OutDate(self):
-    self._config_data = None
+    """Marks the configuration copy as possibly out of date.
+
+    A copy matching WConfd's is kept, as acquiring the configuration lock
+    only fetches the configuration again if it has changed since. Shared
+    access without the lock reads it again.
+
+    """
+    if self._config_unmodified:
+      self._config_outdated = True
+    else:
+      self._SetConfigData(None)
 
   def _SetConfigData(self, cfg):
     self._config_data = cfg
+    self._name_indexes = {}
+    self._instance_index = None
+    # changes recorded so far refer to the previous objects
+    self._config_changes = None
+    # set again once the data is known to match WConfd's copy
+    self._config_unmodified = False
+    self._config_outdated = False
+
+  def _UnlockedStartConfigChanges(self, tracked):
+    """Starts recording changes after the configuration has been locked.
+
+    @type tracked: bool
+    @param tracked: Whether the configuration is unchanged from what WConfd
+      has, so that recorded changes can be written as a delta
+
+    """
+    if tracked:
+      self._config_changes = {}
+    else:
+      self._config_changes = None
+    self._config_sections = 1
+    self._config_tracked_sections = set()
+
+  def _UnlockedRecordChange(self, kind, uuid=None):
+    """Records a configuration object changed under the exclusive lock.
+
+    Every method opening an exclusive configuration section must record all
+    objects it adds, modifies or removes in order for the changes to be
+    written as a delta. If any section records nothing, the whole
+    configuration is written.
+
+    @type kind: string
+    @param kind: "cluster" or one of L{_CONFIG_DELTA_CONTAINERS}
+    @type uuid: string
+    @param uuid: UUID of the changed or removed object, unused for the
+      cluster
+
+    """
+    # the object may have been changed without a new serial number
+    if kind == "cluster":
+      self._verify_cache.Clear()
+    else:
+      self._verify_cache.Forget(kind, uuid)
+
+    if self._config_changes is None:
+      return
+
+    self._config_changes.setdefault(kind, set()).add(uuid)
+    self._config_tracked_sections.add(self._config_sections)
+
+  def _UnlockedGetConfigDelta(self):
+    """Returns the recorded changes in the format expected by WConfd.
+
+    @rtype: tuple or None
+    @return: The new cluster object, or C{None} if it is unchanged, and the
+      changed objects of each of L{_CONFIG_DELTA_CONTAINERS} by UUID, with
+      C{None} for removed objects; C{None} if the changes have not been fully
+      recorded and the whole configuration must be written instead
+
+    """
+    changes = self._config_changes
+    if (changes is None or
+        len(self._config_tracked_sections) != self._config_sections):
+      return None
+
+    data = self._ConfigData()
+
+    if "cluster" in changes:
+      cluster = data.cluster.ToDict()
+    else:
+      cluster = None
+
+    containers = []
+    for kind in _CONFIG_DELTA_CONTAINERS:
+      objs = getattr(data, kind)
+      delta = {}
+      for uuid in changes.get(kind, []):
+        obj = objs.get(uuid)
+        if obj is None:
+          delta[uuid] = None
+        else:
+          delta[uuid] = obj.ToDict()
+      containers.append(delta)
+
+    return (cluster, containers)
+
+  def _UnlockedGetNameIndex(self, kind):
+    """Returns the name index for a kind of configuration objects.
+
+    The index is built on first use after the configuration was loaded.
+
+    @type kind: string
+    @param kind: Attribute of L{objects.ConfigData} holding the objects, one
+      of "nodes", "instances" or "disks"
+    @rtype: L{NameIndex}
+
+    """
+    objs = getattr(self._ConfigData(), kind)
+
+    index = self._name_indexes.get(kind)
+    if index is None or not index.IsCurrent(objs):
+      index = self._name_indexes[kind] = NameIndex(objs)
+
+    return index
+
+  def _UnlockedGetObjectsByName(self, kind, name):
+    """Returns all configuration objects of a kind with the given name.
+
+    @type kind: string
+    @param kind: See L{_UnlockedGetNameIndex}
+    @type name: string
+    @param name: Object name
+    @rtype: list
+
+    """
+    objs = getattr(self._ConfigData(), kind)
+    result = [objs.get(uuid)
+              for uuid in self._UnlockedGetNameIndex(kind).Lookup(name)]
+
+    if not compat.all(obj is not None and obj.name == name for obj in result):
+      # An object was renamed without updating the index, rebuild it
+      self._name_indexes.pop(kind, None)
+      result = [objs[uuid]
+                for uuid in self._UnlockedGetNameIndex(kind).Lookup(name)]
+
+    return result
+
+  def _UnlockedGetInstanceIndex(self):
+    """Returns the index from nodes and disks to instances.
+
+    The index is built on first use after the configuration was loaded and
+    must be discarded by all functions changing the nodes or disks of an
+    instance in place.
+
+    @rtype: L{InstanceIndex}
+
+    """
+    data = self._ConfigData()
+
+    if (self._instance_index is None or
+        not self._instance_index.IsCurrent(data)):
+      self._instance_index = InstanceIndex(data)
+
+    return self._instance_index
+
+  def _UnlockedExpandName(self, kind, short_name):
+    """Attempts to expand an incomplete name of a configuration object.
+
+    @type kind: string
+    @param kind: See L{_UnlockedGetNameIndex}
+    @rtype: tuple; (string, string) or (None, None)
+    @return: UUID and full name of the object
+
+    """
+    expanded_name = self._UnlockedGetNameIndex(kind).Expand(short_name)
+    if expanded_name is not None:
+      # there has to be exactly one object with that name
+      objs = self._UnlockedGetObjectsByName(kind, expanded_name)
+      if objs:
+        return (objs[0].uuid, objs[0].name)
+
+    return (None, None)
 
   def _GetWConfdContext(self):
     return self._wconfdcontext
@@ -325,14 +506,18 @@ class ConfigWriter(object):
       raise errors.ConfigurationError("Disk %s doesn't exist" % disk_uuid)
 
     # Disk must not be attached anywhere
-    for inst in self._ConfigData().instances.values():
-      if disk_uuid in inst.disks:
-        raise errors.ReservationError("Cannot remove disk %s. Disk is"
-                                      " attached to instance %s"
-                                      % (disk_uuid, inst.name))
+    index = self._UnlockedGetInstanceIndex()
+    for inst_uuid in index.GetDiskInstances(disk_uuid):
+      inst = self._UnlockedGetInstanceInfo(inst_uuid)
+      raise errors.ReservationError("Cannot remove disk %s. Disk is"
+                                    " attached to instance %s"
+                                    % (disk_uuid, inst.name))
 
     # Remove disk from config file
-    del self._ConfigData().disks[disk_uuid]
+    disk = self._ConfigData().disks.pop(disk_uuid)
+    index = self._name_indexes.get("disks")
+    if index is not None:
+      index.Remove(disk_uuid, disk.name)
     self._ConfigData().cluster.serial_no += 1
 
   def RemoveInstanceDisk(self, inst_uuid, disk_uuid):
@@ -384,18 +569,16 @@ class ConfigWriter(object):
     @return: the disk object
 
     """
-    disk = None
-    count = 0
-    for d in self._ConfigData().disks.itervalues():
-      if d.name == disk_name:
-        count += 1
-        disk = d
+    disks = self._UnlockedGetObjectsByName("disks", disk_name)
 
-    if count > 1:
+    if len(disks) > 1:
       raise errors.ConfigurationError("There are %s disks with this name: %s"
-                                      % (count, disk_name))
+                                      % (len(disks), disk_name))
 
-    return disk
+    if disks:
+      return disks[0]
+
+    return None
 
   @ConfigSync(shared=1)
   def GetDiskInfoByName(self, disk_name):
@@ -794,7 +977,17 @@ class ConfigWriter(object):
     return result
 
   @staticmethod
-  def _VerifyDisks(data, result):
+  def _VerifyDisk(disk):
+    """Checks a single disk.
+
+    @type disk: L{objects.Disk}
+    @rtype: list of strings
+    @return: the errors found
+
+    """
+    return ["disk %s error: %s" % (disk.uuid, msg) for msg in disk.Verify()]
+
+  def _VerifyDisks(self, data, result, incremental):
     """Per-disk verification checks
 
     Extends L{result} with diagnostic information about the disks.
@@ -805,18 +998,109 @@ class ConfigWriter(object):
     @type result: list of strings
     @param result: list containing diagnostic messages
 
+    @type incremental: bool
+    @param incremental: whether to reuse the results for unchanged disks
+
     """
     for disk_uuid in data.disks:
       disk = data.disks[disk_uuid]
-      result.extend(["disk %s error: %s" % (disk.uuid, msg)
-                     for msg in disk.Verify()])
+      result.extend(self._verify_cache.Verify("disks", disk_uuid, disk, [],
+                                              self._VerifyDisk,
+                                              incremental=incremental))
       if disk.uuid != disk_uuid:
         result.append("disk '%s' is indexed by wrong UUID '%s'" %
                       (disk.name, disk_uuid))
 
-  def _UnlockedVerifyConfig(self):
+  @staticmethod
+  def _VerifyInstanceParams(cluster, instance):
+    """Checks the parameters of an instance and its NICs.
+
+    @type cluster: L{objects.Cluster}
+    @type instance: L{objects.Instance}
+    @rtype: list of strings
+    @return: the errors found
+
+    """
+    result = []
+
+    for idx, nic in enumerate(instance.nics):
+      if nic.nicparams:
+        filled = cluster.SimpleFillNIC(nic.nicparams)
+        owner = "instance %s nic %d" % (instance.name, idx)
+        VerifyType(owner, "nicparams",
+                   filled, constants.NICS_PARAMETER_TYPES, result.append)
+        VerifyNic(owner, filled, result.append)
+
+    if instance.beparams:
+      VerifyType("instance %s" % instance.name, "beparams",
+                 cluster.FillBE(instance), constants.BES_PARAMETER_TYPES,
+                 result.append)
+
+    return result
+
+  @staticmethod
+  def _VerifyNode(cluster, nodegroup, node):
+    """Checks the state and parameters of a node.
+
+    @type cluster: L{objects.Cluster}
+    @type nodegroup: L{objects.NodeGroup} or None
+    @param nodegroup: the group of the node, if it exists
+    @type node: L{objects.Node}
+    @rtype: list of strings
+    @return: the errors found
+
+    """
+    result = []
+
+    if [node.master_candidate, node.drained, node.offline].count(True) > 1:
+      result.append("Node %s state is invalid: master_candidate=%s,"
+                    " drain=%s, offline=%s" %
+                    (node.name, node.master_candidate, node.drained,
+                     node.offline))
+    if nodegroup is None:
+      result.append("Node '%s' has invalid group '%s'" %
+                    (node.name, node.group))
+    else:
+      VerifyType("node %s" % node.name, "ndparams",
+                 cluster.FillND(node, nodegroup),
+                 constants.NDS_PARAMETER_TYPES, result.append)
+    used_globals = constants.NDC_GLOBALS.intersection(node.ndparams)
+    if used_globals:
+      result.append("Node '%s' has some global parameters set: %s" %
+                    (node.name, utils.CommaJoin(used_globals)))
+
+    return result
+
+  @staticmethod
+  def _VerifyNodeGroupParams(cluster, nodegroup):
+    """Checks the parameters of a node group.
+
+    @type cluster: L{objects.Cluster}
+    @type nodegroup: L{objects.NodeGroup}
+    @rtype: list of strings
+    @return: the errors found
+
+    """
+    result = []
+
+    group_name = "group %s" % nodegroup.name
+    VerifyIpolicy(group_name, cluster.SimpleFillIPolicy(nodegroup.ipolicy),
+                  False, result.append)
+    if nodegroup.ndparams:
+      VerifyType(group_name, "ndparams",
+                 cluster.SimpleFillND(nodegroup.ndparams),
+                 constants.NDS_PARAMETER_TYPES, result.append)
+
+    return result
+
+  def _UnlockedVerifyConfig(self, incremental=False):
     """Verify function.
 
+    @type incremental: bool
+    @param incremental: if set, the checks of single objects are skipped for
+        objects which, like the objects they depend on, haven't changed since
+        they were last checked; the checks spanning several objects are
+        always run
     @rtype: list
     @return: a list of error messages; a non-empty list signifies
         configuration errors
@@ -828,6 +1112,10 @@ class ConfigWriter(object):
     ports = {}
     data = self._ConfigData()
     cluster = data.cluster
+    verify_cache = self._verify_cache
+
+    if not incremental:
+      verify_cache.Clear()
 
     # First call WConfd to perform its checks, if we're not offline
     if not self._offline:
@@ -864,7 +1152,13 @@ class ConfigWriter(object):
           )
         )
 
-    self._VerifyDisks(data, result)
+    self._VerifyDisks(data, result, incremental)
+
+    index_errors = self._UnlockedGetInstanceIndex().Verify(data)
+    if index_errors:
+      # don't keep using an index which doesn't match the configuration
+      self._instance_index = None
+    result.extend(index_errors)
 
     # per-instance checks
     for instance_uuid in data.instances:
@@ -885,18 +1179,12 @@ class ConfigWriter(object):
                         (instance.name, idx, nic.mac))
         else:
           seen_macs.append(nic.mac)
-        if nic.nicparams:
-          filled = cluster.SimpleFillNIC(nic.nicparams)
-          owner = "instance %s nic %d" % (instance.name, idx)
-          VerifyType(owner, "nicparams",
-                     filled, constants.NICS_PARAMETER_TYPES, result.append)
-          VerifyNic(owner, filled, result.append)
 
       # parameter checks
-      if instance.beparams:
-        VerifyType("instance %s" % instance.name, "beparams",
-                   cluster.FillBE(instance), constants.BES_PARAMETER_TYPES,
-                   result.append)
+      result.extend(verify_cache.Verify(
+        "instances", instance_uuid, instance, [cluster],
+        compat.partial(self._VerifyInstanceParams, cluster),
+        incremental=incremental))
 
       # check that disks exists
       for disk_uuid in instance.disks:
@@ -963,22 +1251,15 @@ class ConfigWriter(object):
       if node.uuid != node_uuid:
         result.append("Node '%s' is indexed by wrong UUID '%s'" %
                       (node.name, node_uuid))
-      if [node.master_candidate, node.drained, node.offline].count(True) > 1:
-        result.append("Node %s state is invalid: master_candidate=%s,"
-                      " drain=%s, offline=%s" %
-                      (node.name, node.master_candidate, node.drained,
-                       node.offline))
-      if node.group not in data.nodegroups:
-        result.append("Node '%s' has invalid group '%s'" %
-                      (node.name, node.group))
+      nodegroup = data.nodegroups.get(node.group)
+      if nodegroup is None:
+        # always checked, as the group could have been removed
+        result.extend(self._VerifyNode(cluster, None, node))
       else:
-        VerifyType("node %s" % node.name, "ndparams",
-                   cluster.FillND(node, data.nodegroups[node.group]),
-                   constants.NDS_PARAMETER_TYPES, result.append)
-      used_globals = constants.NDC_GLOBALS.intersection(node.ndparams)
-      if used_globals:
-        result.append("Node '%s' has some global parameters set: %s" %
-                      (node.name, utils.CommaJoin(used_globals)))
+        result.extend(verify_cache.Verify(
+          "nodes", node_uuid, node, [cluster, nodegroup],
+          compat.partial(self._VerifyNode, cluster, nodegroup),
+          incremental=incremental))
 
     # nodegroups checks
     nodegroups_names = set()
@@ -994,13 +1275,10 @@ class ConfigWriter(object):
         result.append("duplicate node group name '%s'" % nodegroup.name)
       else:
         nodegroups_names.add(nodegroup.name)
-      group_name = "group %s" % nodegroup.name
-      VerifyIpolicy(group_name, cluster.SimpleFillIPolicy(nodegroup.ipolicy),
-                    False, result.append)
-      if nodegroup.ndparams:
-        VerifyType(group_name, "ndparams",
-                   cluster.SimpleFillND(nodegroup.ndparams),
-                   constants.NDS_PARAMETER_TYPES, result.append)
+      result.extend(verify_cache.Verify(
+        "nodegroups", nodegroup_uuid, nodegroup, [cluster],
+        compat.partial(self._VerifyNodeGroupParams, cluster),
+        incremental=incremental))
 
     # drbd minors check
     # FIXME: The check for DRBD map needs to be implemented in WConfd
@@ -1070,7 +1348,7 @@ class ConfigWriter(object):
     # configuration has already been modified, and we can't revert;
     # the best we can do is to warn the user and save as is, leaving
     # recovery to the user
-    config_errors = self._UnlockedVerifyConfig()
+    config_errors = self._UnlockedVerifyConfig(incremental=True)
     if config_errors:
       errmsg = ("Configuration data is not consistent: %s" %
                 (utils.CommaJoin(config_errors)))
@@ -1379,6 +1657,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.install_image = install_image
+    self._UnlockedRecordChange("cluster")
 
   @ConfigSync(shared=1)
   def GetInstanceCommunicationNetwork(self):
@@ -1401,6 +1680,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.instance_communication_network = network_name
+    self._UnlockedRecordChange("cluster")
 
   @ConfigSync(shared=1)
   def GetZeroingImage(self):
@@ -1433,6 +1713,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.compression_tools = tools
+    self._UnlockedRecordChange("cluster")
 
   @ConfigSync()
   def AddNodeGroup(self, group, ec_id, check_uuid=True):
@@ -1481,6 +1762,8 @@ class ConfigWriter(object):
 
     self._ConfigData().nodegroups[group.uuid] = group
     self._ConfigData().cluster.serial_no += 1
+    self._UnlockedRecordChange("nodegroups", group.uuid)
+    self._UnlockedRecordChange("cluster")
 
   @ConfigSync()
   def RemoveNodeGroup(self, group_uuid):
@@ -1500,6 +1783,8 @@ class ConfigWriter(object):
 
     del self._ConfigData().nodegroups[group_uuid]
     self._ConfigData().cluster.serial_no += 1
+    self._UnlockedRecordChange("nodegroups", group_uuid)
+    self._UnlockedRecordChange("cluster")
 
   def _UnlockedLookupNodeGroup(self, target):
     """Lookup a node group's UUID.
@@ -1743,8 +2028,13 @@ class ConfigWriter(object):
       raise errors.ConfigurationError("Unknown instance '%s'" % inst_uuid)
 
     inst = self._ConfigData().instances[inst_uuid]
+    index = self._name_indexes.get("instances")
+    if index is not None:
+      index.Rename(inst_uuid, inst.name, new_name)
     inst.name = new_name
 
+    self._UnlockedRecordChange("instances", inst_uuid)
+
     instance_disks = self._UnlockedGetInstanceDisks(inst_uuid)
     for (_, disk) in enumerate(instance_disks):
       if disk.dev_type in [constants.DT_FILE, constants.DT_SHARED_FILE]:
@@ -1753,9 +2043,11 @@ class ConfigWriter(object):
         disk.logical_id = (disk.logical_id[0],
                            utils.PathJoin(file_storage_dir, inst.name,
                                           os.path.basename(disk.logical_id[1])))
+        self._UnlockedRecordChange("disks", disk.uuid)
 
     # Force update of ssconf files
     self._ConfigData().cluster.serial_no += 1
+    self._UnlockedRecordChange("cluster")
 
   def MarkInstanceDown(self, inst_uuid):
     """Mark the status of an instance to down in the configuration.
@@ -1816,21 +2108,12 @@ class ConfigWriter(object):
     """
     return self._UnlockedGetInstanceList()
 
+  @ConfigSync(shared=1)
   def ExpandInstanceName(self, short_name):
     """Attempt to expand an incomplete instance name.
 
     """
-    # Locking is done in L{ConfigWriter.GetAllInstancesInfo}
-    all_insts = self.GetAllInstancesInfo().values()
-    expanded_name = _MatchNameComponentIgnoreCase(
-                      short_name, [inst.name for inst in all_insts])
-
-    if expanded_name is not None:
-      # there has to be exactly one instance with that name
-      inst = (filter(lambda n: n.name == expanded_name, all_insts)[0])
-      return (inst.uuid, inst.name)
-    else:
-      return (None, None)
+    return self._UnlockedExpandName("instances", short_name)
 
   def _UnlockedGetInstanceInfo(self, inst_uuid):
     """Returns information about an instance.
@@ -1974,9 +2257,8 @@ class ConfigWriter(object):
     return self._UnlockedGetInstanceInfoByName(inst_name)
 
   def _UnlockedGetInstanceInfoByName(self, inst_name):
-    for inst in self._UnlockedGetAllInstancesInfo().values():
-      if inst.name == inst_name:
-        return inst
+    for inst in self._UnlockedGetObjectsByName("instances", inst_name):
+      return inst
     return None
 
   def _UnlockedGetInstanceName(self, inst_uuid):
@@ -2033,6 +2315,8 @@ class ConfigWriter(object):
 
     """
     self._UnlockedGetDiskInfo(disk_uuid).nodes = nodes
+    self._instance_index = None
+    self._UnlockedRecordChange("disks", disk_uuid)
 
   @ConfigSync()
   def SetDiskLogicalID(self, disk_uuid, logical_id):
@@ -2055,6 +2339,8 @@ class ConfigWriter(object):
                                    logical_id)
 
     disk.logical_id = logical_id
+    self._instance_index = None
+    self._UnlockedRecordChange("disks", disk_uuid)
 
   def _UnlockedGetInstanceNames(self, inst_uuids):
     return [self._UnlockedGetInstanceName(uuid) for uuid in inst_uuids]
@@ -2075,7 +2361,12 @@ class ConfigWriter(object):
     self._UnlockedAddNodeToGroup(node.uuid, node.group)
     assert node.uuid in self._ConfigData().nodegroups[node.group].members
     self._ConfigData().nodes[node.uuid] = node
+    index = self._name_indexes.get("nodes")
+    if index is not None:
+      index.Add(node.uuid, node.name)
     self._ConfigData().cluster.serial_no += 1
+    self._UnlockedRecordChange("nodes", node.uuid)
+    self._UnlockedRecordChange("cluster")
 
   @ConfigSync()
   def AddNode(self, node, ec_id):
@@ -2098,24 +2389,20 @@ class ConfigWriter(object):
       raise errors.ConfigurationError("Unknown node '%s'" % node_uuid)
 
     self._UnlockedRemoveNodeFromGroup(self._ConfigData().nodes[node_uuid])
-    del self._ConfigData().nodes[node_uuid]
+    node = self._ConfigData().nodes.pop(node_uuid)
+    index = self._name_indexes.get("nodes")
+    if index is not None:
+      index.Remove(node_uuid, node.name)
     self._ConfigData().cluster.serial_no += 1
+    self._UnlockedRecordChange("nodes", node_uuid)
+    self._UnlockedRecordChange("cluster")
 
+  @ConfigSync(shared=1)
   def ExpandNodeName(self, short_name):
     """Attempt to expand an incomplete node name into a node UUID.
 
     """
-    # Locking is done in L{ConfigWriter.GetAllNodesInfo}
-    all_nodes = self.GetAllNodesInfo().values()
-    expanded_name = _MatchNameComponentIgnoreCase(
-                      short_name, [node.name for node in all_nodes])
-
-    if expanded_name is not None:
-      # there has to be exactly one node with that name
-      node = (filter(lambda n: n.name == expanded_name, all_nodes)[0])
-      return (node.uuid, node.name)
-    else:
-      return (None, None)
+    return self._UnlockedExpandName("nodes", short_name)
 
   def _UnlockedGetNodeInfo(self, node_uuid):
     """Get the configuration of a node, as stored in the config.
@@ -2158,14 +2445,9 @@ class ConfigWriter(object):
     @return: a tuple with two lists: the primary and the secondary instances
 
     """
-    pri = []
-    sec = []
-    for inst in self._ConfigData().instances.values():
-      if inst.primary_node == node_uuid:
-        pri.append(inst.uuid)
-      if node_uuid in self._UnlockedGetInstanceSecondaryNodes(inst.uuid):
-        sec.append(inst.uuid)
-    return (pri, sec)
+    index = self._UnlockedGetInstanceIndex()
+    return (list(index.GetPrimaryInstances(node_uuid)),
+            list(index.GetSecondaryInstances(node_uuid)))
 
   @ConfigSync(shared=1)
   def GetNodeGroupInstances(self, uuid, primary_only=False):
@@ -2177,15 +2459,16 @@ class ConfigWriter(object):
     @return: List of instance UUIDs in node group
 
     """
-    if primary_only:
-      nodes_fn = lambda inst: [inst.primary_node]
-    else:
-      nodes_fn = lambda inst: self._UnlockedGetInstanceNodes(inst.uuid)
+    index = self._UnlockedGetInstanceIndex()
+    result = set()
+
+    for node in self._ConfigData().nodes.values():
+      if node.group == uuid:
+        result.update(index.GetPrimaryInstances(node.uuid))
+        if not primary_only:
+          result.update(index.GetSecondaryInstances(node.uuid))
 
-    return frozenset(inst.uuid
-                     for inst in self._ConfigData().instances.values()
-                     for node_uuid in nodes_fn(inst)
-                     if self._UnlockedGetNodeInfo(node_uuid).group == uuid)
+    return frozenset(result)
 
   def _UnlockedGetHvparamsString(self, hvname):
     """Return the string representation of the list of hyervisor parameters of
@@ -2307,9 +2590,8 @@ class ConfigWriter(object):
     return self._UnlockedGetAllNodesInfo()
 
   def _UnlockedGetNodeInfoByName(self, node_name):
-    for node in self._UnlockedGetAllNodesInfo().values():
-      if node.name == node_name:
-        return node
+    for node in self._UnlockedGetObjectsByName("nodes", node_name):
+      return node
     return None
 
   @ConfigSync(shared=1)
@@ -2470,6 +2752,7 @@ class ConfigWriter(object):
         node.master_candidate = True
         node.serial_no += 1
         mc_now += 1
+        self._UnlockedRecordChange("nodes", node.uuid)
       if mc_now != mc_max:
         # this should not happen
         logging.warning("Warning: MaintainCandidatePool didn't manage to"
@@ -2477,6 +2760,8 @@ class ConfigWriter(object):
       if mod_list:
         self._ConfigData().cluster.serial_no += 1
 
+    self._UnlockedRecordChange("cluster")
+
     return mod_list
 
   def _UnlockedAddNodeToGroup(self, node_uuid, nodegroup_uuid):
@@ -2575,8 +2860,14 @@ class ConfigWriter(object):
       obj.serial_no += 1
       obj.mtime = now
 
+    for (node, old_group, new_group) in resmod:
+      self._UnlockedRecordChange("nodes", node.uuid)
+      self._UnlockedRecordChange("nodegroups", old_group.uuid)
+      self._UnlockedRecordChange("nodegroups", new_group.uuid)
+
     # Force ssconf update
     self._ConfigData().cluster.serial_no += 1
+    self._UnlockedRecordChange("cluster")
 
   def _BumpSerialNo(self):
     """Bump up the serial number of the config.
@@ -2625,6 +2916,9 @@ class ConfigWriter(object):
                                         " configuration lock while holding"
                                         " shared")
       elif not force or self._lock_forced or not shared or self._offline:
+        if not shared:
+          # a nested section, which has to record its own changes
+          self._config_sections += 1
         return # we already have the lock, do nothing
     else:
       self._lock_current_shared = shared
@@ -2635,7 +2929,8 @@ class ConfigWriter(object):
     if self._offline:
       try:
         raw_data = utils.ReadFile(self._cfg_file)
-        data_dict = serializer.Load(raw_data)
+        data_dict = serializer.Load(raw_data,
+                                    private_paths=wc.CONFIG_PRIVATE_PATHS)
         # Make sure the configuration has the right version
         ValidateConfig(data_dict)
         data = objects.ConfigData.FromDict(data_dict)
@@ -2671,30 +2966,52 @@ class ConfigWriter(object):
       self._UpgradeConfig(saveafter=True)
     else:
       if shared and not force:
-        if self._config_data is None:
+        if self._config_data is None or self._config_outdated:
           logging.debug("Requesting config, as I have no up-to-date copy")
           dict_data = self._wconfd.ReadConfig()
         else:
           logging.debug("My config copy is up to date.")
           dict_data = None
       else:
+        # if our copy is unmodified, WConfd only needs to send the
+        # configuration if it has changed since
+        if self._config_unmodified:
+          serial = self._ConfigData().serial_no
+        else:
+          serial = None
         # poll until we acquire the lock
         while True:
-          dict_data = \
-              self._wconfd.LockConfig(self._GetWConfdContext(), bool(shared))
+          if serial is None:
+            dict_data = \
+                self._wconfd.LockConfig(self._GetWConfdContext(), bool(shared))
+            locked = dict_data is not None
+          else:
+            (locked, dict_data) = \
+                self._wconfd.LockConfigIfChanged(self._GetWConfdContext(),
+                                                 bool(shared), serial)
           logging.debug("Received config from WConfd.LockConfig [shared=%s]",
                         bool(shared))
-          if dict_data is not None:
+          if locked:
             break
           time.sleep(random.random())
+        if dict_data is None:
+          logging.debug("Configuration unchanged since serial %s, keeping my"
+                        " copy", serial)
+          self._config_outdated = False
 
       try:
         if dict_data is not None:
           self._SetConfigData(objects.ConfigData.FromDict(dict_data))
-          self._UpgradeConfig()
+          self._config_upgraded = self._UpgradeConfig()
+          self._config_unmodified = True
       except Exception, err:
         raise errors.ConfigurationError(err)
 
+      if not shared:
+        # changes can only be sent as a delta if WConfd's copy of the
+        # configuration doesn't lack the upgrades
+        self._UnlockedStartConfigChanges(not self._config_upgraded)
+
   def _CloseConfig(self, save):
     """Release resources relating the config data.
 
@@ -2710,6 +3027,9 @@ class ConfigWriter(object):
         raise
     elif not self._offline and \
          not (self._lock_current_shared and not self._lock_forced):
+      if not self._lock_current_shared:
+        # the changes that were not written may have been made to our copy
+        self._config_unmodified = False
       logging.debug("Unlocking configuration without writing")
       self._wconfd.UnlockConfig(self._GetWConfdContext())
       self._lock_forced = False
@@ -2725,6 +3045,8 @@ class ConfigWriter(object):
     @warning: if 'saveafter' is 'True', this function will call
         L{_WriteConfig()} so it needs to be called only from a
         "safe" place.
+    @rtype: bool
+    @return: Whether the configuration was modified by the upgrade
 
     """
     # Keep a copy of the persistent part of _config_data to check for changes
@@ -2759,6 +3081,8 @@ class ConfigWriter(object):
       if self._offline:
         self._UnlockedVerifyConfigAndLog()
 
+    return modified
+
   def _WriteConfig(self, destination=None, releaselock=False):
     """Write the configuration data to persistent storage.
 
@@ -2788,21 +3112,40 @@ class ConfigWriter(object):
       finally:
         os.close(fd)
     else:
+      # Send only the changed objects if all changes have been recorded
+      delta = self._UnlockedGetConfigDelta()
+      self._config_changes = None
+      self._config_unmodified = False
       try:
         if releaselock:
-          res = self._wconfd.WriteConfigAndUnlock(self._GetWConfdContext(),
-                                                  self._ConfigData().ToDict())
+          if delta is None:
+            res = self._wconfd.WriteConfigAndUnlock(self._GetWConfdContext(),
+                                                    self._ConfigData().ToDict())
+          else:
+            res = self._wconfd.WriteConfigDeltaAndUnlock(
+                    self._GetWConfdContext(), delta[0], delta[1])
           if not res:
             logging.warning("WriteConfigAndUnlock indicates we already have"
                             " released the lock; assuming this was just a retry"
                             " and the initial call succeeded")
+        elif delta is None:
+          res = self._wconfd.WriteConfig(self._GetWConfdContext(),
+                                         self._ConfigData().ToDict())
         else:
-          self._wconfd.WriteConfig(self._GetWConfdContext(),
-                                   self._ConfigData().ToDict())
+          res = self._wconfd.WriteConfigDelta(self._GetWConfdContext(),
+                                              delta[0], delta[1])
       except errors.LockError:
         raise errors.ConfigurationError("The configuration file has been"
                                         " modified since the last write, cannot"
                                         " update")
+      self._config_upgraded = False
+      if res:
+        # WConfd now has exactly our copy, with the serial number and
+        # modification time it has set
+        (serial_no, mtime) = res
+        self._ConfigData().serial_no = serial_no
+        self._ConfigData().mtime = float(mtime)
+        self._config_unmodified = True
 
     self.write_count += 1
 
@@ -2963,6 +3306,7 @@ class ConfigWriter(object):
     """
     self._ConfigData().cluster.volume_group_name = vg_name
     self._ConfigData().cluster.serial_no += 1
+    self._UnlockedRecordChange("cluster")
 
   @ConfigSync(shared=1)
   def GetDRBDHelper(self):
@@ -2978,6 +3322,7 @@ class ConfigWriter(object):
     """
     self._ConfigData().cluster.drbd_usermode_helper = drbd_helper
     self._ConfigData().cluster.serial_no += 1
+    self._UnlockedRecordChange("cluster")
 
   @ConfigSync(shared=1)
   def GetMACPrefix(self):
@@ -3175,6 +3520,8 @@ class ConfigWriter(object):
     net.ctime = net.mtime = time.time()
     self._ConfigData().networks[net.uuid] = net
     self._ConfigData().cluster.serial_no += 1
+    self._UnlockedRecordChange("networks", net.uuid)
+    self._UnlockedRecordChange("cluster")
 
   def _UnlockedLookupNetwork(self, target):
     """Lookup a network's UUID.
@@ -3225,6 +3572,8 @@ class ConfigWriter(object):
 
     del self._ConfigData().networks[network_uuid]
     self._ConfigData().cluster.serial_no += 1
+    self._UnlockedRecordChange("networks", network_uuid)
+    self._UnlockedRecordChange("cluster")
 
   def _UnlockedGetGroupNetParams(self, net_uuid, node_uuid):
     """Get the netparams (mode, link) of a network.
@@ -3296,6 +3645,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.candidate_certs = certs
+    self._UnlockedRecordChange("cluster")
 
   @ConfigSync()
   def AddNodeToCandidateCerts(self, node_uuid, cert_digest,
@@ -3313,6 +3663,7 @@ class ConfigWriter(object):
 
     """
     cluster = self._ConfigData().cluster
+    self._UnlockedRecordChange("cluster")
     if node_uuid in cluster.candidate_certs:
       old_cert_digest = cluster.candidate_certs[node_uuid]
       if old_cert_digest == cert_digest:
@@ -3338,6 +3689,7 @@ class ConfigWriter(object):
 
     """
     cluster = self._ConfigData().cluster
+    self._UnlockedRecordChange("cluster")
     if node_uuid not in cluster.candidate_certs:
       if warn_fn is not None:
         warn_fn("Cannot remove certifcate for node %s, because it's not"
@@ -3379,9 +3731,10 @@ class ConfigWriter(object):
     @rtype: string
     @return: uuid of instance the disk is attached to.
     """
-    for inst_uuid, inst_info in self._UnlockedGetAllInstancesInfo().items():
-      if disk_uuid in inst_info.disks:
-        return inst_uuid
+    index = self._UnlockedGetInstanceIndex()
+    for inst_uuid in index.GetDiskInstances(disk_uuid):
+      return inst_uuid
+    return None
 
   def SetMaintdRoundDelay(self, delay):
     """Set the minimal time the maintenance daemon should wait between rounds"""
@@ -0,0 +1,309 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Indexes over configuration objects.
+
+"""
+
+from ganeti import utils
+
+
+def _GetNamePrefixes(name):
+  """Returns the prefixes under which a name can be expanded.
+
+  These are the upper-cased name itself and all its parts up to a dot, so that
+  the keys matched by L{utils.text.MatchNameComponent} map to the name.
+
+  @type name: string
+  @rtype: list of strings
+
+  """
+  upper_name = name.upper()
+  result = [upper_name]
+
+  pos = upper_name.find(".")
+  while pos != -1:
+    result.append(upper_name[:pos])
+    pos = upper_name.find(".", pos + 1)
+
+  return result
+
+
+class NameIndex(object):
+  """Index of configuration objects by name.
+
+  Maps object names to UUIDs, so that lookups by name don't have to iterate
+  over all objects. Names don't need to be unique. The index keeps a
+  reference to the indexed dictionary and its size, so that a changed
+  dictionary can be detected with L{IsCurrent}; renames must be reported
+  through L{Rename}.
+
+  """
+  def __init__(self, objs):
+    """Initializes this class.
+
+    @type objs: dict
+    @param objs: Configuration objects indexed by their UUID
+
+    """
+    self._objs = objs
+    self._count = len(objs)
+    self._uuids = {}
+    # Built on first use, see L{Expand}
+    self._prefixes = None
+
+    for (uuid, obj) in objs.iteritems():
+      self._uuids.setdefault(obj.name, []).append(uuid)
+
+  def IsCurrent(self, objs):
+    """Checks whether this index was built for a dictionary.
+
+    @type objs: dict
+    @param objs: Configuration objects indexed by their UUID
+    @rtype: bool
+
+    """
+    return objs is self._objs and len(objs) == self._count
+
+  def Lookup(self, name):
+    """Returns the UUIDs of all objects with the given name.
+
+    @type name: string
+    @rtype: list of strings
+
+    """
+    return self._uuids.get(name, [])
+
+  def Add(self, uuid, name):
+    """Adds an object to the index.
+
+    Must be called after the object was added to the indexed dictionary.
+
+    """
+    self._uuids.setdefault(name, []).append(uuid)
+    self._count += 1
+
+    if self._prefixes is not None and name is not None:
+      for prefix in _GetNamePrefixes(name):
+        self._prefixes.setdefault(prefix, set()).add(name)
+
+  def Remove(self, uuid, name):
+    """Removes an object from the index.
+
+    Must be called after the object was removed from the indexed dictionary.
+
+    """
+    uuids = self._uuids.get(name, [])
+    if uuid in uuids:
+      uuids.remove(uuid)
+    if not uuids:
+      self._uuids.pop(name, None)
+
+      if self._prefixes is not None and name is not None:
+        for prefix in _GetNamePrefixes(name):
+          names = self._prefixes.get(prefix)
+          if names is not None:
+            names.discard(name)
+            if not names:
+              del self._prefixes[prefix]
+
+    self._count -= 1
+
+  def Rename(self, uuid, old_name, new_name):
+    """Updates the index after an object has been renamed.
+
+    """
+    self.Remove(uuid, old_name)
+    self.Add(uuid, new_name)
+
+  def _GetPrefixes(self):
+    """Returns the mapping from name prefixes to names.
+
+    """
+    if self._prefixes is None:
+      self._prefixes = {}
+      for name in self._uuids:
+        if name is not None:
+          for prefix in _GetNamePrefixes(name):
+            self._prefixes.setdefault(prefix, set()).add(name)
+
+    return self._prefixes
+
+  def Expand(self, short_name):
+    """Expands a possibly incomplete name.
+
+    This is equivalent to calling L{utils.text.MatchNameComponent} with all
+    indexed names, ignoring case.
+
+    @type short_name: string
+    @param short_name: Name to expand
+    @rtype: string or None
+    @return: The full name, C{None} if there are no or multiple matches
+
+    """
+    if short_name in self._uuids:
+      return short_name
+
+    key = short_name.upper()
+    names = self._GetPrefixes().get(key, [])
+
+    exact = [name for name in names if name.upper() == key]
+    if len(exact) == 1:
+      return exact[0]
+
+    if len(names) == 1:
+      return list(names)[0]
+
+    return None
+
+
+def _GetInstanceSecondaryNodes(instance, disks):
+  """Computes the secondary nodes of an instance.
+
+  Disks missing from the configuration are ignored.
+
+  @type instance: L{objects.Instance}
+  @type disks: dict
+  @param disks: All disks of the configuration, indexed by their UUID
+  @rtype: set of strings
+
+  """
+  result = set()
+
+  for disk_uuid in instance.disks:
+    disk = disks.get(disk_uuid)
+    if disk is not None:
+      result.update(disk.all_nodes)
+
+  result.discard(instance.primary_node)
+
+  return result
+
+
+class InstanceIndex(object):
+  """Reverse index from nodes and disks to the instances using them.
+
+  Like L{NameIndex}, the index detects instances or disks having been added or
+  removed. Other changes must be reported by discarding the index.
+
+  """
+  def __init__(self, data):
+    """Initializes this class.
+
+    @type data: L{objects.ConfigData}
+    @param data: Configuration data
+
+    """
+    self._instances = data.instances
+    self._disks = data.disks
+    self._counts = (len(data.instances), len(data.disks))
+    self._primary = {}
+    self._secondary = {}
+    self._disk_owners = {}
+
+    for (inst_uuid, instance) in data.instances.iteritems():
+      self._primary.setdefault(instance.primary_node, set()).add(inst_uuid)
+
+      for node_uuid in _GetInstanceSecondaryNodes(instance, data.disks):
+        self._secondary.setdefault(node_uuid, set()).add(inst_uuid)
+
+      for disk_uuid in instance.disks:
+        self._disk_owners.setdefault(disk_uuid, set()).add(inst_uuid)
+
+  def IsCurrent(self, data):
+    """Checks whether this index was built for the given configuration data.
+
+    @type data: L{objects.ConfigData}
+    @rtype: bool
+
+    """
+    return (data.instances is self._instances and
+            data.disks is self._disks and
+            (len(data.instances), len(data.disks)) == self._counts)
+
+  def GetPrimaryInstances(self, node_uuid):
+    """Returns the UUIDs of the instances with the given primary node.
+
+    @rtype: frozenset
+
+    """
+    return frozenset(self._primary.get(node_uuid, []))
+
+  def GetSecondaryInstances(self, node_uuid):
+    """Returns the UUIDs of the instances with the given secondary node.
+
+    @rtype: frozenset
+
+    """
+    return frozenset(self._secondary.get(node_uuid, []))
+
+  def GetDiskInstances(self, disk_uuid):
+    """Returns the UUIDs of the instances the given disk is attached to.
+
+    @rtype: frozenset
+
+    """
+    return frozenset(self._disk_owners.get(disk_uuid, []))
+
+  def _Describe(self):
+    """Returns the contents of the index as comparable data.
+
+    """
+    return [self._primary, self._secondary, self._disk_owners]
+
+  def Verify(self, data):
+    """Verifies the index and the instance relations it describes.
+
+    The index is compared with one computed from the given configuration
+    data, which is also checked for disks attached to multiple instances.
+
+    @type data: L{objects.ConfigData}
+    @rtype: list of strings
+    @return: Error messages
+
+    """
+    # pylint: disable=W0212
+    result = []
+    current = InstanceIndex(data)
+
+    for (what, expected, actual) in zip(["primary", "secondary", "disk"],
+                                        current._Describe(),
+                                        self._Describe()):
+      for key in set(expected) | set(actual):
+        if expected.get(key, set()) != actual.get(key, set()):
+          result.append("Instance index for %s '%s' is out of date" %
+                        (what, key))
+
+    for (disk_uuid, owners) in current._disk_owners.items():
+      if len(owners) > 1:
+        result.append("Disk '%s' is attached to multiple instances: %s" %
+                      (disk_uuid, utils.CommaJoin(sorted(owners))))
+
+    return result
@@ -151,3 +151,70 @@ def VerifyIspecs(owner, parentkey, params, callback):
     fullkey = "/".join([parentkey, key])
     VerifyType(owner, fullkey, value, constants.ISPECS_PARAMETER_TYPES,
                callback)
+
+
+def GetObjectVersion(obj):
+  """Returns the version of a configuration object.
+
+  @rtype: tuple or None
+  @return: the serial number and modification time of the object, or C{None}
+      if the object doesn't have both
+
+  """
+  if obj.serial_no is None or obj.mtime is None:
+    return None
+  return (obj.serial_no, obj.mtime)
+
+
+class VerifyCache(object):
+  """Remembers the errors found by the checks of single objects.
+
+  The errors of an object are reused as long as the object, and all objects
+  its checks depend on, still have the same versions (see
+  L{GetObjectVersion}). Objects without a version are always checked.
+
+  """
+  def __init__(self):
+    self._results = {}
+
+  def Verify(self, kind, key, obj, deps, fn, incremental=True):
+    """Checks a configuration object.
+
+    @type kind: string
+    @param kind: kind of the object, e.g. "instances"
+    @type key: string
+    @param key: UUID under which the object is stored
+    @param obj: the object to check
+    @type deps: list
+    @param deps: objects the checks depend on
+    @type fn: callable
+    @param fn: function returning the list of errors for an object
+    @type incremental: bool
+    @param incremental: whether a previous result can be reused
+    @rtype: list of strings
+
+    """
+    version = [GetObjectVersion(o) for o in [obj] + deps]
+    if None in version:
+      self._results.pop((kind, key), None)
+      return fn(obj)
+
+    entry = self._results.get((kind, key))
+    if incremental and entry is not None and entry[0] == version:
+      return entry[1]
+
+    result = fn(obj)
+    self._results[(kind, key)] = (version, result)
+    return result
+
+  def Forget(self, kind, key):
+    """Forgets the result for an object changed without a new version.
+
+    """
+    self._results.pop((kind, key), None)
+
+  def Clear(self):
+    """Forgets all results.
+
+    """
+    self._results.clear()
@@ -37,9 +37,15 @@ import OpenSSL
 import select
 import socket
 import errno
+import zlib
 
 from cStringIO import StringIO
 
+try:
+  import lz4.frame as lz4frame # pylint: disable=F0401
+except ImportError:
+  lz4frame = None
+
 from ganeti import constants
 from ganeti import utils
 
@@ -73,10 +79,21 @@ HTTP_WWW_AUTHENTICATE = "WWW-Authenticate"
 HTTP_AUTHORIZATION = "Authorization"
 HTTP_AUTHENTICATION_INFO = "Authentication-Info"
 HTTP_ALLOW = "Allow"
+HTTP_ACCEPT_ENCODING = "Accept-Encoding"
+HTTP_CONTENT_ENCODING = "Content-Encoding"
+HTTP_TRANSFER_ENCODING = "Transfer-Encoding"
 
 HTTP_APP_OCTET_STREAM = "application/octet-stream"
 HTTP_APP_JSON = "application/json"
 
+# Content codings
+HTTP_ENCODING_IDENTITY = "identity"
+HTTP_ENCODING_DEFLATE = "deflate"
+HTTP_ENCODING_LZ4 = "x-lz4"
+
+#: Default compression level for L{HTTP_ENCODING_DEFLATE}
+DEFLATE_DEFAULT_LEVEL = 1
+
 _SSL_UNEXPECTED_EOF = "Unexpected EOF"
 
 # Socket operations
@@ -332,6 +349,117 @@ class HttpVersionNotSupported(HttpException):
   code = 505
 
 
+def GetSupportedEncodings():
+  """Returns the supported content codings in order of preference.
+
+  Faster codecs are only available if the necessary modules are installed.
+
+  @rtype: list of string
+
+  """
+  result = []
+
+  if lz4frame is not None:
+    result.append(HTTP_ENCODING_LZ4)
+
+  result.append(HTTP_ENCODING_DEFLATE)
+
+  return result
+
+
+def ChooseEncoding(accept_encoding):
+  """Chooses a content coding based on an C{Accept-Encoding} header.
+
+  Quality values are not evaluated except for disabling a coding using
+  C{q=0}. The server's order of preference is used.
+
+  @type accept_encoding: string or None
+  @param accept_encoding: Value of C{Accept-Encoding} header
+  @rtype: string or None
+  @return: Content coding or C{None} if no supported coding is acceptable
+
+  """
+  if not accept_encoding:
+    return None
+
+  accepted = set()
+
+  for item in accept_encoding.split(","):
+    parts = [i.strip() for i in item.split(";")]
+    if not parts[0]:
+      continue
+
+    quality = 1.0
+    for param in parts[1:]:
+      (name, _, value) = param.partition("=")
+      if name.strip().lower() == "q":
+        try:
+          quality = float(value)
+        except ValueError:
+          pass
+
+    if quality > 0:
+      accepted.add(parts[0].lower())
+
+  for encoding in GetSupportedEncodings():
+    if encoding in accepted:
+      return encoding
+
+  return None
+
+
+def EncodeBody(encoding, data, level=DEFLATE_DEFAULT_LEVEL):
+  """Encodes a message body using a content coding.
+
+  @type encoding: string
+  @param encoding: One of the values returned by L{GetSupportedEncodings}
+  @type data: string
+  @param data: Message body
+  @type level: int
+  @param level: Compression level, only used for L{HTTP_ENCODING_DEFLATE}
+  @rtype: string
+
+  """
+  if encoding == HTTP_ENCODING_DEFLATE:
+    return zlib.compress(data, level)
+
+  if encoding == HTTP_ENCODING_LZ4 and lz4frame is not None:
+    return lz4frame.compress(data)
+
+  raise HttpError("Unsupported content coding '%s'" % encoding)
+
+
+def DecodeBody(encoding, data):
+  """Decodes a message body encoded with L{EncodeBody}.
+
+  @type encoding: string or None
+  @param encoding: Value of C{Content-Encoding} header
+  @type data: string
+  @param data: Encoded message body
+  @rtype: string
+
+  """
+  if encoding is None:
+    return data
+
+  encoding = encoding.strip().lower()
+
+  if encoding in ("", HTTP_ENCODING_IDENTITY):
+    return data
+
+  try:
+    if encoding == HTTP_ENCODING_DEFLATE:
+      return zlib.decompress(data)
+
+    if encoding == HTTP_ENCODING_LZ4 and lz4frame is not None:
+      return lz4frame.decompress(data)
+  except Exception, err: # pylint: disable=W0703
+    raise HttpError("Can't decode body with content coding '%s': %s" %
+                    (encoding, err))
+
+  raise HttpError("Unsupported content coding '%s'" % encoding)
+
+
 def ParseHeaders(buf):
   """Parses HTTP headers.
 
@@ -384,8 +512,14 @@ def SocketOperation(sock, op, arg1, timeout):
   event_override = 0
 
   while True:
+    if (op == SOCKOP_RECV and not event_override and
+        isinstance(sock, OpenSSL.SSL.ConnectionType) and sock.pending()):
+      # OpenSSL has already decrypted data which can be read without waiting;
+      # the socket itself doesn't necessarily become readable again
+      pass
+
     # Poll only for certain operations and when asked for by an override
-    if event_override or op in (SOCKOP_SEND, SOCKOP_RECV, SOCKOP_HANDSHAKE):
+    elif event_override or op in (SOCKOP_SEND, SOCKOP_RECV, SOCKOP_HANDSHAKE):
       if event_override:
         wait_for_event = event_override
       else:
@@ -791,15 +925,20 @@ class HttpMessageReader(object):
   PS_BODY = "entity-body"
   PS_COMPLETE = "complete"
 
-  def __init__(self, sock, msg, read_timeout):
+  def __init__(self, sock, msg, read_timeout, buf=""):
     """Reads an HTTP message from a socket.
 
+    Data received after the end of the message, e.g. the next request on a
+    persistent connection, is stored in C{remaining_data}.
+
     @type sock: socket
     @param sock: Socket to be read from
     @type msg: http.HttpMessage
     @param msg: Object for the read message
     @type read_timeout: float
     @param read_timeout: Read timeout for socket
+    @type buf: string
+    @param buf: Data already received from the socket
 
     """
     self.sock = sock
@@ -811,12 +950,13 @@ class HttpMessageReader(object):
     self.parser_status = self.PS_START_LINE
     self.content_length = None
     self.peer_will_close = None
+    self.remaining_data = None
+
+    # The message might have been received completely already
+    buf = self._ContinueParsing(buf, False)
 
-    buf = ""
     eof = False
     while self.parser_status != self.PS_COMPLETE:
-      # TODO: Don't read more than necessary (Content-Length), otherwise
-      # data might be lost and/or an error could occur
       data = SocketOperation(sock, SOCKOP_RECV, SOCK_BUF_SIZE, read_timeout)
 
       if data:
@@ -838,7 +978,8 @@ class HttpMessageReader(object):
     buf = self._ContinueParsing(buf, True)
 
     assert self.parser_status == self.PS_COMPLETE
-    assert not buf, "Parser didn't read full response"
+
+    self.remaining_data = buf
 
     # Body is complete
     msg.body = self.body_buffer.getvalue()
@@ -888,17 +1029,23 @@ class HttpMessageReader(object):
 
         break
 
-    # TODO: Handle messages without headers
     if self.parser_status == self.PS_HEADERS:
-      # Wait for header end
-      idx = buf.find("\r\n\r\n")
-      if idx >= 0:
-        self.header_buffer.write(buf[:idx + 2])
+      # Wait for header end; in messages without headers the empty line
+      # directly follows the start line
+      if buf.startswith("\r\n"):
+        end = 0
+      else:
+        end = buf.find("\r\n\r\n")
+        if end >= 0:
+          end += 2
+
+      if end >= 0:
+        self.header_buffer.write(buf[:end])
 
         self._CheckHeaderLength(self.header_buffer.tell())
 
         # Remove headers, including CRLF
-        buf = buf[idx + 4:]
+        buf = buf[end + 2:]
 
         self._ParseHeaders()
 
@@ -910,8 +1057,14 @@ class HttpMessageReader(object):
 
     if self.parser_status == self.PS_BODY:
       # TODO: Implement max size for body_buffer
-      self.body_buffer.write(buf)
-      buf = ""
+      if self.content_length is None:
+        self.body_buffer.write(buf)
+        buf = ""
+      else:
+        # Don't consume data following the message body
+        missing = max(0, self.content_length - self.body_buffer.tell())
+        self.body_buffer.write(buf[:missing])
+        buf = buf[missing:]
 
       # Check whether we've read everything
       #
@@ -921,7 +1074,6 @@ class HttpMessageReader(object):
       # cannot be used to indicate the end of a request body, since that would
       # leave no possibility for the server to send back a response.)"
       #
-      # TODO: Error when buffer length > Content-Length header
       if (eof or
           self.content_length is None or
           (self.content_length is not None and
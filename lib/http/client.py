@@ -31,9 +31,11 @@
 
 """
 
+import itertools
 import logging
 import pycurl
 import threading
+import time
 from cStringIO import StringIO
 
 from ganeti import http
@@ -109,6 +111,13 @@ class HttpClientRequest(object):
     self.resp_status_code = None
     self.resp_body = None
 
+    # Content coding and size of the response body as received
+    self.resp_encoding = None
+    self.resp_size = None
+
+    # Seconds between starting and finishing the request
+    self.duration = None
+
   def __repr__(self):
     status = ["%s.%s" % (self.__class__.__module__, self.__class__.__name__),
               "%s:%s" % (self.host, self.port),
@@ -130,13 +139,16 @@ class HttpClientRequest(object):
     return "https://%s%s" % (address, self.path)
 
 
-def _StartRequest(curl, req):
+def _StartRequest(curl, req, reuse_sessions=False):
   """Starts a request on a cURL object.
 
   @type curl: pycurl.Curl
   @param curl: cURL object
   @type req: L{HttpClientRequest}
   @param req: HTTP request
+  @type reuse_sessions: bool
+  @param reuse_sessions: Whether to allow cURL to cache SSL session IDs; only
+    useful for handles which are used for more than one request
 
   """
   logging.debug("Starting request %r", req)
@@ -152,8 +164,9 @@ def _StartRequest(curl, req):
   assert isinstance(post_data, str)
   assert compat.all(isinstance(i, str) for i in headers)
 
-  # Buffer for response
+  # Buffers for response
   resp_buffer = StringIO()
+  resp_headers = []
 
   # Configure client for request
   curl.setopt(pycurl.VERBOSE, False)
@@ -170,21 +183,51 @@ def _StartRequest(curl, req):
   else:
     curl.setopt(pycurl.TIMEOUT, int(req.read_timeout))
 
-  # Disable SSL session ID caching (pycurl >= 7.16.0)
+  # SSL session ID caching is only enabled for pooled handles
+  # (pycurl >= 7.16.0)
   if hasattr(pycurl, "SSL_SESSIONID_CACHE"):
-    curl.setopt(pycurl.SSL_SESSIONID_CACHE, False)
+    curl.setopt(pycurl.SSL_SESSIONID_CACHE, reuse_sessions)
 
   curl.setopt(pycurl.WRITEFUNCTION, resp_buffer.write)
+  curl.setopt(pycurl.HEADERFUNCTION, resp_headers.append)
 
   # Pass cURL object to external config function
   if req.curl_config_fn:
     req.curl_config_fn(curl)
 
-  return _PendingRequest(curl, req, resp_buffer.getvalue)
+  return _PendingRequest(curl, req, resp_buffer.getvalue,
+                         resp_headers=resp_headers)
+
+
+def _GetContentEncoding(header_lines):
+  """Extracts the content coding from response header lines.
+
+  @type header_lines: list of string
+  @param header_lines: Header lines as received by cURL, including the status
+    line
+  @rtype: string or None
+
+  """
+  encoding = None
+
+  for line in header_lines:
+    if line.startswith("HTTP/"):
+      # Status line of another response (e.g. after "100 Continue")
+      encoding = None
+      continue
+
+    (name, sep, value) = line.partition(":")
+    if sep and name.strip().lower() == http.HTTP_CONTENT_ENCODING.lower():
+      encoding = value.strip()
+
+  if encoding and encoding.lower() != http.HTTP_ENCODING_IDENTITY:
+    return encoding
+
+  return None
 
 
 class _PendingRequest(object):
-  def __init__(self, curl, req, resp_buffer_read):
+  def __init__(self, curl, req, resp_buffer_read, resp_headers=None):
     """Initializes this class.
 
     @type curl: pycurl.Curl
@@ -193,13 +236,20 @@ class _PendingRequest(object):
     @param req: HTTP request
     @type resp_buffer_read: callable
     @param resp_buffer_read: Function to read response body
+    @type resp_headers: list of string
+    @param resp_headers: Response header lines
 
     """
     assert req.success is None
 
+    if resp_headers is None:
+      resp_headers = []
+
     self._curl = curl
     self._req = req
     self._resp_buffer_read = resp_buffer_read
+    self._resp_headers = resp_headers
+    self._start_time = time.time()
 
   def GetCurlHandle(self):
     """Returns the cURL object.
@@ -227,12 +277,26 @@ class _PendingRequest(object):
 
     logging.debug("Request %s finished, errmsg=%s", req, errmsg)
 
-    req.success = not bool(errmsg)
-    req.error = errmsg
-
     # Get HTTP response code
     req.resp_status_code = curl.getinfo(pycurl.RESPONSE_CODE)
-    req.resp_body = self._resp_buffer_read()
+
+    resp_body = self._resp_buffer_read()
+    req.resp_size = len(resp_body)
+    req.resp_encoding = _GetContentEncoding(self._resp_headers)
+
+    if req.resp_encoding is None:
+      req.resp_body = resp_body
+    else:
+      try:
+        req.resp_body = http.DecodeBody(req.resp_encoding, resp_body)
+      except http.HttpError, err:
+        req.resp_body = resp_body
+        if not errmsg:
+          errmsg = str(err)
+
+    req.success = not bool(errmsg)
+    req.error = errmsg
+    req.duration = time.time() - self._start_time
 
     # Ensure no potentially large variables are referenced
     curl.setopt(pycurl.POSTFIELDS, "")
@@ -242,6 +306,186 @@ class _PendingRequest(object):
       req.completion_cb(req)
 
 
+def _GetPoolKey(req):
+  """Returns the key used to pool cURL handles for a request.
+
+  @type req: L{HttpClientRequest}
+
+  """
+  return (req.host, req.port)
+
+
+class CurlHandlePool(object):
+  """Pool of reusable cURL handles.
+
+  Handles are kept per remote endpoint (host and port). Reusing them allows
+  cURL to keep connections alive and to resume SSL sessions instead of doing
+  a full handshake for every request. Handles which have been idle for longer
+  than the configured timeout are closed.
+
+  The pool is flushed whenever the identity passed to L{CheckIdentity}
+  changes, e.g. after certificates have been replaced.
+
+  """
+  def __init__(self, idle_timeout, max_idle_per_key=2, max_idle=None,
+               _curl=pycurl.Curl, _time_fn=time.time):
+    """Initializes this class.
+
+    @type idle_timeout: number
+    @param idle_timeout: Seconds after which unused handles are closed
+    @type max_idle_per_key: int
+    @param max_idle_per_key: How many unused handles to keep per endpoint
+    @type max_idle: int or None
+    @param max_idle: How many unused handles to keep in total, C{None} for no
+      limit; as idle handles keep their connection open, this bounds the
+      number of file descriptors used by the pool
+
+    """
+    assert idle_timeout > 0
+    assert max_idle_per_key > 0
+    assert max_idle is None or max_idle > 0
+
+    self._idle_timeout = idle_timeout
+    self._max_idle_per_key = max_idle_per_key
+    self._max_idle = max_idle
+    self._curl = _curl
+    self._time_fn = _time_fn
+
+    # The lock monitor can run in another thread
+    self._lock = threading.Lock()
+    self._identity = None
+
+    # Maps (host, port) to a list of (last use, cURL handle)
+    self._idle = {}
+    self._num_idle = 0
+
+  def __len__(self):
+    """Returns the number of idle handles.
+
+    """
+    self._lock.acquire()
+    try:
+      assert self._num_idle == sum(len(i) for i in self._idle.values())
+      return self._num_idle
+    finally:
+      self._lock.release()
+
+  def _CloseAllUnlocked(self):
+    """Closes all idle handles.
+
+    """
+    for handles in self._idle.values():
+      for (_, curl) in handles:
+        curl.close()
+
+    self._idle.clear()
+    self._num_idle = 0
+
+  def _ExpireUnlocked(self, now):
+    """Closes handles which have been idle for too long.
+
+    """
+    for (key, handles) in self._idle.items():
+      keep = []
+
+      for (last_use, curl) in handles:
+        if now - last_use > self._idle_timeout:
+          curl.close()
+          self._num_idle -= 1
+        else:
+          keep.append((last_use, curl))
+
+      if keep:
+        self._idle[key] = keep
+      else:
+        del self._idle[key]
+
+  def CheckIdentity(self, identity):
+    """Flushes the pool if the identity of the handles changed.
+
+    @param identity: Any comparable value describing the configuration of
+      pooled handles, such as the identity of certificate files
+
+    """
+    self._lock.acquire()
+    try:
+      if identity != self._identity:
+        if self._idle:
+          logging.debug("Identity changed, closing idle cURL handles for %s"
+                        " endpoint(s)", len(self._idle))
+        self._CloseAllUnlocked()
+        self._identity = identity
+    finally:
+      self._lock.release()
+
+  def Acquire(self, key):
+    """Returns a handle for the given endpoint.
+
+    An idle handle is returned if available, otherwise a new one is created.
+
+    @type key: tuple
+    @param key: Endpoint as (host, port)
+
+    """
+    self._lock.acquire()
+    try:
+      self._ExpireUnlocked(self._time_fn())
+
+      handles = self._idle.get(key)
+      if handles:
+        (_, curl) = handles.pop()
+        if not handles:
+          del self._idle[key]
+        self._num_idle -= 1
+        return curl
+    finally:
+      self._lock.release()
+
+    return self._curl()
+
+  def Release(self, key, curl, reusable=True):
+    """Returns a handle to the pool.
+
+    @type key: tuple
+    @param key: Endpoint as (host, port)
+    @type curl: pycurl.Curl
+    @param curl: cURL object previously returned by L{Acquire}
+    @type reusable: bool
+    @param reusable: Whether the handle can be used again; handles of failed
+      requests should not be reused
+
+    """
+    if not reusable:
+      curl.close()
+      return
+
+    self._lock.acquire()
+    try:
+      handles = self._idle.setdefault(key, [])
+      if (len(handles) < self._max_idle_per_key and
+          (self._max_idle is None or self._num_idle < self._max_idle)):
+        handles.append((self._time_fn(), curl))
+        self._num_idle += 1
+        curl = None
+      elif not handles:
+        del self._idle[key]
+    finally:
+      self._lock.release()
+
+    if curl is not None:
+      curl.close()
+
+  def Flush(self):
+    """Closes all idle handles.
+
+    """
+    self._lock.acquire()
+    try:
+      self._CloseAllUnlocked()
+    finally:
+      self._lock.release()
+
+
 class _NoOpRequestMonitor(object): # pylint: disable=W0232
   """No-op request monitor.
 
@@ -304,23 +548,48 @@ class _PendingRequestMonitor(object):
     return result
 
 
-def _ProcessCurlRequests(multi, requests):
+def _ProcessCurlRequests(multi, requests, max_active=None):
   """cURL request processor.
 
   This generator yields a tuple once for every completed request, successful or
   not. The first value in the tuple is the handle, the second an error message
   or C{None} for successful requests.
 
+  If the number of concurrently active requests is limited, further handles
+  are only taken from C{requests} whenever a request has completed. Since the
+  timeout of a request only starts once it has been added, waiting for a free
+  slot does not count towards it.
+
   @type multi: C{pycurl.CurlMulti}
   @param multi: cURL multi object
-  @type requests: sequence
+  @type requests: iterable
   @param requests: cURL request handles
+  @type max_active: int or None
+  @param max_active: Maximum number of requests in progress at the same time,
+    C{None} for no limit
 
   """
-  for curl in requests:
-    multi.add_handle(curl)
+  assert max_active is None or max_active > 0
+
+  pending = iter(requests)
+  exhausted = False
+  num_active = 0
 
   while True:
+    if not exhausted:
+      if max_active is None:
+        new_handles = list(pending)
+        exhausted = True
+      else:
+        count = max_active - num_active
+        new_handles = list(itertools.islice(pending, count))
+        exhausted = (len(new_handles) < count)
+
+      for curl in new_handles:
+        multi.add_handle(curl)
+
+      num_active += len(new_handles)
+
     (ret, active) = multi.perform()
     assert ret in (pycurl.E_MULTI_OK, pycurl.E_CALL_MULTI_PERFORM)
 
@@ -333,26 +602,33 @@ def _ProcessCurlRequests(multi, requests):
 
       for curl in successful:
         multi.remove_handle(curl)
+        num_active -= 1
         yield (curl, None)
 
       for curl, errnum, errmsg in failed:
         multi.remove_handle(curl)
+        num_active -= 1
         yield (curl, "Error %s: %s" % (errnum, errmsg))
 
       if remaining_messages == 0:
         break
 
-    if active == 0:
+    if active == 0 and exhausted:
       # No active handles anymore
       break
 
+    if not exhausted and num_active < max_active:
+      # Start more requests right away instead of waiting for I/O
+      continue
+
     # Wait for I/O. The I/O timeout shouldn't be too long so that HTTP
     # timeouts, which are only evaluated in multi.perform, aren't
     # unnecessarily delayed.
     multi.select(1.0)
 
 
-def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
+def ProcessRequests(requests, lock_monitor_cb=None, curl_pool=None,
+                    max_active=None, _curl=pycurl.Curl,
                     _curl_multi=pycurl.CurlMulti,
                     _curl_process=_ProcessCurlRequests):
   """Processes any number of HTTP client requests.
@@ -360,6 +636,13 @@ def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
   @type requests: list of L{HttpClientRequest}
   @param requests: List of all requests
   @param lock_monitor_cb: Callable for registering with lock monitor
+  @type curl_pool: L{CurlHandlePool} or None
+  @param curl_pool: Pool from which cURL handles are taken and to which they
+    are returned afterwards; if C{None}, a new handle is used per request
+  @type max_active: int or None
+  @param max_active: Maximum number of requests in progress at the same time,
+    C{None} for no limit; requests are only prepared once they can be started,
+    so handles released to the pool by completed requests can be reused
 
   """
   assert compat.all((req.error is None and
@@ -368,12 +651,13 @@ def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
                      req.resp_body is None)
                     for req in requests)
 
-  # Prepare all requests
-  curl_to_client = \
-    dict((client.GetCurlHandle(), client)
-         for client in map(lambda req: _StartRequest(_curl(), req), requests))
+  if curl_pool is None:
+    start_fn = lambda req: _StartRequest(_curl(), req)
+  else:
+    start_fn = lambda req: _StartRequest(curl_pool.Acquire(_GetPoolKey(req)),
+                                         req, reuse_sessions=True)
 
-  assert len(curl_to_client) == len(requests)
+  curl_to_client = {}
 
   if lock_monitor_cb:
     monitor = _PendingRequestMonitor(threading.currentThread(),
@@ -382,14 +666,39 @@ def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
   else:
     monitor = _NoOpRequestMonitor
 
+  def _StartRequests():
+    for req in requests:
+      client = start_fn(req)
+      curl = client.GetCurlHandle()
+
+      monitor.acquire(shared=0)
+      try:
+        curl_to_client[curl] = client
+      finally:
+        monitor.release()
+
+      yield curl
+
+  if max_active is None:
+    # Prepare all requests
+    handles = list(_StartRequests())
+    assert len(curl_to_client) == len(requests)
+  else:
+    handles = _StartRequests()
+
   # Process all requests and act based on the returned values
-  for (curl, msg) in _curl_process(_curl_multi(), curl_to_client.keys()):
+  for (curl, msg) in _curl_process(_curl_multi(), handles, max_active):
     monitor.acquire(shared=0)
     try:
-      curl_to_client.pop(curl).Done(msg)
+      client = curl_to_client.pop(curl)
+      client.Done(msg)
     finally:
       monitor.release()
 
+    if curl_pool is not None:
+      curl_pool.Release(_GetPoolKey(client.GetCurrentRequest()), curl,
+                        reusable=not msg)
+
   assert not curl_to_client, "Not all requests were processed"
 
   # Don't try to read information anymore as all requests have been processed
@@ -33,8 +33,10 @@
 
 import BaseHTTPServer
 import cgi
+import errno
 import logging
 import os
+import select
 import socket
 import time
 import signal
@@ -68,6 +70,22 @@ DEFAULT_ERROR_MESSAGE = """\
 </html>
 """
 
+#: Status messages sent by pre-forked worker processes to the parent process:
+#: handling a request, waiting for a connection or waiting for the next
+#: request on a persistent connection
+_WORKER_BUSY = "B"
+_WORKER_IDLE = "I"
+_WORKER_WAITING = "W"
+
+#: Interval in seconds for checking whether requests take too long
+_TIMEOUT_CHECK_INTERVAL = 5.0
+
+#: Seconds to wait for workers to exit when stopping before killing them
+_WORKER_STOP_TIMEOUT = 10.0
+
+#: Interval in seconds for checking whether workers have exited
+_WORKER_STOP_INTERVAL = 0.1
+
 
 def _DateTimeHeader(gmnow=None):
   """Return the current date and time formatted for a message header.
@@ -131,6 +149,18 @@ class _HttpServerToClientMessageWriter(http.HttpMessageWriter):
     self._response_msg = response_msg
     http.HttpMessageWriter.__init__(self, sock, response_msg, write_timeout)
 
+  def _PrepareMessage(self):
+    """Prepares the HTTP response by setting mandatory headers.
+
+    """
+    http.HttpMessageWriter._PrepareMessage(self)
+
+    # On a persistent connection the client can't wait for the connection to
+    # be closed to find the end of an empty body
+    if self._response_msg.start_line.code not in (http.HTTP_NO_CONTENT,
+                                                  http.HTTP_NOT_MODIFIED):
+      self._response_msg.headers.setdefault(http.HTTP_CONTENT_LENGTH, 0)
+
   def HasMessageBody(self):
     """Logic to detect whether response should contain a message body.
 
@@ -224,6 +254,22 @@ class _HttpClientToServerMessageReader(http.HttpMessageReader):
 
     return http.HttpClientToServerStartLine(method, path, version)
 
+  def _ParseHeaders(self):
+    """Parses the headers sent by client.
+
+    RFC2616, section 4.4: A request without a Content-Length or
+    Transfer-Encoding header doesn't have a message body. Unlike for responses,
+    the client doesn't need to close the connection to mark its end.
+
+    """
+    http.HttpMessageReader._ParseHeaders(self)
+
+    if (self.content_length is None and
+        http.HTTP_CONTENT_LENGTH not in self.msg.headers and
+        http.HTTP_TRANSFER_ENCODING not in self.msg.headers):
+      self.content_length = 0
+      self.peer_will_close = self._WillPeerCloseConnection()
+
 
 def _HandleServerRequestInner(handler, req_msg):
   """Calls the handler function for the current request.
@@ -363,7 +409,7 @@ class HttpResponder(object):
       msg.headers = {}
 
     msg.headers.update({
-      # TODO: Keep-alive is not supported
+      # Request executors may keep the connection open
       http.HTTP_CONNECTION: "close",
       http.HTTP_DATE: _DateTimeHeader(),
       http.HTTP_SERVER: http.HTTP_GANETI_VERSION,
@@ -387,8 +433,9 @@ class HttpServerRequestExecutor(object):
 
   This class implements the server side of HTTP. It's based on code of
   Python's BaseHTTPServer, from both version 2.4 and 3k. It does not
-  support non-ASCII character encodings. Keep-alive connections are
-  not supported.
+  support non-ASCII character encodings. If enabled and unless the client
+  asks for the connection to be closed, multiple requests, including
+  pipelined ones, are handled on the same connection.
 
   """
   # Timeouts in seconds for socket layer
@@ -396,9 +443,27 @@ class HttpServerRequestExecutor(object):
   READ_TIMEOUT = 10
   CLOSE_TIMEOUT = 1
 
-  def __init__(self, server, handler, sock, client_addr):
+  #: Seconds to wait for the next request on a persistent connection; much
+  #: shorter than the time clients keep idle connections, as a process is
+  #: tied to the connection meanwhile
+  KEEP_ALIVE_TIMEOUT = 5
+
+  #: Maximum number of requests handled on one connection, 1 to disable
+  #: persistent connections
+  KEEP_ALIVE_MAX_REQUESTS = 100
+
+  def __init__(self, server, handler, sock, client_addr, keep_alive=False,
+               status_fn=None):
     """Initializes this class.
 
+    @type keep_alive: bool
+    @param keep_alive: Whether to keep the connection open for further
+      requests
+    @type status_fn: callable or None
+    @param status_fn: Called with C{True} whenever a request is started and
+      with C{False} when waiting for the next request on a persistent
+      connection
+
     """
     responder = HttpResponder(handler)
 
@@ -424,16 +489,47 @@ class HttpServerRequestExecutor(object):
             # Ignore rest
             return
 
-        (request_msg, request_msg_reader, force_close, response_msg) = \
-          responder(compat.partial(self._ReadRequest, sock, self.READ_TIMEOUT))
-        if response_msg:
-          # HttpMessage.start_line can be of different types
-          # Instance of 'HttpClientToServerStartLine' has no 'code' member
-          # pylint: disable=E1103,E1101
-          logging.info("%s:%s %s %s", client_addr[0], client_addr[1],
-                       request_msg.start_line, response_msg.start_line.code)
-          self._SendResponse(sock, request_msg, response_msg,
-                             self.WRITE_TIMEOUT)
+        data = ""
+        handled = 0
+
+        while True:
+          if status_fn:
+            status_fn(True)
+
+          (request_msg, request_msg_reader, force_close, response_msg) = \
+            responder(compat.partial(self._ReadRequest, sock,
+                                     self.READ_TIMEOUT, data))
+          handled += 1
+
+          keep_alive = (keep_alive and
+                        not (force_close or
+                             request_msg_reader.peer_will_close) and
+                        handled < self.KEEP_ALIVE_MAX_REQUESTS)
+
+          if response_msg:
+            if keep_alive:
+              self._SetKeepAliveHeaders(response_msg,
+                                        self.KEEP_ALIVE_MAX_REQUESTS - handled)
+
+            # HttpMessage.start_line can be of different types
+            # Instance of 'HttpClientToServerStartLine' has no 'code' member
+            # pylint: disable=E1103,E1101
+            logging.info("%s:%s %s %s", client_addr[0], client_addr[1],
+                         request_msg.start_line, response_msg.start_line.code)
+            self._SendResponse(sock, request_msg, response_msg,
+                               self.WRITE_TIMEOUT)
+
+          if not keep_alive:
+            break
+
+          # Pipelined requests may have been received already
+          data = request_msg_reader.remaining_data
+          if not data:
+            if status_fn:
+              status_fn(False)
+            data = self._WaitForRequest(sock, self.KEEP_ALIVE_TIMEOUT)
+            if not data:
+              break
       finally:
         http.ShutdownConnection(sock, self.CLOSE_TIMEOUT, self.WRITE_TIMEOUT,
                                 request_msg_reader, force_close)
@@ -442,15 +538,47 @@ class HttpServerRequestExecutor(object):
     finally:
       logging.debug("Disconnected %s:%s", client_addr[0], client_addr[1])
 
+  def _SetKeepAliveHeaders(self, msg, remaining):
+    """Announces that the connection is kept open after a response.
+
+    @type msg: http.HttpMessage
+    @param msg: Response message
+    @type remaining: int
+    @param remaining: Number of requests still accepted on the connection
+
+    """
+    msg.headers[http.HTTP_CONNECTION] = "keep-alive"
+    msg.headers[http.HTTP_KEEP_ALIVE] = \
+      "timeout=%d, max=%d" % (self.KEEP_ALIVE_TIMEOUT, remaining)
+
+  @staticmethod
+  def _WaitForRequest(sock, timeout):
+    """Waits for the next request on a persistent connection.
+
+    @rtype: string
+    @return: Received data, an empty string if the connection was closed or
+      no data was received within the timeout
+
+    """
+    try:
+      return http.SocketOperation(sock, http.SOCKOP_RECV, http.SOCK_BUF_SIZE,
+                                  timeout)
+    except http.HttpSocketTimeout:
+      logging.debug("Idle persistent connection timed out")
+    except socket.error, err:
+      logging.debug("Error while waiting for request: %s", err)
+
+    return ""
+
   @staticmethod
-  def _ReadRequest(sock, timeout):
+  def _ReadRequest(sock, timeout, data):
     """Reads a request sent by client.
 
     """
     msg = http.HttpMessage()
 
     try:
-      reader = _HttpClientToServerMessageReader(sock, msg, timeout)
+      reader = _HttpClientToServerMessageReader(sock, msg, timeout, buf=data)
     except http.HttpSocketTimeout:
       raise http.HttpError("Timeout while reading request")
     except socket.error, err:
@@ -471,15 +599,224 @@ class HttpServerRequestExecutor(object):
       raise http.HttpError("Error sending response: %s" % err)
 
 
+class _WorkerStatusReader(asyncore.file_dispatcher):
+  """Reads status messages sent by a pre-forked worker process.
+
+  """
+  def __init__(self, fd, status_fn):
+    """Initializes this class.
+
+    @type fd: int
+    @param fd: Reading end of the worker's status pipe; the dispatcher uses a
+      duplicate of it
+    @type status_fn: callable
+    @param status_fn: Called with the status reported by the worker, one of
+      C{_WORKER_BUSY}, C{_WORKER_IDLE} and C{_WORKER_WAITING}
+
+    """
+    asyncore.file_dispatcher.__init__(self, fd)
+    self._status_fn = status_fn
+
+  def writable(self):
+    return False
+
+  def handle_read(self):
+    data = self.recv(4096)
+    if data:
+      # Only the most recent status is relevant
+      self._status_fn(data[-1])
+
+  def handle_close(self):
+    self.close()
+
+
+class _WorkerPool(object):
+  """Keeps track of pre-forked worker processes.
+
+  """
+  def __init__(self, size, spawn_fn, _kill_fn=os.kill, _time_fn=time.time,
+               _waitpid_fn=os.waitpid, _sleep_fn=time.sleep):
+    """Initializes this class.
+
+    @type size: int
+    @param size: Number of worker processes
+    @type spawn_fn: callable
+    @param spawn_fn: Function starting a new worker, returning its process ID
+      and the dispatcher reading its status messages
+
+    """
+    assert size > 0
+
+    self._size = size
+    self._spawn_fn = spawn_fn
+    self._kill_fn = _kill_fn
+    self._time_fn = _time_fn
+    self._waitpid_fn = _waitpid_fn
+    self._sleep_fn = _sleep_fn
+
+    # Maps process IDs to [status reader, status, start time of current
+    # request]
+    self._workers = {}
+
+  def __len__(self):
+    return len(self._workers)
+
+  def __contains__(self, pid):
+    return pid in self._workers
+
+  def GetPids(self):
+    """Returns the process IDs of all workers.
+
+    """
+    return self._workers.keys()
+
+  def Fill(self):
+    """Starts new workers until the configured number is running.
+
+    """
+    while len(self._workers) < self._size:
+      (pid, reader) = self._spawn_fn(self.SetStatus)
+      self._workers[pid] = [reader, _WORKER_IDLE, None]
+
+  def SetStatus(self, pid, status):
+    """Updates the status of a worker.
+
+    Only requests count towards the request timeout, not waiting for the
+    next request on a persistent connection.
+
+    """
+    info = self._workers.get(pid)
+    if info is not None:
+      info[1] = status
+      if status == _WORKER_BUSY:
+        info[2] = self._time_fn()
+      else:
+        info[2] = None
+
+  def HasIdle(self):
+    """Returns whether any worker is waiting for a connection.
+
+    """
+    return compat.any(status == _WORKER_IDLE
+                      for (_, status, _) in self._workers.values())
+
+  def Remove(self, pid):
+    """Removes a worker which has terminated.
+
+    """
+    info = self._workers.pop(pid, None)
+    if info is not None:
+      info[0].close()
+
+  def Signal(self, signum):
+    """Sends a signal to all workers.
+
+    """
+    for pid in self._workers.keys():
+      try:
+        self._kill_fn(pid, signum)
+      except EnvironmentError, err:
+        if err.errno != errno.ESRCH:
+          raise
+
+  def KillStuck(self, timeout):
+    """Kills workers whose current request is taking too long.
+
+    @type timeout: number
+    @param timeout: Maximum duration of a request in seconds
+    @rtype: list
+    @return: Process IDs of killed workers
+
+    """
+    now = self._time_fn()
+    killed = []
+
+    for (pid, (_, _, started)) in self._workers.items():
+      if started is not None and now - started > timeout:
+        logging.warning("Request handled by worker %s took longer than %s"
+                        " seconds, killing it", pid, timeout)
+        try:
+          self._kill_fn(pid, signal.SIGKILL)
+        except EnvironmentError, err:
+          if err.errno != errno.ESRCH:
+            raise
+        killed.append(pid)
+
+    return killed
+
+  def _Reap(self, options):
+    """Removes all workers which have terminated.
+
+    @param options: Options for C{os.waitpid}
+
+    """
+    for pid in self._workers.keys():
+      try:
+        (result, _) = utils.RetryOnSignal(self._waitpid_fn, pid, options)
+      except EnvironmentError, err:
+        if err.errno != errno.ECHILD:
+          raise
+        # Already reaped elsewhere
+        result = pid
+
+      if result:
+        self.Remove(pid)
+
+  def Terminate(self, timeout):
+    """Stops all workers and waits for them to exit.
+
+    Workers are asked to exit after finishing their current request. Those
+    still running after C{timeout} seconds are killed.
+
+    @type timeout: number
+    @param timeout: Seconds to wait for workers to exit
+    @rtype: list
+    @return: Process IDs of killed workers
+
+    """
+    self.Signal(signal.SIGTERM)
+
+    deadline = self._time_fn() + timeout
+
+    while True:
+      self._Reap(os.WNOHANG)
+      if not self._workers:
+        return []
+      if self._time_fn() >= deadline:
+        break
+      self._sleep_fn(_WORKER_STOP_INTERVAL)
+
+    killed = self._workers.keys()
+
+    logging.warning("Workers %s did not exit within %s seconds, killing them",
+                    utils.CommaJoin(killed), timeout)
+
+    self.Signal(signal.SIGKILL)
+    self._Reap(0)
+
+    return killed
+
+
 class HttpServer(http.HttpBase, asyncore.dispatcher):
   """Generic HTTP server class
 
+  By default a new process is forked for every connection. If a number of
+  workers is given, connections are handled by that many pre-forked processes
+  instead, each handling one connection after the other. Connections are
+  queued by the kernel until a worker is available. Only while all workers are
+  busy, the parent process accepts connections and forks for them as before.
+  Only workers keep connections open for further requests.
+
   """
   MAX_CHILDREN = 20
 
+  #: Maximum number of requests handled by a worker before it's replaced
+  MAX_WORKER_REQUESTS = 1000
+
   def __init__(self, mainloop, local_address, port, handler,
                ssl_params=None, ssl_verify_peer=False,
-               request_executor_class=None, ssl_verify_callback=None):
+               request_executor_class=None, ssl_verify_callback=None,
+               workers=0, request_timeout=None):
     """Initializes the HTTP server
 
     @type mainloop: ganeti.daemon.Mainloop
@@ -496,6 +833,12 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     @type request_executor_class: class
     @param request_executor_class: a class derived from the
         HttpServerRequestExecutor class
+    @type workers: int
+    @param workers: Number of pre-forked worker processes, 0 to fork for
+        every connection
+    @type request_timeout: number or None
+    @param request_timeout: Seconds after which processes handling a request
+        are killed, C{None} for no limit
 
     """
     http.HttpBase.__init__(self)
@@ -517,7 +860,21 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     # Allow port to be reused
     self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-    self._children = []
+    assert workers >= 0
+    assert request_timeout is None or request_timeout > 0
+
+    # Maps process IDs of children handling a single connection to the time
+    # they were started
+    self._children = {}
+
+    if workers:
+      self._workers = _WorkerPool(workers, self._SpawnWorker)
+    else:
+      self._workers = None
+
+    self._request_timeout = request_timeout
+    self._stopping = False
+
     self.set_socket(self.socket)
     self.accepting = True
     mainloop.RegisterSignal(self)
@@ -526,9 +883,41 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     self.socket.bind((self.local_address, self.port))
     self.socket.listen(1024)
 
+    if self._workers is not None:
+      # Workers and the parent process might try to accept the same connection
+      self.socket.setblocking(0)
+      self._workers.Fill()
+
+    if self._request_timeout is not None:
+      self._ScheduleTimeoutCheck()
+
   def Stop(self):
+    self._stopping = True
+
     self.socket.close()
 
+    if self._workers is not None:
+      # Workers exit after finishing their current request; stuck ones are
+      # killed
+      self._workers.Terminate(_WORKER_STOP_TIMEOUT)
+
+  def RecycleWorkers(self):
+    """Replaces all workers by new processes.
+
+    Workers are forked from the parent process and don't see changes made to
+    its state afterwards. This must therefore be called after such changes,
+    e.g. after reloading a file. Workers exit after finishing their current
+    request and are replaced as soon as they have terminated.
+
+    """
+    if self._workers is not None:
+      self._workers.Signal(signal.SIGTERM)
+
+  def readable(self):
+    # With pre-forked workers, the parent process only accepts connections if
+    # all workers are busy
+    return (self._workers is None or not self._workers.HasIdle())
+
   def handle_accept(self):
     self._IncomingConnection()
 
@@ -536,6 +925,37 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     if signum == signal.SIGCHLD:
       self._CollectChildren(True)
 
+  def _ScheduleTimeoutCheck(self):
+    """Schedules the next check for requests taking too long.
+
+    """
+    self.mainloop.scheduler.enter(_TIMEOUT_CHECK_INTERVAL, 0,
+                                  self._CheckTimeouts, [])
+
+  def _CheckTimeouts(self):
+    """Kills processes whose current request is taking too long.
+
+    """
+    if self._stopping:
+      return
+
+    if self._workers is not None:
+      self._workers.KillStuck(self._request_timeout)
+
+    now = time.time()
+
+    for (pid, started) in self._children.items():
+      if now - started > self._request_timeout:
+        logging.warning("Request handled by child %s took longer than %s"
+                        " seconds, killing it", pid, self._request_timeout)
+        try:
+          os.kill(pid, signal.SIGKILL)
+        except EnvironmentError, err:
+          if err.errno != errno.ESRCH:
+            raise
+
+    self._ScheduleTimeoutCheck()
+
   def _CollectChildren(self, quick):
     """Checks whether any child processes are done
 
@@ -554,23 +974,185 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
           pid, _ = os.waitpid(0, 0)
         except os.error:
           pid = None
-        if pid and pid in self._children:
-          self._children.remove(pid)
+        if pid:
+          self._RemoveChild(pid)
+
+    pids = self._children.keys()
+    if self._workers is not None:
+      pids.extend(self._workers.GetPids())
 
-    for child in self._children:
+    for child in pids:
       try:
         pid, _ = os.waitpid(child, os.WNOHANG)
       except os.error:
         pid = None
-      if pid and pid in self._children:
-        self._children.remove(pid)
+      if pid:
+        self._RemoveChild(pid)
+
+    if self._workers is not None and not self._stopping:
+      # Replace workers which have terminated
+      self._workers.Fill()
+
+  def _RemoveChild(self, pid):
+    """Forgets about a child process which has terminated.
+
+    """
+    self._children.pop(pid, None)
+
+    if self._workers is not None and pid in self._workers:
+      logging.debug("Worker %s has terminated", pid)
+      self._workers.Remove(pid)
+
+  def _HandleConnection(self, connection, client_addr, **kwargs):
+    """Handles a connection in a child or worker process.
+
+    Additional keyword arguments are passed to the request executor.
+
+    @rtype: bool
+    @return: Whether the connection was handled without an error
+
+    """
+    try:
+      self.request_executor(self, self.handler, connection, client_addr,
+                            **kwargs)
+    except Exception: # pylint: disable=W0703
+      logging.exception("Error while handling request from %s:%s",
+                        client_addr[0], client_addr[1])
+      return False
+
+    return True
+
+  def _PreExit(self):
+    """Lets the handler finish up before a child or worker process exits.
+
+    """
+    try:
+      self.handler.PreExit()
+    except Exception: # pylint: disable=W0703
+      logging.exception("Error while finishing up process")
+
+  def _SpawnWorker(self, status_fn):
+    """Starts a new pre-forked worker process.
+
+    @type status_fn: callable
+    @param status_fn: Called with the process ID and the status whenever the
+      worker reports a change
+    @return: Process ID and status reader of the new worker
+
+    """
+    (read_fd, write_fd) = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+      # Worker process
+      # pylint: disable=W0212
+      try:
+        os.close(read_fd)
+        utils.SetCloseOnExecFlag(write_fd, True)
+        self._RunWorker(write_fd)
+      except Exception: # pylint: disable=W0703
+        logging.exception("Error in worker process")
+        self._PreExit()
+        os._exit(1)
+      self._PreExit()
+      os._exit(0)
+
+    os.close(write_fd)
+
+    try:
+      reader = _WorkerStatusReader(read_fd, compat.partial(status_fn, pid))
+    finally:
+      # The dispatcher uses its own duplicate of the file descriptor
+      os.close(read_fd)
+
+    logging.debug("Started worker %s", pid)
+
+    return (pid, reader)
+
+  def _RunWorker(self, status_fd):
+    """Main loop of a pre-forked worker process.
+
+    @type status_fd: int
+    @param status_fd: File descriptor for reporting the worker's status
+
+    """
+    stop = [False]
+
+    def _Stop(*_):
+      if not stop[0]:
+        stop[0] = True
+        # Stop accepting connections right away, so that they're left to the
+        # other workers or a restarted daemon
+        try:
+          self.socket.close()
+        except socket.error:
+          pass
+
+    # Finish the current request when asked to terminate; system calls are
+    # restarted instead of failing
+    signal.signal(signal.SIGTERM, _Stop)
+    signal.siginterrupt(signal.SIGTERM, False)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    # In case the handler code uses temporary files
+    utils.ResetTempfileModule()
+
+    poller = select.poll()
+    poller.register(self.socket.fileno(), select.POLLIN)
+
+    def _ReportStatus(active):
+      if active:
+        status = _WORKER_BUSY
+      else:
+        status = _WORKER_WAITING
+      utils.RetryOnSignal(os.write, status_fd, status)
+
+    handled = 0
+
+    while not stop[0] and handled < self.MAX_WORKER_REQUESTS:
+      # Wake up regularly to check whether the worker should stop
+      try:
+        if not poller.poll(1000) or stop[0]:
+          continue
+      except select.error, err:
+        if err.args[0] == errno.EINTR:
+          continue
+        raise
+
+      try:
+        (connection, client_addr) = self.socket.accept()
+      except socket.error, err:
+        if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+          # Another process was faster
+          continue
+        if stop[0]:
+          # The listening socket was closed
+          break
+        raise
+
+      # Only workers keep connections open, a process forked for a single
+      # connection would be tied up while waiting for further requests
+      utils.RetryOnSignal(os.write, status_fd, _WORKER_BUSY)
+      try:
+        self._HandleConnection(connection, client_addr, keep_alive=True,
+                               status_fn=_ReportStatus)
+      finally:
+        handled += 1
+        utils.RetryOnSignal(os.write, status_fd, _WORKER_IDLE)
 
   def _IncomingConnection(self):
     """Called for each incoming connection
 
     """
     # pylint: disable=W0212
-    (connection, client_addr) = self.socket.accept()
+    try:
+      (connection, client_addr) = self.socket.accept()
+    except socket.error, err:
+      if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+        # A worker has accepted the connection
+        return
+      raise
 
     self._CollectChildren(False)
 
@@ -591,14 +1173,18 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
         # In case the handler code uses temporary files
         utils.ResetTempfileModule()
 
-        self.request_executor(self, self.handler, connection, client_addr)
+        if not self._HandleConnection(connection, client_addr):
+          self._PreExit()
+          os._exit(1)
       except Exception: # pylint: disable=W0703
         logging.exception("Error while handling request from %s:%s",
                           client_addr[0], client_addr[1])
+        self._PreExit()
         os._exit(1)
+      self._PreExit()
       os._exit(0)
     else:
-      self._children.append(pid)
+      self._children[pid] = time.time()
 
 
 class HttpServerHandler(object):
@@ -615,6 +1201,14 @@ class HttpServerHandler(object):
 
     """
 
+  def PreExit(self):
+    """Called in a child or worker process before it exits.
+
+    Can be overridden by a subclass, e.g. to save data collected while
+    handling requests.
+
+    """
+
   def HandleRequest(self, req):
     """Handles a request.
 
@@ -32,23 +32,24 @@
 
 """
 
+import sys
+
 from ganeti import constants
 from ganeti import errors
 
-from ganeti.hypervisor import hv_fake
-from ganeti.hypervisor import hv_xen
-from ganeti.hypervisor import hv_kvm
-from ganeti.hypervisor import hv_chroot
-from ganeti.hypervisor import hv_lxc
+# hv_base is available as hypervisor.hv_base to the users of this package
+from ganeti.hypervisor import hv_base # pylint: disable=W0611
 
 
+#: The modules and names of the hypervisor classes; a module is only
+#: imported once one of its hypervisors is needed
 _HYPERVISOR_MAP = {
-  constants.HT_XEN_PVM: hv_xen.XenPvmHypervisor,
-  constants.HT_XEN_HVM: hv_xen.XenHvmHypervisor,
-  constants.HT_FAKE: hv_fake.FakeHypervisor,
-  constants.HT_KVM: hv_kvm.KVMHypervisor,
-  constants.HT_CHROOT: hv_chroot.ChrootManager,
-  constants.HT_LXC: hv_lxc.LXCHypervisor,
+  constants.HT_XEN_PVM: ("ganeti.hypervisor.hv_xen", "XenPvmHypervisor"),
+  constants.HT_XEN_HVM: ("ganeti.hypervisor.hv_xen", "XenHvmHypervisor"),
+  constants.HT_FAKE: ("ganeti.hypervisor.hv_fake", "FakeHypervisor"),
+  constants.HT_KVM: ("ganeti.hypervisor.hv_kvm", "KVMHypervisor"),
+  constants.HT_CHROOT: ("ganeti.hypervisor.hv_chroot", "ChrootManager"),
+  constants.HT_LXC: ("ganeti.hypervisor.hv_lxc", "LXCHypervisor"),
   }
 
 
@@ -65,7 +66,9 @@ def GetHypervisorClass(ht_kind):
   if ht_kind not in _HYPERVISOR_MAP:
     raise errors.HypervisorError("Unknown hypervisor type '%s'" % ht_kind)
 
-  cls = _HYPERVISOR_MAP[ht_kind]
+  (module_name, class_name) = _HYPERVISOR_MAP[ht_kind]
+  __import__(module_name)
+  cls = getattr(sys.modules[module_name], class_name)
   return cls
 
 
@@ -53,6 +53,7 @@ except ImportError:
   fdsend = None
 
 from ganeti import utils
+from ganeti import compat
 from ganeti import constants
 from ganeti import errors
 from ganeti import serializer
@@ -60,6 +61,7 @@ from ganeti import objects
 from ganeti import uidpool
 from ganeti import ssconf
 from ganeti import netutils
+from ganeti import nodecache
 from ganeti import pathutils
 from ganeti.hypervisor import hv_base
 from ganeti.utils import wrapper as utils_wrapper
@@ -72,6 +74,10 @@ from ganeti.hypervisor.hv_kvm.netdev import OpenTap
 _KVM_NETWORK_SCRIPT = pathutils.CONF_DIR + "/kvm-vif-bridge"
 _KVM_START_PAUSED_FLAG = "-S"
 
+#: Seconds for which the output of informational KVM invocations is cached;
+#: replacing the KVM binary invalidates it earlier
+_KVM_OUTPUT_CACHE_TTL = 3600
+
 #: SPICE parameters which depend on L{constants.HV_KVM_SPICE_BIND}
 _SPICE_ADDITIONAL_PARAMS = frozenset([
   constants.HV_KVM_SPICE_IP_VERSION,
@@ -2001,6 +2007,24 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     """
     assert option in cls._KVMOPTS_CMDS, "Invalid output option"
 
+    try:
+      file_id = utils.GetFileID(path=kvm_path)
+    except EnvironmentError:
+      # Let running the command report the error
+      return cls._RunKVMOutput(kvm_path, option)
+
+    return nodecache.Get(nodecache.CN_HYPERVISOR,
+                         (kvm_path, option, file_id),
+                         compat.partial(cls._RunKVMOutput, kvm_path, option),
+                         _KVM_OUTPUT_CACHE_TTL)
+
+  @classmethod
+  def _RunKVMOutput(cls, kvm_path, option):
+    """Runs kvm and returns its output.
+
+    @see: L{_GetKVMOutput}
+
+    """
     optlist, can_fail = cls._KVMOPTS_CMDS[option]
 
     result = utils.RunCmd([kvm_path] + optlist)
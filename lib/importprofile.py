@@ -0,0 +1,177 @@
+#
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Profiling of module imports.
+
+Python 2 has no equivalent of C{python -X importtime}. If the environment
+variable L{ENV_VAR} is set to the name of a file, importing the C{ganeti}
+package installs L{ImportProfiler} as the built-in C{__import__} function.
+When the process exits, the time spent for each import is appended to that
+file, in the format used by C{-X importtime}: the time spent in the import
+itself and the time including nested imports, both in microseconds, followed
+by the imported name, indented by the nesting level. Only imports actually
+loading modules are listed.
+
+This module is imported very early and must therefore only depend on the
+standard library.
+
+"""
+
+import __builtin__
+import atexit
+import os
+import sys
+import threading
+import time
+
+
+#: The environment variable naming the file to write the report to
+ENV_VAR = "GANETI_IMPORT_PROFILE"
+
+
+def _FormatName(name, fromlist):
+  """Formats the name of an import for the report.
+
+  """
+  if fromlist and "*" not in fromlist:
+    return "%s.{%s}" % (name, ",".join(fromlist))
+  return name
+
+
+class ImportProfiler(object):
+  """Replacement for C{__import__} measuring the time spent for imports.
+
+  """
+  def __init__(self, import_fn):
+    """Initializes this class.
+
+    @param import_fn: the original C{__import__} function
+
+    """
+    self._import_fn = import_fn
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self._start = time.time()
+    self.records = []
+
+  def __call__(self, name, globals=None, locals=None, fromlist=None,
+               level=-1):
+    # pylint: disable=W0622
+    stack = getattr(self._local, "stack", None)
+    if stack is None:
+      stack = self._local.stack = []
+
+    module_count = len(sys.modules)
+    start = time.time()
+    # Time spent in nested imports
+    stack.append(0.0)
+    try:
+      return self._import_fn(name, globals, locals, fromlist, level)
+    finally:
+      cumulative = time.time() - start
+      nested = stack.pop()
+      if stack:
+        stack[-1] += cumulative
+      if len(sys.modules) != module_count:
+        self._lock.acquire()
+        try:
+          self.records.append((cumulative - nested, cumulative, len(stack),
+                               _FormatName(name, fromlist)))
+        finally:
+          self._lock.release()
+
+  def FormatReport(self):
+    """Formats the recorded imports.
+
+    @rtype: string
+
+    """
+    self._lock.acquire()
+    try:
+      records = self.records[:]
+    finally:
+      self._lock.release()
+
+    lines = [
+      "# pid %s, %s" % (os.getpid(), " ".join(sys.argv)),
+      "import time: self [us] | cumulative | imported package",
+      ]
+    lines.extend("import time: %9d | %10d | %s%s" %
+                 (int(self_time * 1e6), int(cumulative * 1e6),
+                  "  " * depth, name)
+                 for (self_time, cumulative, depth, name) in records)
+    total = sum(cumulative for (_, cumulative, depth, _) in records
+                if depth == 0)
+    lines.append("# %d imports, %d us in total, %.3f s since start" %
+                 (len(records), int(total * 1e6), time.time() - self._start))
+    return "\n".join(lines) + "\n"
+
+  def WriteReport(self, filename):
+    """Appends the report to a file.
+
+    Errors are ignored, as this is called when the process exits.
+
+    @type filename: string
+    @param filename: the file to append the report to
+
+    """
+    try:
+      fd = open(filename, "a")
+      try:
+        fd.write(self.FormatReport())
+      finally:
+        fd.close()
+    except EnvironmentError:
+      pass
+
+
+def Install(filename):
+  """Installs an import profiler writing its report at exit.
+
+  @type filename: string
+  @param filename: the file to append the report to
+  @rtype: L{ImportProfiler}
+
+  """
+  profiler = __builtin__.__import__
+  if not isinstance(profiler, ImportProfiler):
+    profiler = ImportProfiler(profiler)
+    __builtin__.__import__ = profiler
+    atexit.register(profiler.WriteReport, filename)
+  return profiler
+
+
+def InstallFromEnvironment():
+  """Installs an import profiler if requested by L{ENV_VAR}.
+
+  """
+  filename = os.environ.get(ENV_VAR)
+  if filename:
+    Install(filename)
@@ -67,12 +67,22 @@ from ganeti import query
 from ganeti import qlang
 from ganeti import pathutils
 from ganeti import vcluster
-from ganeti.cmdlib import cluster
+from ganeti import cmdlib
 
 
 #: Retrieves "id" attribute
 _GetIdAttr = operator.attrgetter("id")
 
+#: Parts of a serialized job which can contain private parameters; the opcode
+#: logs, timestamps and other bookkeeping fields never do
+_JOB_PRIVATE_PATHS = [
+  ("ops", serializer.PATH_ANY, "input"),
+  ("ops", serializer.PATH_ANY, "result"),
+  ]
+
+#: Kind of the journal records holding a log entry of an opcode
+_JOURNAL_LOG = "log"
+
 
 class CancelJob(Exception):
   """Special exception to cancel a job.
@@ -90,6 +100,43 @@ def TimeStampNow():
   return utils.SplitTime(time.time())
 
 
+def _ParseJobFile(raw_data):
+  """Parses the contents of a job file.
+
+  A job file holds the serialized job, followed by the journal records, one
+  per line, appended since the job was last written in full (see
+  L{JobQueue.AppendJobLogUnlocked}). The records are replayed on the
+  serialized job; a last record that isn't valid JSON, as left by an
+  interrupted append, is ignored.
+
+  @type raw_data: string
+  @param raw_data: the contents of the job file
+  @rtype: dict
+  @return: the serialized job, as accepted by L{_QueuedJob.Restore}
+
+  """
+  lines = [line for line in raw_data.splitlines() if line.strip()]
+  data = serializer.LoadJson(lines[0], private_paths=_JOB_PRIVATE_PATHS)
+
+  for (idx, line) in enumerate(lines[1:], 1):
+    try:
+      record = serializer.LoadJson(line)
+    except ValueError:
+      if idx == len(lines) - 1:
+        logging.debug("Ignoring incomplete journal record %r", line)
+        break
+      raise
+
+    (kind, op_index, entry) = record
+
+    if kind != _JOURNAL_LOG:
+      raise errors.JobFileCorrupted("Unknown journal record kind '%s'" % kind)
+
+    data["ops"][op_index]["log"].append(entry)
+
+  return data
+
+
 def _CallJqUpdate(runner, names, file_name, content):
   """Updates job queue file after virtualizing filename.
 
@@ -98,6 +145,15 @@ def _CallJqUpdate(runner, names, file_name, content):
   return runner.call_jobqueue_update(names, virt_file_name, content)
 
 
+def _CallJqUpdateMany(runner, names, files):
+  """Updates several job queue files after virtualizing filenames.
+
+  """
+  virt_files = [(vcluster.MakeVirtualPath(file_name), content)
+                for (file_name, content) in files]
+  return runner.call_jobqueue_update_many(names, virt_files)
+
+
 class _QueuedOpCode(object):
   """Encapsulates an opcode object.
 
@@ -261,6 +317,10 @@ class _QueuedJob(object):
     obj.writable = writable
     obj.ops_iter = None
     obj.cur_opctx = None
+    # Size of the job data last written in full and of the journal records
+    # appended since, see L{JobQueue.AppendJobLogUnlocked}
+    obj.written_size = None
+    obj.journal_size = 0
 
   def __repr__(self):
     status = ["%s.%s" % (self.__class__.__module__, self.__class__.__name__),
@@ -604,8 +664,9 @@ class _OpExecCallbacks(mcpu.OpExecCbBase):
 
     """
     self._job.log_serial += 1
-    self._op.log.append((self._job.log_serial, timestamp, log_type, log_msg))
-    self._queue.UpdateJobUnlocked(self._job, replicate=False)
+    entry = (self._job.log_serial, timestamp, log_type, log_msg)
+    self._op.log.append(entry)
+    self._queue.AppendJobLogUnlocked(self._job, self._op, entry)
 
   def Feedback(self, *args):
     """Append a log entry.
@@ -1230,23 +1291,195 @@ class JobQueue(object):
     self.context = context
     self._memcache = weakref.WeakValueDictionary()
     self._my_hostname = netutils.Hostname.GetSysName()
+    self._cfg = cfg
 
     # Get initial list of nodes
+    self.UpdateNodes()
+
+    # Replication call whose remaining requests may still be in progress
+    self._replication = None
+
+    # Changes of job queue files not yet replicated, by file name, and the
+    # order in which the files were first changed
+    self._pending_files = {}
+    self._pending_order = []
+
+    # Protects the replication state above, as pending changes are also
+    # replicated from the background thread of the previous call
+    self._replication_lock = threading.Lock()
+
+    # Job dependencies
+    self.depmgr = _JobDependencyManager(self._GetJobStatusForDependencies)
+
+  def UpdateNodes(self):
+    """Reads the master candidates to replicate changes to.
+
+    """
     self._nodes = dict((n.name, n.primary_ip)
-                       for n in cfg.GetAllNodesInfo().values()
+                       for n in self._cfg.GetAllNodesInfo().values()
                        if n.master_candidate)
 
     # Remove master node
     self._nodes.pop(self._my_hostname, None)
 
-    # Job dependencies
-    self.depmgr = _JobDependencyManager(self._GetJobStatusForDependencies)
-
-  def _GetRpc(self, address_list):
+  def _GetRpc(self, address_list, quorum=None):
     """Gets RPC runner with context.
 
     """
-    return rpc.JobQueueRunner(self.context, address_list)
+    return rpc.JobQueueRunner(self.context, address_list, quorum=quorum)
+
+  @staticmethod
+  def _GetReplicationQuorum(num_nodes):
+    """Returns how many other nodes must have acknowledged a change.
+
+    Together with the master node, this is a majority of all master
+    candidates.
+
+    @type num_nodes: int
+    @param num_nodes: Number of master candidates other than the master node
+
+    """
+    return (num_nodes + 1) / 2
+
+  def _WaitForPreviousReplication(self):
+    """Waits for the previous replication call to finish on all nodes.
+
+    The replication lock must not be held by the caller. On return, the
+    lock is held and no replication call is in progress.
+
+    """
+    while True:
+      self._replication_lock.acquire()
+      replication = self._replication
+      if replication is None or replication.Wait(timeout=0):
+        return
+      self._replication_lock.release()
+
+      # The call can start another one from its background thread
+      replication.Wait()
+
+  def _StartReplication(self, failmsg, files=None):
+    """Prepares a replication call returning once a majority has answered.
+
+    The remaining nodes are updated in the background. To keep the order of
+    changes on every node, the previous replication call must have finished
+    on all nodes. Once this call has finished as well, the changes made in
+    the meantime are replicated.
+
+    Must be called with the replication lock held.
+
+    @type failmsg: str
+    @param failmsg: the identifier to be used for logging
+    @type files: list of (str, str) or None
+    @param files: the files sent by a batched update, for replicating them
+        separately to nodes not supporting batched updates
+    @rtype: L{rpc.RpcQuorum}
+
+    """
+    nodes = self._nodes.keys()
+    quorum = rpc.RpcQuorum(self._GetReplicationQuorum(len(nodes)),
+                           done_cb=compat.partial(self._ReplicationDone,
+                                                  nodes=nodes,
+                                                  failmsg=failmsg,
+                                                  files=files))
+    self._replication = quorum
+
+    return quorum
+
+  def _ReplicationDone(self, result, nodes, failmsg, files):
+    """Called once a replication call has finished on all nodes.
+
+    Runs in the background thread of the call.
+
+    """
+    self._CheckRpcResult(result, nodes, failmsg)
+
+    if files:
+      self._ReplicateFilesSeparately(result, files)
+
+    self._replication_lock.acquire()
+    try:
+      if not self._pending_order:
+        return
+      # The only call in progress is this one, which has finished on all
+      # nodes, so the pending changes can be replicated right away
+      self._replication = None
+    finally:
+      self._replication_lock.release()
+
+    self._FlushReplication()
+
+  def _ReplicateFilesSeparately(self, result, files):
+    """Replicates files one by one to the nodes failing a batched update.
+
+    Nodes running an older version don't support batched updates.
+
+    @param result: the results of the batched update
+    @type files: list of (str, str)
+    @param files: the files sent by the batched update
+
+    """
+    names = [name for (name, node_result) in result.items()
+             if (node_result.fail_msg and not node_result.offline and
+                 name in self._nodes)]
+    if not names:
+      return
+
+    logging.info("Replicating %s separately to %s",
+                 utils.CommaJoin(file_name for (file_name, _) in files),
+                 utils.CommaJoin(names))
+    addrs = [self._nodes[name] for name in names]
+    for (file_name, data) in files:
+      update_result = _CallJqUpdate(self._GetRpc(addrs), names, file_name,
+                                    data)
+      self._CheckRpcResult(update_result, names, "Updating %s" % file_name)
+
+  def _FlushReplication(self):
+    """Replicates all pending changes of job queue files.
+
+    Several changed files are sent in a single call. Returns once a
+    majority of the nodes has acknowledged the changes.
+
+    """
+    self._WaitForPreviousReplication()
+    try:
+      if not self._pending_order:
+        return
+
+      files = [(file_name, self._pending_files[file_name])
+               for file_name in self._pending_order]
+      self._pending_files = {}
+      self._pending_order = []
+
+      names, addrs = self._GetNodeIp()
+
+      if len(files) == 1:
+        ((file_name, data), ) = files
+        quorum = self._StartReplication("Updating %s" % file_name)
+        _CallJqUpdate(self._GetRpc(addrs, quorum=quorum), names, file_name,
+                      data)
+      else:
+        file_names = [file_name for (file_name, _) in files]
+        quorum = self._StartReplication("Updating %s" %
+                                        utils.CommaJoin(file_names),
+                                        files=files)
+        _CallJqUpdateMany(self._GetRpc(addrs, quorum=quorum), names, files)
+    finally:
+      self._replication_lock.release()
+
+  def WaitForReplication(self):
+    """Waits for all changes to be replicated to all nodes.
+
+    Must be called before the process exits.
+
+    """
+    self._FlushReplication()
+
+    self._WaitForPreviousReplication()
+    try:
+      self._replication = None
+    finally:
+      self._replication_lock.release()
 
   @staticmethod
   def _CheckRpcResult(result, nodes, failmsg):
@@ -1293,7 +1526,7 @@ class JobQueue(object):
     addr_list = [self._nodes[name] for name in name_list]
     return name_list, addr_list
 
-  def _UpdateJobQueueFile(self, file_name, data, replicate):
+  def _UpdateJobQueueFile(self, file_name, data, replicate, flush=True):
     """Writes a file locally and then replicates it to all nodes.
 
     This function will replace the contents of a file on the local
@@ -1305,6 +1538,9 @@ class JobQueue(object):
     @param data: the new contents of the file
     @type replicate: boolean
     @param replicate: whether to spread the changes to the remote nodes
+    @type flush: boolean
+    @param flush: whether the change must have been replicated to a
+        majority of the nodes when this function returns
 
     """
     getents = runtime.GetEnts()
@@ -1313,9 +1549,38 @@ class JobQueue(object):
                     mode=constants.JOB_QUEUE_FILES_PERMS)
 
     if replicate:
-      names, addrs = self._GetNodeIp()
-      result = _CallJqUpdate(self._GetRpc(addrs), names, file_name, data)
-      self._CheckRpcResult(result, self._nodes, "Updating %s" % file_name)
+      self._ReplicateFile(file_name, data, flush)
+
+  def _ReplicateFile(self, file_name, data, flush):
+    """Replicates the new contents of a file to all nodes.
+
+    While the previous replication call is still in progress on some nodes,
+    the change is only replicated once that call has finished, or with the
+    next flushed change. This way, several changes of the same file are
+    coalesced and several files are sent in a single call.
+
+    @type file_name: str
+    @param file_name: the path of the file to be replicated
+    @type data: str
+    @param data: the new contents of the file
+    @type flush: boolean
+    @param flush: whether the change must have been replicated to a
+        majority of the nodes when this function returns
+
+    """
+    self._replication_lock.acquire()
+    try:
+      if file_name not in self._pending_files:
+        self._pending_order.append(file_name)
+      self._pending_files[file_name] = data
+
+      in_progress = not (self._replication is None or
+                         self._replication.Wait(timeout=0))
+    finally:
+      self._replication_lock.release()
+
+    if flush or not in_progress:
+      self._FlushReplication()
 
   def _RenameFilesUnlocked(self, rename):
     """Renames a file locally and then replicate the change.
@@ -1327,14 +1592,21 @@ class JobQueue(object):
     @param rename: List containing tuples mapping old to new names
 
     """
+    # Pending changes must reach the nodes before the files are renamed
+    self._FlushReplication()
+
     # Rename them locally
     for old, new in rename:
       utils.RenameFile(old, new, mkdir=True)
 
     # ... and on all nodes
     names, addrs = self._GetNodeIp()
-    result = self._GetRpc(addrs).call_jobqueue_rename(names, rename)
-    self._CheckRpcResult(result, self._nodes, "Renaming files (%r)" % rename)
+    self._WaitForPreviousReplication()
+    try:
+      quorum = self._StartReplication("Renaming files (%r)" % rename)
+      self._GetRpc(addrs, quorum=quorum).call_jobqueue_rename(names, rename)
+    finally:
+      self._replication_lock.release()
 
   @staticmethod
   def _GetJobPath(job_id):
@@ -1489,7 +1761,7 @@ class JobQueue(object):
       writable = not archived
 
     try:
-      data = serializer.LoadJson(raw_data)
+      data = _ParseJobFile(raw_data)
       job = _QueuedJob.Restore(self, data, writable, archived)
     except Exception, err: # pylint: disable=W0703
       raise errors.JobFileCorrupted(err)
@@ -1589,16 +1861,66 @@ class JobQueue(object):
     @param replicate: whether to replicate the change to remote nodes
 
     """
+    finalized = job.CalcStatus() in constants.JOBS_FINALIZED
+
     if __debug__:
-      finalized = job.CalcStatus() in constants.JOBS_FINALIZED
       assert (finalized ^ (job.end_timestamp is None))
       assert job.writable, "Can't update read-only job"
       assert not job.archived, "Can't update archived job"
 
     filename = self._GetJobPath(job.id)
-    data = serializer.DumpJson(job.Serialize())
+    data = serializer.DumpJson(job.Serialize(), compact=True)
     logging.debug("Writing job %s to %s", job.id, filename)
-    self._UpdateJobQueueFile(filename, data, replicate)
+    # Intermediate states can be coalesced, but the final state of the job
+    # must have been replicated before it is reported
+    self._UpdateJobQueueFile(filename, data, replicate, flush=finalized)
+
+    job.written_size = len(data)
+    job.journal_size = 0
+
+  def AppendJobLogUnlocked(self, job, op, entry):
+    """Adds a log entry of a job to its on disk storage.
+
+    Instead of rewriting the whole job file, the entry is appended to it as a
+    journal record (see L{_ParseJobFile}). Once the journal has grown larger
+    than the job data before it, the job is written in full again, so the
+    amount of data written stays linear in the number of log entries. Like
+    any log entry, the record is not replicated to remote nodes.
+
+    @type job: L{_QueuedJob}
+    @param job: the job being logged to
+    @type op: L{_QueuedOpCode}
+    @param op: the opcode the entry belongs to
+    @type entry: tuple
+    @param entry: the log entry, already added to the opcode
+
+    """
+    assert job.writable, "Can't update read-only job"
+    assert not job.archived, "Can't update archived job"
+
+    if job.written_size is None or job.journal_size >= job.written_size:
+      self.UpdateJobUnlocked(job, replicate=False)
+      return
+
+    filename = self._GetJobPath(job.id)
+    record = "\n" + serializer.DumpJson([_JOURNAL_LOG, job.ops.index(op),
+                                         entry], compact=True)
+    try:
+      # not creating the file, as the record can't be read without the job
+      fd = os.open(filename, os.O_WRONLY | os.O_APPEND)
+    except EnvironmentError, err:
+      if err.errno != errno.ENOENT:
+        raise
+      self.UpdateJobUnlocked(job, replicate=False)
+      return
+
+    fh = os.fdopen(fd, "a")
+    try:
+      fh.write(record)
+    finally:
+      fh.close()
+
+    job.journal_size += len(record)
 
   def HasJobBeenFinalized(self, job_id):
     """Checks if a job has been finalized.
@@ -1614,7 +1936,7 @@ class JobQueue(object):
     job = self.SafeLoadJobFromDisk(job_id, True, writable=False)
     if job is not None:
       return job.CalcStatus() in constants.JOBS_FINALIZED
-    elif cluster.LUClusterDestroy.clusterHasBeenDestroyed:
+    elif cmdlib.GetLogicalUnit("LUClusterDestroy").clusterHasBeenDestroyed:
       # FIXME: The above variable is a temporary workaround until the Python job
       # queue is completely removed. When removing the job queue, also remove
       # the variable from LUClusterDestroy.
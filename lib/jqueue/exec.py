@@ -43,6 +43,7 @@ import time
 
 from ganeti import mcpu
 from ganeti.server import masterd
+from ganeti.rpc import node as rpc
 from ganeti.rpc import transport
 from ganeti import serializer
 from ganeti import utils
@@ -52,26 +53,38 @@ from ganeti.utils import livelock
 from ganeti.jqueue import _JobProcessor
 
 
-def _GetMasterInfo():
-  """Retrieve job id, lock file name and secret params from the master process
+def _GetLivelockName(trans):
+  """Retrieve the lock file name from the master process
 
-  This also closes standard input/output
+  @type trans: L{transport.FdTransport}
+  @param trans: the transport to the master process
+  @rtype: L{livelock.LiveLockName}
 
-  @rtype: (int, string, json encoding of a list of dicts)
+  """
+  logging.debug("Reading the livelock name from the master process")
+  livelock_name = livelock.LiveLockName(trans.Call(""))
+  logging.debug("Got livelock %s", livelock_name)
+  return livelock_name
+
+
+def _GetJobInfo(trans):
+  """Retrieve job id and secret params from the master process
+
+  The process can have been started in advance, in which case the master
+  process only answers once it has a job for this process.
+
+  @type trans: L{transport.FdTransport}
+  @param trans: the transport to the master process
+  @rtype: (int, json encoding of a list of dicts)
 
   """
-  logging.debug("Opening transport over stdin/out")
-  with contextlib.closing(transport.FdTransport((0, 1))) as trans:
-    logging.debug("Reading job id from the master process")
-    job_id = int(trans.Call(""))
-    logging.debug("Got job id %d", job_id)
-    logging.debug("Reading the livelock name from the master process")
-    livelock_name = livelock.LiveLockName(trans.Call(""))
-    logging.debug("Got livelock %s", livelock_name)
-    logging.debug("Reading secret parameters from the master process")
-    secret_params = trans.Call("")
-    logging.debug("Got secret parameters.")
-  return (job_id, livelock_name, secret_params)
+  logging.debug("Reading job id from the master process")
+  job_id = int(trans.Call(""))
+  logging.debug("Got job id %d", job_id)
+  logging.debug("Reading secret parameters from the master process")
+  secret_params = trans.Call("")
+  logging.debug("Got secret parameters.")
+  return (job_id, secret_params)
 
 
 def RestorePrivateValueWrapping(json):
@@ -98,19 +111,31 @@ def main():
   logname = pathutils.GetLogFilename("jobs")
   utils.SetupLogging(logname, "job-startup", debug=debug)
 
-  (job_id, livelock_name, secret_params_serialized) = _GetMasterInfo()
-
-  secret_params = ""
-  if secret_params_serialized:
-    secret_params_json = serializer.LoadJson(secret_params_serialized)
-    secret_params = RestorePrivateValueWrapping(secret_params_json)
-
-  utils.SetupLogging(logname, "job-%s" % (job_id,), debug=debug)
+  logging.debug("Opening transport over stdin/out")
+  trans = transport.FdTransport((0, 1))
+  livelock_name = _GetLivelockName(trans)
+  job_id = None
 
   try:
+    # Everything not depending on the job is done before asking for it, so
+    # that a process started in advance only has to load the job
     logging.debug("Preparing the context and the configuration")
     context = masterd.GanetiContext(livelock_name)
 
+    with contextlib.closing(trans):
+      (job_id, secret_params_serialized) = _GetJobInfo(trans)
+    start = time.time()
+
+    secret_params = ""
+    if secret_params_serialized:
+      secret_params_json = serializer.LoadJson(secret_params_serialized)
+      secret_params = RestorePrivateValueWrapping(secret_params_json)
+
+    utils.SetupLogging(logname, "job-%s" % (job_id,), debug=debug)
+
+    # The list of master candidates may have changed while waiting for the job
+    context.jobqueue.UpdateNodes()
+
     logging.debug("Registering signal handlers")
 
     cancel = [False]
@@ -122,9 +147,8 @@ def main():
     signal.signal(signal.SIGTERM, _TermHandler)
 
     def _HupHandler(signum, _frame):
-      logging.debug("Received signal %d, old flag was %s, will set to True",
-                    signum, mcpu.sighupReceived)
-      mcpu.sighupReceived[0] = True
+      logging.debug("Received signal %d, indicating granted locks", signum)
+      mcpu.lockNotifier.Notify()
     signal.signal(signal.SIGHUP, _HupHandler)
 
     def _User1Handler(signum, _frame):
@@ -135,6 +159,8 @@ def main():
     job = context.jobqueue.SafeLoadJobFromDisk(job_id, False)
 
     job.SetPid(os.getpid())
+    logging.debug("Job loaded %.3f seconds after it was received",
+                  time.time() - start)
 
     if secret_params:
       for i in range(0, len(secret_params)):
@@ -175,10 +201,14 @@ def main():
                           " read new priority")
         prio_change[0] = False
 
+    # Changes to the job file might still be being replicated
+    context.jobqueue.WaitForReplication()
+
   except Exception: # pylint: disable=W0703
-    logging.exception("Exception when trying to run job %d", job_id)
+    logging.exception("Exception when trying to run job %s", job_id)
   finally:
-    logging.debug("Job %d finalized", job_id)
+    logging.debug("Job %s finalized", job_id)
+    rpc.SaveStats()
     logging.debug("Removing livelock file %s", livelock_name.GetPath())
     os.remove(livelock_name.GetPath())
 
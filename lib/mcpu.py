@@ -38,8 +38,12 @@ are two kinds of classes defined:
 """
 
 import sys
+import collections
+import errno
 import logging
+import os
 import random
+import select
 import time
 import itertools
 import traceback
@@ -56,12 +60,90 @@ from ganeti import compat
 from ganeti import wconfd
 
 
-sighupReceived = [False]
 lusExecuting = [0]
 
 _OP_PREFIX = "Op"
 _LU_PREFIX = "LU"
 
+#: Interval for asking WConfD about a pending lock request, in case a
+#: notification about the request being granted got lost
+_LOCK_RECHECK_INTERVAL = 10.0
+
+
+class LockNotifier(object):
+  """Notification of a job process about its locks having been granted.
+
+  WConfD sends C{SIGHUP} to a job process once the locks the process is
+  waiting for have been granted. The signal handler calls L{Notify}, which
+  writes to a pipe, so that L{Wait} wakes up immediately without polling.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self._notified = False
+    self._pipe = None
+
+  def Notify(self):
+    """Notifies a waiting process.
+
+    This is safe to be called from a signal handler.
+
+    """
+    self._notified = True
+    if self._pipe is not None:
+      try:
+        os.write(self._pipe[1], "\0")
+      except OSError, err:
+        # If the pipe is full, the process will wake up anyway
+        if err.errno != errno.EAGAIN:
+          raise
+
+  def Clear(self):
+    """Forgets about previous notifications.
+
+    Must be called before requesting locks, so that a notification
+    arriving while the request is sent isn't lost.
+
+    @rtype: bool
+    @return: whether there was a notification
+
+    """
+    if self._pipe is None:
+      self._pipe = os.pipe()
+      for fd in self._pipe:
+        utils.SetCloseOnExecFlag(fd, True)
+        utils.SetNonblockFlag(fd, True)
+
+    try:
+      while os.read(self._pipe[0], 4096):
+        pass
+    except OSError, err:
+      if err.errno != errno.EAGAIN:
+        raise
+
+    notified = self._notified
+    self._notified = False
+    return notified
+
+  def Wait(self, timeout):
+    """Waits for a notification.
+
+    @type timeout: float
+    @param timeout: the maximum time to wait
+    @rtype: bool
+    @return: whether there was a notification
+
+    """
+    if not self._notified:
+      utils.WaitForFdCondition(self._pipe[0], select.POLLIN, timeout)
+    return self.Clear()
+
+
+#: Notified by the C{SIGHUP} handler of job processes
+lockNotifier = LockNotifier()
+
 
 class LockAcquireTimeout(Exception):
   """Exception to report timeouts on acquiring locks.
@@ -188,13 +270,48 @@ def _LUNameForOpName(opname):
   return _LU_PREFIX + opname[len(_OP_PREFIX):]
 
 
+class _DispatchTable(collections.Mapping):
+  """The opcode-to-lu dispatch table.
+
+  The table knows the names of the logical units for all opcodes, but only
+  looks up (and thereby imports) a logical unit once it is needed.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self._lu_names = dict((op, _LUNameForOpName(op.__name__))
+                          for op in opcodes.OP_MAPPING.values()
+                          if op.WITH_LU)
+    self._lus = {}
+
+  def __getitem__(self, op):
+    """Returns the logical unit for an opcode class.
+
+    """
+    try:
+      return self._lus[op]
+    except KeyError:
+      lu_class = cmdlib.GetLogicalUnit(self._lu_names[op])
+      self._lus[op] = lu_class
+      return lu_class
+
+  def __iter__(self):
+    return iter(self._lu_names)
+
+  def __len__(self):
+    return len(self._lu_names)
+
+  def __contains__(self, op):
+    return op in self._lu_names
+
+
 def _ComputeDispatchTable():
   """Computes the opcode-to-lu dispatch table.
 
   """
-  return dict((op, getattr(cmdlib, _LUNameForOpName(op.__name__)))
-              for op in opcodes.OP_MAPPING.values()
-              if op.WITH_LU)
+  return _DispatchTable()
 
 
 def _SetBaseOpParams(src, defcomment, dst):
@@ -307,6 +424,7 @@ class Processor(object):
     self.hmclass = hooksmaster.HooksMaster
     self._enable_locks = enable_locks
     self.wconfd = wconfd # Indirection to allow testing
+    self._notifier = lockNotifier
     self._wconfdcontext = context.GetWConfdContext(ec_id)
 
   def _CheckLocksEnabled(self):
@@ -340,37 +458,57 @@ class Processor(object):
     if priority is None:
       priority = constants.OP_PRIO_DEFAULT
 
-    ## Expect a signal
-    if sighupReceived[0]:
-      logging.warning("Ignoring unexpected SIGHUP")
-    sighupReceived[0] = False
-
     # Request locks
+    self._RequestLocks(priority, request)
+    pending = self._WaitForLocks(timeout)
+
+    logging.debug("Finished trying. Pending: %s", pending)
+    if pending:
+      raise LockAcquireTimeout()
+
+  def _RequestLocks(self, priority, request):
+    """Sends a lock request to WConfD.
+
+    """
+    if self._notifier.Clear():
+      logging.warning("Ignoring unexpected SIGHUP")
     self.wconfd.Client().UpdateLocksWaiting(self._wconfdcontext, priority,
                                             request)
-    pending = self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
 
-    if pending:
-      def _HasPending():
-        if sighupReceived[0]:
-          return self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
-        else:
-          return True
+  def _WaitForLocks(self, timeout):
+    """Waits for WConfD to grant the pending lock request.
+
+    WConfD is only asked again once it notified this process, see
+    L{LockNotifier}, or after L{_LOCK_RECHECK_INTERVAL} seconds.
 
-      pending = utils.SimpleRetry(False, _HasPending, 0.05, timeout)
+    @type timeout: None or float
+    @param timeout: the time to wait, C{None} to wait until the request is
+        granted
+    @rtype: bool
+    @return: whether the request is still pending
 
-      signal = sighupReceived[0]
+    """
+    remaining = utils.RunningTimeout(timeout, False).Remaining
+    remaining()
 
-      if pending:
-        pending = self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
+    while self.wconfd.Client().HasPendingRequest(self._wconfdcontext):
+      wait = remaining()
+      if wait is None:
+        wait = _LOCK_RECHECK_INTERVAL
+      elif wait <= 0.0:
+        return True
 
-      if pending and signal:
-        logging.warning("Ignoring unexpected SIGHUP")
-      sighupReceived[0] = False
+      if self._notifier.Wait(min(wait, _LOCK_RECHECK_INTERVAL)):
+        continue
 
-    logging.debug("Finished trying. Pending: %s", pending)
-    if pending:
-      raise LockAcquireTimeout()
+      if timeout is not None and wait <= _LOCK_RECHECK_INTERVAL:
+        # The time is up, ask WConfD a last time
+        return self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
+
+      logging.debug("No notification received for %s, asking WConfD again",
+                    self._wconfdcontext)
+
+    return False
 
   def _AcquireLocks(self, level, names, shared, opportunistic, timeout,
                     opportunistic_count=1, request_only=False):
@@ -452,13 +590,8 @@ class Processor(object):
       ## acquire the locks one by one (in lock order).
       for r in request:
         logging.debug("Definite request %s for %s", r, self._wconfdcontext)
-        self.wconfd.Client().UpdateLocksWaiting(self._wconfdcontext, priority,
-                                                [r])
-        while True:
-          pending = self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
-          if not pending:
-            break
-          time.sleep(10.0 * random.random())
+        self._RequestLocks(priority, [r])
+        self._WaitForLocks(None)
 
     elif opportunistic:
       logging.debug("For %ss trying to opportunistically acquire"
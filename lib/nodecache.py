@@ -0,0 +1,518 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Cache for data computed by the node daemon.
+
+Results of expensive operations, such as scanning the OS directories or
+running LVM commands, are kept in memory for a limited time. This is only
+useful in long-lived node daemon processes (see the C{--workers} option of
+ganeti-noded), hence the cache is disabled unless L{Enable} is called.
+
+Cached values are grouped by name. All values of a name are invalidated when
+a watched directory changes or when L{Invalidate} is called for the name, in
+which case the other processes of the node daemon are notified through a
+file in L{pathutils.NODED_CACHE_DIR}.
+
+"""
+
+import copy
+import errno
+import logging
+import os
+import threading
+import time
+
+try:
+  # pylint: disable=E0611
+  from pyinotify import pyinotify
+except ImportError:
+  import pyinotify
+
+from ganeti import compat
+from ganeti import errors
+from ganeti import pathutils
+from ganeti import statsfile
+from ganeti import utils
+
+
+# Cache names
+CN_OS = "os"
+CN_EXTSTORAGE = "extstorage"
+CN_LVM = "lvm"
+CN_DRBD = "drbd"
+CN_HYPERVISOR = "hypervisor"
+
+# Keys of the per-name statistics
+STAT_HITS = "hits"
+STAT_MISSES = "misses"
+STAT_INVALIDATIONS = "invalidations"
+
+def _NewStatsEntry():
+  """Returns a new, empty statistics entry.
+
+  """
+  return {
+    STAT_HITS: 0,
+    STAT_MISSES: 0,
+    STAT_INVALIDATIONS: 0,
+    }
+
+
+def MergeStats(target, source):
+  """Adds cache statistics to another set of statistics.
+
+  @type target: dict
+  @param target: Statistics to be updated
+  @type source: dict
+  @param source: Statistics to be added
+
+  """
+  for (name, entry) in source.items():
+    target_entry = target.setdefault(name, _NewStatsEntry())
+    for key in target_entry.keys():
+      target_entry[key] += entry.get(key, 0)
+
+
+class _EventHandler(pyinotify.ProcessEvent):
+  """Passes the paths of all inotify events to a callback.
+
+  """
+  def __init__(self, callback):
+    """Initializes this class.
+
+    @type callback: callable
+    @param callback: Function called with the path of every event
+
+    """
+    # pylint: disable=W0231
+    # no need to call the parent's constructor
+    self._callback = callback
+
+  def process_default(self, event):
+    self._callback(event.path)
+
+
+class _PathWatcher(object):
+  """Watches directory trees for changes using inotify.
+
+  Events are not handled asynchronously, but only when L{Check} is called.
+
+  """
+  # Different Pyinotify versions have the flag constants at different places,
+  # hence not accessing them directly
+  _MASK_FLAGS = ["IN_ATTRIB", "IN_CLOSE_WRITE", "IN_CREATE", "IN_DELETE",
+                 "IN_DELETE_SELF", "IN_MODIFY", "IN_MOVED_FROM",
+                 "IN_MOVED_TO", "IN_MOVE_SELF"]
+
+  def __init__(self, change_fn):
+    """Initializes this class.
+
+    @type change_fn: callable
+    @param change_fn: Function called with a cache name whenever a
+      directory watched for that name has changed
+
+    """
+    self._change_fn = change_fn
+    self._wm = pyinotify.WatchManager()
+    self._notifier = pyinotify.Notifier(self._wm,
+                                        _EventHandler(self._HandleEvent),
+                                        timeout=0)
+    self._mask = 0
+    for flag in self._MASK_FLAGS:
+      self._mask |= pyinotify.EventsCodes.ALL_FLAGS[flag]
+
+    # Maps watched directories to their watch descriptor and the names of the
+    # caches depending on them
+    self._roots = {}
+
+  def Close(self):
+    """Closes the inotify file descriptor.
+
+    The watches themselves are not removed, as they might still be used by
+    another process sharing the file descriptor.
+
+    """
+    self._notifier.stop()
+    self._roots.clear()
+
+  def GetNames(self):
+    """Returns the names of all caches depending on watched directories.
+
+    """
+    return set(name for (_, names) in self._roots.values() for name in names)
+
+  def Watch(self, name, path):
+    """Watches a directory tree for a cache.
+
+    @type name: string
+    @param name: Cache name
+    @type path: string
+    @param path: Directory path
+    @rtype: bool
+    @return: Whether the directory is being watched
+
+    """
+    path = os.path.normpath(path)
+
+    if path not in self._roots:
+      result = self._wm.add_watch(path, self._mask, rec=True, auto_add=True)
+      wd = result.get(path, -1)
+      if wd < 0:
+        logging.debug("Can't watch directory %s for cache %s", path, name)
+        return False
+
+      self._roots[path] = (wd, set())
+
+    self._roots[path][1].add(name)
+
+    return True
+
+  def Check(self):
+    """Processes pending inotify events.
+
+    """
+    if self._roots and self._notifier.check_events():
+      self._notifier.read_events()
+      self._notifier.process_events()
+
+  def _HandleEvent(self, path):
+    """Handles an inotify event.
+
+    The directory's watch is removed; it is set up anew the next time a value
+    depending on it is computed. This also takes care of directories which
+    have been removed and created again.
+
+    """
+    if path:
+      # Events for directories whose watch has already been removed are
+      # ignored
+      path = os.path.normpath(path)
+      roots = [root for root in self._roots
+               if path == root or path.startswith(root + os.sep)]
+    else:
+      # Queue overflow
+      roots = self._roots.keys()
+
+    for root in roots:
+      (wd, names) = self._roots.pop(root)
+      try:
+        self._wm.rm_watch(wd, rec=True)
+      except Exception: # pylint: disable=W0703
+        logging.debug("Can't remove watch for %s", root, exc_info=True)
+
+      for name in names:
+        self._change_fn(name)
+
+
+class NodeCache(object):
+  """Cache for values computed by the node daemon.
+
+  """
+  def __init__(self, state_dir=pathutils.NODED_CACHE_DIR,
+               _time_fn=time.time, _watcher_cls=_PathWatcher):
+    """Initializes this class.
+
+    @type state_dir: string
+    @param state_dir: Directory for notifying other processes about
+      invalidated values
+
+    """
+    self._state_dir = state_dir
+    self._time_fn = _time_fn
+    self._watcher_cls = _watcher_cls
+
+    self._lock = threading.Lock()
+    self._enabled = False
+    self._entries = {}
+    self._stats = {}
+    self._watcher = None
+    self._watcher_pid = None
+
+  def Enable(self):
+    """Enables the cache.
+
+    """
+    utils.EnsureDirs([(self._state_dir, 0755)])
+    self._enabled = True
+
+  def IsEnabled(self):
+    """Returns whether the cache is enabled.
+
+    """
+    return self._enabled
+
+  def _GetStatsEntry(self, name):
+    """Returns the statistics entry for a cache name.
+
+    """
+    return self._stats.setdefault(name, _NewStatsEntry())
+
+  def _GetTokenFilename(self, name):
+    return utils.PathJoin(self._state_dir, name)
+
+  def _ReadToken(self, name):
+    """Reads the token identifying the last invalidation of a cache name.
+
+    @rtype: string or None
+    @return: Token, C{None} if the name was never invalidated
+    @raise EnvironmentError: When the token can't be read
+
+    """
+    try:
+      return utils.ReadFile(self._GetTokenFilename(name))
+    except EnvironmentError, err:
+      if err.errno != errno.ENOENT:
+        raise
+      return None
+
+  def _GetWatcher(self):
+    """Returns the path watcher for the current process.
+
+    Watches are not shared with forked processes, as only one of them would
+    receive the events.
+
+    """
+    pid = os.getpid()
+
+    if self._watcher is not None and self._watcher_pid != pid:
+      # Values depending on watched paths can no longer be trusted
+      for name in self._watcher.GetNames():
+        self._entries.pop(name, None)
+      self._watcher.Close()
+      self._watcher = None
+
+    if self._watcher is None:
+      self._watcher = self._watcher_cls(self._Drop)
+      self._watcher_pid = pid
+
+    return self._watcher
+
+  def _Drop(self, name):
+    """Removes all values of a cache name from this process.
+
+    """
+    if self._entries.pop(name, None):
+      self._GetStatsEntry(name)[STAT_INVALIDATIONS] += 1
+
+  def Get(self, name, key, fn, ttl, paths=None):
+    """Returns a cached value, computing it if necessary.
+
+    Exceptions raised by C{fn} are passed on and nothing is cached.
+
+    @type name: string
+    @param name: Cache name (one of C{CN_*})
+    @type key: hashable
+    @param key: Key identifying the value within the cache name
+    @type fn: callable
+    @param fn: Function computing the value
+    @type ttl: number
+    @param ttl: Number of seconds the value is valid
+    @type paths: list of strings
+    @param paths: Directories whose contents the value depends on; changes
+      in them invalidate all values of the cache name
+
+    """
+    if not self._enabled:
+      return fn()
+
+    self._lock.acquire()
+    try:
+      if paths:
+        watcher = self._GetWatcher()
+        watcher.Check()
+      else:
+        watcher = None
+
+      try:
+        token = self._ReadToken(name)
+      except EnvironmentError, err:
+        logging.warning("Can't read invalidation token for cache %s: %s",
+                        name, err)
+        return fn()
+
+      now = self._time_fn()
+      stats = self._GetStatsEntry(name)
+
+      entries = self._entries.setdefault(name, {})
+      entry = entries.get(key, None)
+      if entry is not None:
+        (expires, entry_token, value) = entry
+        if expires > now and entry_token == token:
+          stats[STAT_HITS] += 1
+          return copy.deepcopy(value)
+
+        del entries[key]
+
+      stats[STAT_MISSES] += 1
+
+      # Watches are set up before computing the value so that no changes are
+      # missed
+      if watcher is not None:
+        for path in paths:
+          watcher.Watch(name, path)
+    finally:
+      self._lock.release()
+
+    value = fn()
+
+    self._lock.acquire()
+    try:
+      self._entries.setdefault(name, {})[key] = \
+        (now + ttl, token, copy.deepcopy(value))
+    finally:
+      self._lock.release()
+
+    return value
+
+  def Invalidate(self, name):
+    """Invalidates all values of a cache name in all processes.
+
+    @type name: string
+    @param name: Cache name (one of C{CN_*})
+
+    """
+    if not self._enabled:
+      return
+
+    self._lock.acquire()
+    try:
+      self._Drop(name)
+
+      try:
+        utils.WriteFile(self._GetTokenFilename(name), data=utils.NewUUID())
+      except EnvironmentError, err:
+        logging.error("Can't notify other processes about invalidating"
+                      " cache %s: %s", name, err)
+    finally:
+      self._lock.release()
+
+  def PopStats(self):
+    """Returns the collected statistics and resets them.
+
+    @rtype: dict
+    @return: Dictionary mapping cache names to dictionaries with the keys
+      C{STAT_*}
+
+    """
+    self._lock.acquire()
+    try:
+      (stats, self._stats) = (self._stats, {})
+      return stats
+    finally:
+      self._lock.release()
+
+
+def SaveStatsTo(cache, filename):
+  """Merges the statistics of a cache into a file and resets them.
+
+  Errors are logged, but not raised.
+
+  @type cache: L{NodeCache}
+  @param cache: Cache
+  @type filename: string
+  @param filename: Path to statistics file
+
+  """
+  data = dict((name, entry) for (name, entry) in cache.PopStats().items()
+              if compat.any(entry.values()))
+  if not data:
+    return
+
+  try:
+    statsfile.MergeInto(filename, data, MergeStats)
+  except (EnvironmentError, ValueError, errors.LockError), err:
+    logging.warning("Can't write cache statistics to %s: %s", filename, err)
+
+
+def ReadStats(filename):
+  """Reads cache statistics from a file.
+
+  @type filename: string
+  @param filename: Path to statistics file
+  @rtype: dict
+  @return: Statistics, empty if the file doesn't exist
+
+  """
+  return statsfile.Read(filename, MergeStats, {})
+
+
+#: Cache used by the node daemon
+_cache = NodeCache()
+
+
+def Enable():
+  """Enables the node daemon's cache.
+
+  """
+  _cache.Enable()
+
+
+def Get(name, key, fn, ttl, paths=None):
+  """Returns a value from the node daemon's cache.
+
+  @see: L{NodeCache.Get}
+
+  """
+  return _cache.Get(name, key, fn, ttl, paths=paths)
+
+
+def Invalidate(name):
+  """Invalidates values in the node daemon's cache.
+
+  @see: L{NodeCache.Invalidate}
+
+  """
+  _cache.Invalidate(name)
+
+
+def Invalidates(*names):
+  """Decorator for functions changing the data of cache names.
+
+  The values are invalidated after the function returned or raised an
+  exception, as it might have made changes before failing.
+
+  """
+  def wrap(fn):
+    def wrapper(*args, **kwargs):
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        for name in names:
+          Invalidate(name)
+    return wrapper
+  return wrap
+
+
+def SaveStats(filename=pathutils.NODED_CACHE_STATS_FILE):
+  """Merges the statistics of the node daemon's cache into a file.
+
+  """
+  if _cache.IsEnabled():
+    SaveStatsTo(_cache, filename)
@@ -68,6 +68,30 @@ __all__ = ["ConfigObject", "ConfigData", "NIC", "Disk", "Instance",
 _TIMESTAMPS = ["ctime", "mtime"]
 _UUID = ["uuid"]
 
+#: Types of parameter values which don't need to be copied
+_IMMUTABLE_PARAM_TYPES = (basestring, int, long, float, type(None))
+
+
+def _CopyParams(params):
+  """Makes a deep copy of a parameter dictionary.
+
+  Parameter dictionaries mostly hold only strings, numbers and booleans, in
+  which case a shallow copy is equivalent to, and much cheaper than,
+  C{copy.deepcopy}.
+
+  @type params: dict
+  @rtype: dict
+
+  """
+  if type(params) is dict:
+    for value in params.itervalues():
+      if not isinstance(value, _IMMUTABLE_PARAM_TYPES):
+        break
+    else:
+      return params.copy()
+
+  return copy.deepcopy(params)
+
 
 def FillDict(defaults_dict, custom_dict, skip_keys=None):
   """Basic function to apply settings on top a default dict.
@@ -82,7 +106,7 @@ def FillDict(defaults_dict, custom_dict, skip_keys=None):
   @return: dict with the 'full' values
 
   """
-  ret_dict = copy.deepcopy(defaults_dict)
+  ret_dict = _CopyParams(defaults_dict)
   ret_dict.update(custom_dict)
   if skip_keys:
     for k in skip_keys:
@@ -284,17 +308,40 @@ class ConfigObject(outils.ValidatedSlots):
   def Copy(self):
     """Makes a deep copy of the current object and its children.
 
+    The result is the same as converting the object with L{ToDict} and back
+    with L{FromDict}, but the copy is made directly from the slots: child
+    configuration objects are copied, while all other values are shared with
+    the original object.
+
     """
-    dict_form = self.ToDict()
-    clone_obj = self.__class__.FromDict(dict_form)
+    clone_obj = self.__class__.__new__(self.__class__)
+    for name in self.GetAllSlots():
+      value = getattr(self, name, None)
+      if value is not None:
+        setattr(clone_obj, name, value)
+    self._CopyChildren(clone_obj)
     return clone_obj
 
+  def _CopyChildren(self, clone_obj):
+    """Replaces the values shared with a copy of this object by copies.
+
+    Classes converting some of their slots in L{ToDict} or L{FromDict} must
+    convert them here in the same way, see L{Copy}.
+
+    @param clone_obj: The new object, with all slots set to the values of
+      this object
+
+    """
+    pass
+
   def __repr__(self):
     """Implement __repr__ for ConfigObjects."""
     return repr(self.ToDict())
 
   def __eq__(self, other):
     """Implement __eq__ for ConfigObjects."""
+    if self is other:
+      return True
     return isinstance(other, self.__class__) and self.ToDict() == other.ToDict()
 
   def UpgradeConfig(self):
@@ -385,6 +432,14 @@ class TaggableObject(ConfigObject):
       obj.tags = set(obj.tags)
     return obj
 
+  def _CopyChildren(self, clone_obj):
+    """Copies the tags.
+
+    """
+    super(TaggableObject, self)._CopyChildren(clone_obj)
+    if isinstance(self.tags, (set, list)):
+      clone_obj.tags = set(self.tags)
+
 
 class MasterNetworkParameters(ConfigObject):
   """Network configuration parameters for the master
@@ -454,6 +509,17 @@ class ConfigData(ConfigObject):
     obj.maintenance = Maintenance.FromDict(obj.maintenance)
     return obj
 
+  def _CopyChildren(self, clone_obj):
+    """Copies the cluster and all the containers.
+
+    """
+    super(ConfigData, self)._CopyChildren(clone_obj)
+    clone_obj.cluster = self.cluster.Copy()
+    clone_obj.maintenance = self.maintenance.Copy()
+    for key in ("nodes", "instances", "nodegroups", "networks", "disks",
+                "filters"):
+      setattr(clone_obj, key, outils.ContainerCopy(getattr(self, key)))
+
   def DisksOfType(self, dev_type):
     """Check if in there is at disk of the given type in the configuration.
 
@@ -869,14 +935,30 @@ class Disk(ConfigObject):
     obj = super(Disk, cls).FromDict(val)
     if obj.children:
       obj.children = outils.ContainerFromDicts(obj.children, list, Disk)
-    if obj.logical_id and isinstance(obj.logical_id, list):
-      obj.logical_id = tuple(obj.logical_id)
-    if obj.dev_type in constants.DTS_DRBD:
-      # we need a tuple of length six here
-      if len(obj.logical_id) < 6:
-        obj.logical_id += (None,) * (6 - len(obj.logical_id))
+    obj._NormalizeLogicalID() # pylint: disable=W0212
     return obj
 
+  def _CopyChildren(self, clone_obj):
+    """Copies the children, without the dynamic parameters.
+
+    """
+    super(Disk, self)._CopyChildren(clone_obj)
+    clone_obj.dynamic_params = None
+    if self.children:
+      clone_obj.children = outils.ContainerCopy(self.children)
+    clone_obj._NormalizeLogicalID() # pylint: disable=W0212
+
+  def _NormalizeLogicalID(self):
+    """Brings the logical ID into the format used in memory.
+
+    """
+    if self.logical_id and isinstance(self.logical_id, list):
+      self.logical_id = tuple(self.logical_id)
+    if self.dev_type in constants.DTS_DRBD:
+      # we need a tuple of length six here
+      if len(self.logical_id) < 6:
+        self.logical_id += (None,) * (6 - len(self.logical_id))
+
   def __str__(self):
     """Custom str() formatter for disks.
 
@@ -1287,6 +1369,18 @@ class Instance(TaggableObject):
 
     return obj
 
+  def _CopyChildren(self, clone_obj):
+    """Copies the NICs and disk objects, without the disk template.
+
+    """
+    super(Instance, self)._CopyChildren(clone_obj)
+    clone_obj.disk_template = None
+    if clone_obj.admin_state is None:
+      clone_obj.admin_state = constants.ADMINST_DOWN
+    clone_obj.nics = outils.ContainerCopy(self.nics or [])
+    if self.disks_info:
+      clone_obj.disks_info = outils.ContainerCopy(self.disks_info)
+
   def UpgradeConfig(self):
     """Fill defaults for missing configuration values.
 
@@ -1525,6 +1619,20 @@ class Node(TaggableObject):
 
     return obj
 
+  def _CopyChildren(self, clone_obj):
+    """Copies the hypervisor and disk states.
+
+    """
+    super(Node, self)._CopyChildren(clone_obj)
+
+    if self.hv_state is not None:
+      clone_obj.hv_state = outils.ContainerCopy(self.hv_state)
+
+    if self.disk_state is not None:
+      clone_obj.disk_state = \
+        dict((key, outils.ContainerCopy(value))
+             for (key, value) in self.disk_state.items())
+
 
 class NodeGroup(TaggableObject):
   """Config object representing a node group."""
@@ -1563,6 +1671,13 @@ class NodeGroup(TaggableObject):
     obj.members = []
     return obj
 
+  def _CopyChildren(self, clone_obj):
+    """Resets the members of the copy, like L{FromDict}.
+
+    """
+    super(NodeGroup, self)._CopyChildren(clone_obj)
+    clone_obj.members = []
+
   def UpgradeConfig(self):
     """Fill defaults for missing configuration values.
 
@@ -1870,6 +1985,17 @@ class Cluster(TaggableObject):
 
     return obj
 
+  def _CopyChildren(self, clone_obj):
+    """Copies the port pool.
+
+    """
+    super(Cluster, self)._CopyChildren(clone_obj)
+
+    if self.tcpudp_port_pool is None:
+      clone_obj.tcpudp_port_pool = set()
+    else:
+      clone_obj.tcpudp_port_pool = set(self.tcpudp_port_pool)
+
   def SimpleFillDP(self, diskparams):
     """Fill a given diskparams dict with cluster defaults.
 
@@ -2268,6 +2394,13 @@ class _QueryResponseBase(ConfigObject):
       outils.ContainerFromDicts(obj.fields, list, QueryFieldDefinition)
     return obj
 
+  def _CopyChildren(self, clone_obj):
+    """Copies the field definitions.
+
+    """
+    super(_QueryResponseBase, self)._CopyChildren(clone_obj)
+    clone_obj.fields = outils.ContainerCopy(self.fields)
+
 
 class QueryResponse(_QueryResponseBase):
   """Object holding the response to a query.
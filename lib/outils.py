@@ -136,6 +136,26 @@ def ContainerToDicts(container):
   return ret
 
 
+def ContainerCopy(container):
+  """Copy the elements of a container.
+
+  This is equivalent to converting the container with L{ContainerToDicts} and
+  back with L{ContainerFromDicts}, without building the intermediate
+  dictionaries. The elements must support a C{Copy} method.
+
+  @type container: dict or sequence (see L{_SEQUENCE_TYPES})
+
+  """
+  if isinstance(container, dict):
+    ret = dict([(k, v.Copy()) for k, v in container.items()])
+  elif isinstance(container, _SEQUENCE_TYPES):
+    ret = [elem.Copy() for elem in container]
+  else:
+    raise TypeError("Unknown container type '%s'" % type(container))
+
+  return ret
+
+
 def ContainerFromDicts(source, c_type, e_type):
   """Convert a container from standard python types.
 
@@ -102,6 +102,14 @@ INSTANCE_REASON_DIR = RUN_DIR + "/instance-reason"
 UIDPOOL_LOCKDIR = RUN_DIR + "/uid-pool"
 LIVELOCK_DIR = RUN_DIR + "/livelocks"
 LUXID_MESSAGE_DIR = RUN_DIR + "/luxidmessages"
+#: Statistics about node RPC calls made by processes on this node
+RPC_CLIENT_STATS_FILE = RUN_DIR + "/rpc-client.stats"
+#: Statistics about RPC calls handled by the node daemon
+NODED_RPC_STATS_FILE = RUN_DIR + "/noded-rpc.stats"
+#: Invalidation tokens of the node daemon's cache
+NODED_CACHE_DIR = RUN_DIR + "/noded-cache"
+#: Statistics about the node daemon's cache
+NODED_CACHE_STATS_FILE = RUN_DIR + "/noded-cache.stats"
 
 SSCONF_LOCK_FILE = LOCK_DIR + "/ganeti-ssconf.lock"
 
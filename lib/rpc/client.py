@@ -75,13 +75,21 @@ def ParseRequest(msg):
   return (method, args, version)
 
 
-def ParseResponse(msg):
+def ParseResponse(msg, private_paths=None):
   """Parses a response message.
 
+  @type private_paths: list of tuples or None
+  @param private_paths: Paths within the result that can contain private
+    fields, see L{serializer.LoadJson}; by default the whole response is
+    searched
+
   """
+  if private_paths is not None:
+    private_paths = [(KEY_RESULT, ) + path for path in private_paths]
+
   # Parse the result
   try:
-    data = serializer.LoadJson(msg)
+    data = serializer.LoadJson(msg, private_paths=private_paths)
   except KeyboardInterrupt:
     raise
   except Exception, err:
@@ -111,7 +119,7 @@ def FormatResponse(success, result, version=None):
 
   logging.debug("RPC response: %s", response)
 
-  return serializer.DumpJson(response)
+  return serializer.DumpJson(response, compact=True)
 
 
 def FormatRequest(method, args, version=None):
@@ -129,12 +137,18 @@ def FormatRequest(method, args, version=None):
 
   # Serialize the request
   return serializer.DumpJson(request,
-                             private_encoder=serializer.EncodeWithPrivateFields)
+                             private_encoder=serializer.EncodeWithPrivateFields,
+                             compact=True)
 
 
-def CallRPCMethod(transport_cb, method, args, version=None):
+def CallRPCMethod(transport_cb, method, args, version=None,
+                  private_paths=None):
   """Send a RPC request via a transport and return the response.
 
+  @type private_paths: list of tuples or None
+  @param private_paths: Paths within the result that can contain private
+    fields, see L{ParseResponse}
+
   """
   assert callable(transport_cb)
 
@@ -143,7 +157,8 @@ def CallRPCMethod(transport_cb, method, args, version=None):
   # Send request and wait for response
   response_msg = transport_cb(request_msg)
 
-  (success, result, resp_version) = ParseResponse(response_msg)
+  (success, result, resp_version) = \
+    ParseResponse(response_msg, private_paths=private_paths)
 
   # Verify version if there was one in the response
   if resp_version is not None and resp_version != version:
@@ -164,6 +179,10 @@ class AbstractClient(object):
   implements data serialization/deserialization.
 
   """
+  #: Maps method names to the paths within their results that can contain
+  #: private fields, see L{ParseResponse}; results of other methods are
+  #: searched entirely
+  _PRIVATE_PATHS = {}
 
   def __init__(self, timeouts=None, transport=t.Transport,
                allow_non_master=False):
@@ -246,7 +265,8 @@ class AbstractClient(object):
       raise errors.ProgrammerError("Invalid parameter passed to CallMethod:"
                                    " expected list, got %s" % type(args))
     return CallRPCMethod(self._SendMethodCall, method, args,
-                         version=self.version)
+                         version=self.version,
+                         private_paths=self._PRIVATE_PATHS.get(method))
 
 
 class AbstractStubClient(AbstractClient):
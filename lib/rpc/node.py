@@ -46,6 +46,7 @@ import pycurl
 import threading
 import copy
 import os
+import time
 
 from ganeti import utils
 from ganeti import objects
@@ -61,6 +62,8 @@ from ganeti import rpc_defs
 from ganeti import pathutils
 from ganeti import vcluster
 
+from ganeti.rpc import stats
+
 # Special module generated at build time
 from ganeti import _generated_rpc
 
@@ -70,12 +73,34 @@ import ganeti.http.client  # pylint: disable=W0611
 
 _RPC_CLIENT_HEADERS = [
   "Content-type: %s" % http.HTTP_APP_JSON,
+  "%s: %s" % (http.HTTP_ACCEPT_ENCODING,
+              ", ".join(http.GetSupportedEncodings())),
   "Expect:",
   ]
 
 #: Special value to describe an offline host
 _OFFLINE = object()
 
+#: Seconds after which idle pooled connections to nodes are closed
+_CURL_POOL_IDLE_TIMEOUT = 60
+
+#: Maximum number of requests of a single RPC call in progress at the same
+#: time; calls to more nodes are processed in a sliding window
+_RPC_MAX_ACTIVE_REQUESTS = 128
+
+#: Maximum number of idle pooled connections to nodes in total
+_CURL_POOL_MAX_IDLE = _RPC_MAX_ACTIVE_REQUESTS
+
+#: Seconds for which failed name lookups are remembered
+_NEGATIVE_LOOKUP_TTL = 10
+
+#: Process-wide pool of cURL handles, see L{_GetCurlPool}
+_curl_pool = None
+_curl_pool_lock = threading.Lock()
+
+#: Statistics about RPC calls made by this process, see L{SaveStats}
+_rpc_stats = stats.RpcStats()
+
 
 def Init():
   """Initializes the module-global HTTP client manager.
@@ -102,9 +127,28 @@ def Shutdown():
   running.
 
   """
+  global _curl_pool # pylint: disable=W0603
+
+  if _curl_pool is not None:
+    _curl_pool.Flush()
+    _curl_pool = None
+
+  _ssconf_resolver_cache.Flush()
+
+  SaveStats()
+
   pycurl.global_cleanup()
 
 
+def SaveStats():
+  """Merges the statistics of this process into the statistics file.
+
+  Should be called by processes making RPC calls before they exit.
+
+  """
+  _rpc_stats.SaveTo(pathutils.RPC_CLIENT_STATS_FILE)
+
+
 def _ConfigRpcCurl(curl):
   noded_cert = pathutils.NODED_CERT_FILE
   noded_client_cert = pathutils.NODED_CLIENT_CERT_FILE
@@ -127,6 +171,61 @@ def _ConfigRpcCurl(curl):
   curl.setopt(pycurl.CONNECTTIMEOUT, constants.RPC_CONNECT_TIMEOUT)
 
 
+def _GetRpcCertIdentity():
+  """Returns a value identifying the certificates used for RPC.
+
+  Pooled connections are closed when this value changes, e.g. after
+  C{gnt-cluster renew-crypto} replaced the certificates.
+
+  """
+  result = []
+
+  for filename in [pathutils.NODED_CERT_FILE,
+                   pathutils.NODED_CLIENT_CERT_FILE]:
+    try:
+      result.append(utils.GetFileID(path=filename))
+    except EnvironmentError:
+      result.append(None)
+
+  return tuple(result)
+
+
+def _GetCurlPool():
+  """Returns the process-wide pool of cURL handles.
+
+  The pool is created on first use, so that processes not calling L{Init}
+  (e.g. job processes) reuse connections as well.
+
+  @rtype: L{http.client.CurlHandlePool}
+
+  """
+  global _curl_pool # pylint: disable=W0603
+
+  _curl_pool_lock.acquire()
+  try:
+    if _curl_pool is None:
+      _curl_pool = http.client.CurlHandlePool(_CURL_POOL_IDLE_TIMEOUT,
+                                              max_idle=_CURL_POOL_MAX_IDLE)
+    return _curl_pool
+  finally:
+    _curl_pool_lock.release()
+
+
+def _GetRequestProcessor():
+  """Returns the function used to process HTTP requests.
+
+  Requests are processed using pooled cURL handles, with at most
+  L{_RPC_MAX_ACTIVE_REQUESTS} of them in progress at the same time.
+
+  """
+  pool = _GetCurlPool()
+
+  pool.CheckIdentity(_GetRpcCertIdentity())
+
+  return compat.partial(http.client.ProcessRequests, curl_pool=pool,
+                        max_active=_RPC_MAX_ACTIVE_REQUESTS)
+
+
 def RunWithRPC(fn):
   """RPC-wrapper decorator.
 
@@ -266,9 +365,155 @@ class RpcResult(object):
     feedback_fn(msg)
 
 
+def _ReadNodeAddresses(ss):
+  """Reads the primary IP addresses of all nodes from ssconf.
+
+  @rtype: dict
+  @return: Dictionary mapping node names to their primary IP address
+
+  """
+  return dict(entry.split() for entry in ss.GetNodePrimaryIPList())
+
+
+class _SsconfResolverCache(object):
+  """Process-wide cache for L{_SsconfResolver}.
+
+  Values read from ssconf are kept until the identity (device, inode and
+  modification time) of the file they were read from changes. As ssconf files
+  are replaced atomically, this only requires a C{stat} call per file instead
+  of reading and parsing it on every RPC call. Failed name lookups are
+  remembered for a short time to avoid repeated slow DNS queries.
+
+  """
+  def __init__(self, negative_ttl, _time_fn=time.time,
+               _get_file_id=utils.GetFileID):
+    """Initializes this class.
+
+    @type negative_ttl: number
+    @param negative_ttl: Seconds for which failed lookups are remembered
+
+    """
+    self._negative_ttl = negative_ttl
+    self._time_fn = _time_fn
+    self._get_file_id = _get_file_id
+
+    self._lock = threading.Lock()
+
+    # Maps file names to a tuple of (file ID, value)
+    self._files = {}
+
+    # Maps (name, family) to a tuple of (expiry time, exception)
+    self._failed = {}
+
+  def _GetFileValue(self, ss, key, read_fn):
+    """Returns a value read from an ssconf file, using cached data if possible.
+
+    @type ss: L{ssconf.SimpleStore}
+    @param ss: ssconf store
+    @type key: string
+    @param key: ssconf key
+    @type read_fn: callable
+    @param read_fn: Function reading the value from the store
+
+    """
+    filename = ss.KeyToFilename(key)
+
+    try:
+      file_id = self._get_file_id(path=filename)
+    except EnvironmentError:
+      # The file can't be examined (e.g. it doesn't exist), let the store
+      # decide on how to handle this
+      return read_fn()
+
+    self._lock.acquire()
+    try:
+      cached = self._files.get(filename)
+    finally:
+      self._lock.release()
+
+    if cached is not None and cached[0] == file_id:
+      return cached[1]
+
+    # The file's identity is determined before reading it, so a modification
+    # in between only causes it to be read again on the next call
+    value = read_fn()
+
+    self._lock.acquire()
+    try:
+      self._files[filename] = (file_id, value)
+    finally:
+      self._lock.release()
+
+    return value
+
+  def GetPrimaryIPFamily(self, ss):
+    """Returns the cluster-wide primary IP family.
+
+    """
+    return self._GetFileValue(ss, constants.SS_PRIMARY_IP_FAMILY,
+                              ss.GetPrimaryIPFamily)
+
+  def GetNodeAddresses(self, ss):
+    """Returns a dictionary mapping node names to their primary IP address.
+
+    The returned dictionary must not be modified.
+
+    """
+    return self._GetFileValue(ss, constants.SS_NODE_PRIMARY_IPS,
+                              compat.partial(_ReadNodeAddresses, ss))
+
+  def LookUp(self, nslookup_fn, name, family=None):
+    """Looks up the address of a name, remembering failures.
+
+    @type nslookup_fn: callable
+    @param nslookup_fn: Function doing the actual lookup
+    @raise errors.ResolverError: if the name can't be resolved
+
+    """
+    key = (name, family)
+    now = self._time_fn()
+
+    self._lock.acquire()
+    try:
+      failed = self._failed.get(key)
+      if failed is not None:
+        (expires, err) = failed
+        if now < expires:
+          raise err
+        del self._failed[key]
+    finally:
+      self._lock.release()
+
+    try:
+      return nslookup_fn(name, family=family)
+    except errors.ResolverError, err:
+      self._lock.acquire()
+      try:
+        self._failed[key] = (now + self._negative_ttl, err)
+      finally:
+        self._lock.release()
+      raise
+
+  def Flush(self):
+    """Discards all cached data.
+
+    """
+    self._lock.acquire()
+    try:
+      self._files.clear()
+      self._failed.clear()
+    finally:
+      self._lock.release()
+
+
+#: Cache used by node resolvers based on ssconf
+_ssconf_resolver_cache = _SsconfResolverCache(_NEGATIVE_LOOKUP_TTL)
+
+
 def _SsconfResolver(ssconf_ips, node_list, _,
                     ssc=ssconf.SimpleStore,
-                    nslookup_fn=netutils.Hostname.GetIP):
+                    nslookup_fn=netutils.Hostname.GetIP,
+                    cache=None):
   """Return addresses for given node names.
 
   @type ssconf_ips: bool
@@ -279,18 +524,26 @@ def _SsconfResolver(ssconf_ips, node_list, _,
   @param ssc: SimpleStore class that is used to obtain node->ip mappings
   @type nslookup_fn: callable
   @param nslookup_fn: function use to do NS lookup
+  @type cache: L{_SsconfResolverCache} or None
+  @param cache: Cache for values read from ssconf and failed lookups
   @rtype: list of tuple; (string, string)
   @return: List of tuples containing node name and IP address
 
   """
   ss = ssc()
-  family = ss.GetPrimaryIPFamily()
 
-  if ssconf_ips:
-    iplist = ss.GetNodePrimaryIPList()
-    ipmap = dict(entry.split() for entry in iplist)
+  if cache is None:
+    family = ss.GetPrimaryIPFamily()
   else:
+    family = cache.GetPrimaryIPFamily(ss)
+    nslookup_fn = compat.partial(cache.LookUp, nslookup_fn)
+
+  if not ssconf_ips:
     ipmap = {}
+  elif cache is None:
+    ipmap = _ReadNodeAddresses(ss)
+  else:
+    ipmap = cache.GetNodeAddresses(ss)
 
   result = []
   for node in node_list:
@@ -360,8 +613,149 @@ def _NodeConfigResolver(single_node_fn, all_nodes_fn, node_uuids, opts):
             for uuid in node_uuids]
 
 
+class RpcQuorum(object):
+  """Lets a multi-node RPC call return once enough nodes have succeeded.
+
+  Requests to the remaining nodes are finished in a background thread. Once
+  all of them have finished, the callback given to the constructor is called
+  with the results for all nodes, e.g. to log or reconcile failures. An
+  instance can only be used for a single call.
+
+  """
+  def __init__(self, quorum, done_cb=None):
+    """Initializes this class.
+
+    @type quorum: int
+    @param quorum: Number of nodes which must have answered successfully
+      before the call returns; the call also returns once all requests have
+      finished
+    @type done_cb: callable or None
+    @param done_cb: Called from the background thread with a dictionary
+      mapping node names to L{RpcResult} objects for all nodes
+
+    """
+    assert quorum >= 0
+
+    self._quorum = quorum
+    self._done_cb = done_cb
+
+    self._cond = threading.Condition(threading.Lock())
+    self._thread = None
+    self._results = None
+    self._pending = None
+    self._succeeded = 0
+    self._finished = False
+
+  def _RequestDone(self, result_fn, name, req):
+    """Called whenever a request has finished.
+
+    """
+    result = result_fn(name, req)
+
+    self._cond.acquire()
+    try:
+      self._results[name] = result
+      self._pending -= 1
+      if not result.fail_msg:
+        self._succeeded += 1
+      self._cond.notifyAll()
+    finally:
+      self._cond.release()
+
+  def _Run(self, process_fn, requests, result_fn, finish_fn):
+    """Processes all requests; runs in the background thread.
+
+    """
+    try:
+      process_fn(requests.values())
+    except Exception: # pylint: disable=W0703
+      logging.exception("Error while processing RPC requests")
+
+    self._cond.acquire()
+    try:
+      # Requests which were never completed are reported as failed
+      for (name, req) in requests.items():
+        if name not in self._results:
+          self._results[name] = result_fn(name, req)
+
+      self._finished = True
+      self._cond.notifyAll()
+
+      results = self._results.copy()
+    finally:
+      self._cond.release()
+
+    for fn in [finish_fn, self._done_cb]:
+      if fn is not None:
+        try:
+          fn(results)
+        except Exception: # pylint: disable=W0703
+          logging.exception("Error while handling results of RPC requests")
+
+  def Process(self, process_fn, requests, results, result_fn, finish_fn=None):
+    """Processes requests, returning once the quorum has been reached.
+
+    @type process_fn: callable
+    @param process_fn: Function processing a list of HTTP requests
+    @type requests: dict
+    @param requests: HTTP requests by node name
+    @type results: dict
+    @param results: Results which are already known, e.g. for offline nodes
+    @type result_fn: callable
+    @param result_fn: Function returning the L{RpcResult} for a node name and
+      its finished request
+    @type finish_fn: callable or None
+    @param finish_fn: Called with the results for all nodes before the
+      callback given to the constructor
+    @rtype: dict
+    @return: C{results} updated with the results of all requests which have
+      finished so far
+
+    """
+    assert self._thread is None, "Quorum can only be used for a single call"
+
+    self._results = results.copy()
+    self._pending = len(requests)
+
+    for (name, req) in requests.items():
+      assert req.completion_cb is None
+      req.completion_cb = compat.partial(self._RequestDone, result_fn, name)
+
+    self._thread = threading.Thread(target=self._Run,
+                                    args=(process_fn, requests, result_fn,
+                                          finish_fn))
+    self._thread.start()
+
+    self._cond.acquire()
+    try:
+      while not (self._finished or self._pending == 0 or
+                 self._succeeded >= self._quorum):
+        self._cond.wait()
+
+      return self._results.copy()
+    finally:
+      self._cond.release()
+
+  def Wait(self, timeout=None):
+    """Waits for all requests to finish.
+
+    @type timeout: number or None
+    @param timeout: Maximum number of seconds to wait, C{None} for no limit
+    @rtype: bool
+    @return: Whether all requests have finished and the callback has been
+      called
+
+    """
+    if self._thread is None:
+      return True
+
+    self._thread.join(timeout)
+
+    return not self._thread.isAlive()
+
+
 class _RpcProcessor:
-  def __init__(self, resolver, port, lock_monitor_cb=None):
+  def __init__(self, resolver, port, lock_monitor_cb=None, _stats=None):
     """Initializes this class.
 
     @param resolver: callable accepting a list of node UUIDs or hostnames,
@@ -373,9 +767,13 @@ class _RpcProcessor:
     @param lock_monitor_cb: Callable for registering with lock monitor
 
     """
+    if _stats is None:
+      _stats = _rpc_stats
+
     self._resolver = resolver
     self._port = port
     self._lock_monitor_cb = lock_monitor_cb
+    self._stats = _stats
 
   @staticmethod
   def _PrepareRequests(hosts, port, procedure, body, read_timeout):
@@ -419,8 +817,10 @@ class _RpcProcessor:
     """
     for name, req in requests.items():
       if req.success and req.resp_status_code == http.HTTP_OK:
-        host_result = RpcResult(data=serializer.LoadJson(req.resp_body),
-                                node=name, call=procedure)
+        # Node daemons never send private values back, they're encoded as
+        # null, so there is nothing to wrap in responses
+        data = serializer.LoadJson(req.resp_body, private_paths=[])
+        host_result = RpcResult(data=data, node=name, call=procedure)
       else:
         # TODO: Better error reporting
         if req.error:
@@ -436,8 +836,32 @@ class _RpcProcessor:
 
     return results
 
+  @staticmethod
+  def _RecordStats(rpc_stats, hosts, requests, results, procedure):
+    """Records statistics about processed requests.
+
+    """
+    names = dict((original_name, name) for (name, _, original_name) in hosts)
+
+    for (original_name, req) in requests.items():
+      if req.resp_body is None:
+        resp_raw_size = 0
+      else:
+        resp_raw_size = len(req.resp_body)
+
+      if req.resp_size is None:
+        resp_size = resp_raw_size
+      else:
+        resp_size = req.resp_size
+
+      rpc_stats.Record(procedure, names.get(original_name, original_name),
+                       req.duration, len(req.post_data), resp_size,
+                       resp_raw_size=resp_raw_size,
+                       encoding=req.resp_encoding,
+                       failed=bool(results[original_name].fail_msg))
+
   def __call__(self, nodes, procedure, body, read_timeout, resolver_opts,
-               _req_process_fn=None):
+               _req_process_fn=None, quorum=None):
     """Makes an RPC request to a number of nodes.
 
     @type nodes: sequence
@@ -448,6 +872,10 @@ class _RpcProcessor:
     @param body: dictionary with request bodies per host
     @type read_timeout: int or None
     @param read_timeout: Read timeout for request
+    @type quorum: L{RpcQuorum} or None
+    @param quorum: If given, the call returns as soon as the quorum has been
+      reached and the result only contains the nodes which have answered
+      until then
     @rtype: dictionary
     @return: a dictionary mapping host names to rpc.RpcResult objects
 
@@ -456,29 +884,48 @@ class _RpcProcessor:
       "Missing RPC read timeout for procedure '%s'" % procedure
 
     if _req_process_fn is None:
-      _req_process_fn = http.client.ProcessRequests
+      _req_process_fn = _GetRequestProcessor()
+
+    hosts = self._resolver(nodes, resolver_opts)
 
     (results, requests) = \
-      self._PrepareRequests(self._resolver(nodes, resolver_opts), self._port,
-                            procedure, body, read_timeout)
+      self._PrepareRequests(hosts, self._port, procedure, body, read_timeout)
+
+    if quorum is not None:
+      def _GetResult(name, req):
+        return self._CombineResults({}, {name: req}, procedure)[name]
+
+      def _Finish(all_results):
+        self._RecordStats(self._stats, hosts, requests, all_results, procedure)
+
+      process_fn = compat.partial(_req_process_fn,
+                                  lock_monitor_cb=self._lock_monitor_cb)
+
+      return quorum.Process(process_fn, requests, results, _GetResult,
+                            finish_fn=_Finish)
 
     _req_process_fn(requests.values(), lock_monitor_cb=self._lock_monitor_cb)
 
     assert not frozenset(results).intersection(requests)
 
-    return self._CombineResults(results, requests, procedure)
+    results = self._CombineResults(results, requests, procedure)
+
+    self._RecordStats(self._stats, hosts, requests, results, procedure)
+
+    return results
 
 
 class _RpcClientBase:
   def __init__(self, resolver, encoder_fn, lock_monitor_cb=None,
-               _req_process_fn=None):
+               _req_process_fn=None, quorum=None):
     """Initializes this class.
 
     """
     proc = _RpcProcessor(resolver,
                          netutils.GetDaemonPort(constants.NODED),
                          lock_monitor_cb=lock_monitor_cb)
-    self._proc = compat.partial(proc, _req_process_fn=_req_process_fn)
+    self._proc = compat.partial(proc, _req_process_fn=_req_process_fn,
+                                quorum=quorum)
     self._encoder = compat.partial(self._EncodeArg, encoder_fn)
 
   @staticmethod
@@ -511,20 +958,43 @@ class _RpcClientBase:
     if len(args) != len(argdefs):
       raise errors.ProgrammerError("Number of passed arguments doesn't match")
 
+    node_independent = rpc_defs.IsNodeIndependent(argdefs, prep_fn)
+
     if prep_fn is None:
       prep_fn = lambda _, args: args
     assert callable(prep_fn)
 
-    # encode the arguments for each node individually, pass them and the node
-    # name to the prep_fn, and serialise its return value
-    encode_args_fn = lambda node: map(compat.partial(self._encoder, node),
-                                      zip(map(compat.snd, argdefs), args))
-    pnbody = dict(
-      (n,
-       serializer.DumpJson(prep_fn(n, encode_args_fn(n)),
-                           private_encoder=serializer.EncodeWithPrivateFields))
-      for n in node_list
-    )
+    # Arguments whose encoding doesn't depend on the node (e.g. files to be
+    # uploaded) are encoded only once per call and reused for all nodes
+    encoded_args = {}
+
+    def _EncodeArgs(node):
+      result = []
+      for (idx, arg) in enumerate(zip(map(compat.snd, argdefs), args)):
+        if arg[0] in rpc_defs.ED_NODE_INDEPENDENT:
+          try:
+            value = encoded_args[idx]
+          except KeyError:
+            value = encoded_args[idx] = self._encoder(node, arg)
+        else:
+          value = self._encoder(node, arg)
+        result.append(value)
+      return result
+
+    # encode the arguments for each node, pass them and the node name to the
+    # prep_fn, and serialise its return value
+    def _Serialize(node):
+      return serializer.DumpJson(
+        prep_fn(node, _EncodeArgs(node)),
+        private_encoder=serializer.EncodeWithPrivateFields,
+        compact=True)
+
+    if node_independent and node_list:
+      # The body is the same for all nodes, hence it's encoded only once and
+      # the same string is used for all requests
+      pnbody = dict.fromkeys(node_list, _Serialize(None))
+    else:
+      pnbody = dict((n, _Serialize(n)) for n in node_list)
 
     result = self._proc(node_list, procedure, pnbody, read_timeout,
                         req_resolver_opts)
@@ -586,6 +1056,16 @@ def _PrepareFinalizeExportDisks(_, snap_disks):
   return flat_disks
 
 
+def _CompressFiles(node, files):
+  """Compresses the contents of several files for transport over RPC.
+
+  @type files: list of tuples
+  @param files: List of (file name, content) tuples
+
+  """
+  return [(name, _Compress(node, data)) for (name, data) in files]
+
+
 def _EncodeBlockdevRename(_, value):
   """Encodes information for renaming block devices.
 
@@ -784,6 +1264,7 @@ _ENCODERS = {
   rpc_defs.ED_OBJECT_DICT: _ObjectToDict,
   rpc_defs.ED_OBJECT_DICT_LIST: _ObjectListToDict,
   rpc_defs.ED_COMPRESS: _Compress,
+  rpc_defs.ED_COMPRESS_FILES: _CompressFiles,
   rpc_defs.ED_FINALIZE_EXPORT_DISKS: _PrepareFinalizeExportDisks,
   rpc_defs.ED_BLOCKDEV_RENAME: _EncodeBlockdevRename,
   }
@@ -980,18 +1461,22 @@ class JobQueueRunner(_RpcClientBase, _generated_rpc.RpcClientJobQueue):
   """RPC wrappers for job queue.
 
   """
-  def __init__(self, _context, address_list):
+  def __init__(self, _context, address_list, quorum=None):
     """Initializes this class.
 
+    @type quorum: L{RpcQuorum} or None
+    @param quorum: If given, calls return once the quorum has been reached
+
     """
     if address_list is None:
-      resolver = compat.partial(_SsconfResolver, True)
+      resolver = compat.partial(_SsconfResolver, True,
+                                cache=_ssconf_resolver_cache)
     else:
       # Caller provided an address list
       resolver = _StaticResolver(address_list)
 
     _RpcClientBase.__init__(self, resolver, _ENCODERS.get,
-                            lock_monitor_cb=lambda _: None)
+                            lock_monitor_cb=lambda _: None, quorum=quorum)
     _generated_rpc.RpcClientJobQueue.__init__(self)
 
 
@@ -1009,8 +1494,9 @@ class BootstrapRunner(_RpcClientBase,
     # <http://www.logilab.org/ticket/36586> and
     # <http://www.logilab.org/ticket/35642>
     # pylint: disable=W0233
-    _RpcClientBase.__init__(self, compat.partial(_SsconfResolver, True),
-                            _ENCODERS.get)
+    resolver = compat.partial(_SsconfResolver, True,
+                              cache=_ssconf_resolver_cache)
+    _RpcClientBase.__init__(self, resolver, _ENCODERS.get)
     _generated_rpc.RpcClientBootstrap.__init__(self)
     _generated_rpc.RpcClientDnsOnly.__init__(self)
 
@@ -1023,8 +1509,9 @@ class DnsOnlyRunner(_RpcClientBase, _generated_rpc.RpcClientDnsOnly):
     """Initialize this class.
 
     """
-    _RpcClientBase.__init__(self, compat.partial(_SsconfResolver, False),
-                            _ENCODERS.get)
+    resolver = compat.partial(_SsconfResolver, False,
+                              cache=_ssconf_resolver_cache)
+    _RpcClientBase.__init__(self, resolver, _ENCODERS.get)
     _generated_rpc.RpcClientDnsOnly.__init__(self)
 
 
@@ -1040,7 +1527,8 @@ class ConfigRunner(_RpcClientBase, _generated_rpc.RpcClientConfig):
     lock_monitor_cb = None
 
     if address_list is None:
-      resolver = compat.partial(_SsconfResolver, True)
+      resolver = compat.partial(_SsconfResolver, True,
+                                cache=_ssconf_resolver_cache)
     else:
       # Caller provided an address list
       resolver = _StaticResolver(address_list)
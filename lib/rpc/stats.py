@@ -0,0 +1,308 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Statistics about node RPC calls.
+
+Statistics are collected in memory by each process and merged into a
+statistics file from time to time, as most processes making or serving RPC
+calls are short-lived.
+
+"""
+
+import logging
+import threading
+
+from ganeti import errors
+from ganeti import statsfile
+
+
+#: Upper bounds of the latency histogram buckets in seconds; the last bucket
+#: holds all larger values
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0]
+
+# Keys of the statistics data
+SK_PROCEDURES = "procedures"
+SK_NODES = "nodes"
+
+
+def _NewEntry():
+  """Returns a new, empty statistics entry.
+
+  """
+  return {
+    "count": 0,
+    "failed": 0,
+    "latency_sum": 0.0,
+    "latency_max": 0.0,
+    "latency_hist": [0] * (len(LATENCY_BUCKETS) + 1),
+    "req_bytes": 0,
+    "resp_bytes": 0,
+    "resp_raw_bytes": 0,
+    "encodings": {},
+    }
+
+
+def _NewStats():
+  """Returns new, empty statistics data.
+
+  """
+  return {
+    SK_PROCEDURES: {},
+    SK_NODES: {},
+    }
+
+
+def _GetBucket(latency):
+  """Returns the index of the histogram bucket for a latency.
+
+  """
+  for (idx, limit) in enumerate(LATENCY_BUCKETS):
+    if latency <= limit:
+      return idx
+
+  return len(LATENCY_BUCKETS)
+
+
+def _MergeEntry(target, source):
+  """Adds the values of a statistics entry to another one.
+
+  """
+  for name in ["count", "failed", "latency_sum", "req_bytes", "resp_bytes",
+               "resp_raw_bytes"]:
+    target[name] += source.get(name, 0)
+
+  target["latency_max"] = max(target["latency_max"],
+                              source.get("latency_max", 0.0))
+
+  hist = source.get("latency_hist", [])
+  if len(hist) == len(target["latency_hist"]):
+    target["latency_hist"] = map(sum, zip(target["latency_hist"], hist))
+
+  for (encoding, count) in source.get("encodings", {}).items():
+    target["encodings"][encoding] = \
+      target["encodings"].get(encoding, 0) + count
+
+
+def MergeStats(target, source):
+  """Merges statistics data into another.
+
+  @type target: dict
+  @param target: Statistics data to be updated
+  @type source: dict
+  @param source: Statistics data to be added
+
+  """
+  for group in [SK_PROCEDURES, SK_NODES]:
+    for (name, entry) in source.get(group, {}).items():
+      _MergeEntry(target[group].setdefault(name, _NewEntry()), entry)
+
+
+class RpcStats(object):
+  """Collects statistics about RPC calls in memory.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self._lock = threading.Lock()
+    self._data = _NewStats()
+
+  def Record(self, procedure, node, latency, req_size, resp_size,
+             resp_raw_size=None, encoding=None, failed=False):
+    """Records a single RPC call.
+
+    @type procedure: string
+    @param procedure: Name of the RPC procedure
+    @type node: string or None
+    @param node: Name of the remote node, C{None} if not applicable
+    @type latency: float or None
+    @param latency: Duration of the call in seconds
+    @type req_size: int
+    @param req_size: Size of the request body in bytes
+    @type resp_size: int
+    @param resp_size: Size of the response body as transferred
+    @type resp_raw_size: int or None
+    @param resp_raw_size: Size of the response body after decoding, if
+      different from C{resp_size}
+    @type encoding: string or None
+    @param encoding: Content coding used for the response
+    @type failed: bool
+    @param failed: Whether the call failed
+
+    """
+    if latency is None:
+      latency = 0.0
+
+    if resp_raw_size is None:
+      resp_raw_size = resp_size
+
+    self._lock.acquire()
+    try:
+      entries = [self._data[SK_PROCEDURES].setdefault(procedure, _NewEntry())]
+      if node is not None:
+        entries.append(self._data[SK_NODES].setdefault(node, _NewEntry()))
+
+      for entry in entries:
+        entry["count"] += 1
+        if failed:
+          entry["failed"] += 1
+        entry["latency_sum"] += latency
+        entry["latency_max"] = max(entry["latency_max"], latency)
+        entry["latency_hist"][_GetBucket(latency)] += 1
+        entry["req_bytes"] += req_size
+        entry["resp_bytes"] += resp_size
+        entry["resp_raw_bytes"] += resp_raw_size
+        if encoding:
+          entry["encodings"][encoding] = \
+            entry["encodings"].get(encoding, 0) + 1
+    finally:
+      self._lock.release()
+
+  def GetData(self):
+    """Returns a copy of the collected data.
+
+    @rtype: dict
+
+    """
+    self._lock.acquire()
+    try:
+      result = _NewStats()
+      MergeStats(result, self._data)
+      return result
+    finally:
+      self._lock.release()
+
+  def _Pop(self):
+    """Returns the collected data and resets the statistics.
+
+    """
+    self._lock.acquire()
+    try:
+      (data, self._data) = (self._data, _NewStats())
+      return data
+    finally:
+      self._lock.release()
+
+  def SaveTo(self, filename):
+    """Merges the collected statistics into a file and resets them.
+
+    Errors are logged, but not raised.
+
+    @type filename: string
+    @param filename: Path to statistics file
+
+    """
+    data = self._Pop()
+
+    if not (data[SK_PROCEDURES] or data[SK_NODES]):
+      return
+
+    try:
+      statsfile.MergeInto(filename, data, MergeStats)
+    except (EnvironmentError, ValueError, errors.LockError), err:
+      logging.warning("Can't write RPC statistics to %s: %s", filename, err)
+
+
+def ReadFile(filename):
+  """Reads statistics data from a file.
+
+  @type filename: string
+  @param filename: Path to statistics file
+  @rtype: dict
+  @return: Statistics data, empty if the file doesn't exist
+
+  """
+  return statsfile.Read(filename, MergeStats, _NewStats())
+
+
+def _EstimatePercentile(hist, fraction):
+  """Estimates a latency percentile from a histogram.
+
+  @return: Upper bound of the bucket containing the percentile, C{None} for
+    the last bucket or an empty histogram
+
+  """
+  total = sum(hist)
+  if not total:
+    return None
+
+  threshold = total * fraction
+  count = 0
+
+  for (idx, value) in enumerate(hist):
+    count += value
+    if count >= threshold:
+      if idx < len(LATENCY_BUCKETS):
+        return LATENCY_BUCKETS[idx]
+      break
+
+  return None
+
+
+def Summarize(entry):
+  """Computes summary values for a statistics entry.
+
+  @type entry: dict
+  @param entry: Statistics entry
+  @rtype: dict
+  @return: Dictionary with the keys C{count}, C{failed}, C{latency_avg},
+    C{latency_max}, C{latency_p50}, C{latency_p90}, C{latency_p99} (all
+    latencies in seconds, percentiles as upper bucket bounds or C{None} if
+    unknown), C{req_bytes}, C{resp_bytes}, C{compression_ratio} and
+    C{encodings}
+
+  """
+  count = entry["count"]
+  hist = entry["latency_hist"]
+
+  if count:
+    latency_avg = entry["latency_sum"] / count
+  else:
+    latency_avg = 0.0
+
+  if entry["resp_bytes"]:
+    ratio = float(entry["resp_raw_bytes"]) / entry["resp_bytes"]
+  else:
+    ratio = 1.0
+
+  return {
+    "count": count,
+    "failed": entry["failed"],
+    "latency_avg": latency_avg,
+    "latency_max": entry["latency_max"],
+    "latency_p50": _EstimatePercentile(hist, 0.5),
+    "latency_p90": _EstimatePercentile(hist, 0.9),
+    "latency_p99": _EstimatePercentile(hist, 0.99),
+    "req_bytes": entry["req_bytes"],
+    "resp_bytes": entry["resp_bytes"],
+    "compression_ratio": ratio,
+    "encodings": entry["encodings"],
+    }
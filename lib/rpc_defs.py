@@ -48,6 +48,7 @@ RPC definition fields:
 
 """
 
+from ganeti import compat
 from ganeti import constants
 from ganeti import utils
 from ganeti import objects
@@ -82,7 +83,37 @@ ACCEPT_OFFLINE_NODE = object()
  ED_MULTI_DISKS_DICT_DP,
  ED_SINGLE_DISK_DICT_DP,
  ED_NIC_DICT,
- ED_DEVICE_DICT) = range(1, 17)
+ ED_DEVICE_DICT,
+ ED_COMPRESS_FILES) = range(1, 18)
+
+#: Argument kinds whose encoding doesn't depend on the target node. Encoders
+#: for these kinds must ignore the node parameter. Calls without a custom body
+#: encoder whose arguments are all of these kinds (or not encoded at all) are
+#: serialized only once for all nodes.
+ED_NODE_INDEPENDENT = compat.UniqueFrozenset([
+  ED_OBJECT_DICT,
+  ED_OBJECT_DICT_LIST,
+  ED_FILE_DETAILS,
+  ED_FINALIZE_EXPORT_DISKS,
+  ED_COMPRESS,
+  ED_BLOCKDEV_RENAME,
+  ED_NIC_DICT,
+  ED_COMPRESS_FILES,
+  ])
+
+
+def IsNodeIndependent(argdefs, prep_fn):
+  """Checks whether the request body of a call is the same for all nodes.
+
+  @type argdefs: list of tuples
+  @param argdefs: Argument definitions
+  @param prep_fn: Custom body encoder or C{None}
+  @rtype: bool
+
+  """
+  return (prep_fn is None and
+          compat.all(argkind is None or argkind in ED_NODE_INDEPENDENT
+                     for (_, argkind, _) in argdefs))
 
 
 def _Prepare(calls):
@@ -637,6 +668,9 @@ CALLS = {
       ("file_name", None, None),
       ("content", ED_COMPRESS, None),
       ], None, None, "Update job queue file"),
+    ("jobqueue_update_many", MULTI, None, constants.RPC_TMO_URGENT, [
+      ("files", ED_COMPRESS_FILES, "List of (file name, content) tuples"),
+      ], None, None, "Update several job queue files"),
     ("jobqueue_purge", SINGLE, None, constants.RPC_TMO_NORMAL, [], None, None,
      "Purge job queue"),
     ("jobqueue_rename", MULTI, None, constants.RPC_TMO_URGENT, [
@@ -688,6 +722,10 @@ CALLS = {
       ("groups_cfg", None,
        "a dictionary mapping group uuids to their configuration"),
       ], None, None, "Request verification of given parameters"),
+    ("rpc_stats", MULTI, None, constants.RPC_TMO_URGENT, [], None, None,
+     "Returns statistics about the RPC calls handled by the node daemon"),
+    ("node_cache_stats", MULTI, None, constants.RPC_TMO_URGENT, [], None,
+     None, "Returns statistics about the node daemon's cache"),
     ]),
   "RpcClientConfig": _Prepare([
     ("upload_file", MULTI, None, constants.RPC_TMO_NORMAL, [
@@ -53,8 +53,11 @@ from ganeti import constants
 
 _RE_EOLSP = re.compile("[ \t]+$", re.MULTILINE)
 
+#: Separators used for compact output, without any whitespace
+_COMPACT_SEPARATORS = (",", ":")
 
-def DumpJson(data, private_encoder=None):
+
+def DumpJson(data, private_encoder=None, compact=False):
   """Serialize a given object.
 
   @param data: the data to serialize
@@ -62,11 +65,21 @@ def DumpJson(data, private_encoder=None):
   @param private_encoder: specify L{serializer.EncodeWithPrivateFields} if you
                           require the produced JSON to also contain private
                           parameters. Otherwise, they will encode to null.
+  @type compact: bool
+  @param compact: Whether to produce compact output, without any whitespace,
+                  post-processing or trailing newline; meant for messages
+                  exchanged between Ganeti daemons, the result is still valid
+                  JSON and can be read by any peer
 
   """
   if private_encoder is None:
     # Do not leak private fields by default.
     private_encoder = EncodeWithoutPrivateFields
+
+  if compact:
+    return simplejson.dumps(data, default=private_encoder,
+                            separators=_COMPACT_SEPARATORS)
+
   encoded = simplejson.dumps(data, default=private_encoder)
 
   txt = _RE_EOLSP.sub("", encoded)
@@ -76,10 +89,17 @@ def DumpJson(data, private_encoder=None):
   return txt
 
 
-def LoadJson(txt):
+def LoadJson(txt, private_paths=None):
   """Unserialize data from a string.
 
+  By default the whole decoded document is searched for private fields. Callers
+  knowing where private fields can appear should pass C{private_paths}, so that
+  only those subtrees are searched; see L{WrapPrivateValuesAt}.
+
   @param txt: the json-encoded form
+  @type private_paths: list of tuples or None
+  @param private_paths: Paths to the subtrees that can contain private fields;
+    an empty list means the document contains no private fields at all
   @return: the original data
   @raise JSONDecodeError: if L{txt} is not a valid JSON document
 
@@ -87,11 +107,73 @@ def LoadJson(txt):
   values = simplejson.loads(txt)
 
   # Hunt and seek for Private fields and wrap them.
-  WrapPrivateValues(values)
+  if private_paths is None:
+    WrapPrivateValues(values)
+  else:
+    WrapPrivateValuesAt(values, private_paths)
 
   return values
 
 
+#: Path component matching every item of a list or every value of a dict
+PATH_ANY = object()
+
+
+def _GetSubtrees(data, path):
+  """Returns all values found at a path in a JSON decoded structure.
+
+  @param data: the json-decoded value
+  @type path: tuple
+  @param path: Sequence of dictionary keys, list indices or L{PATH_ANY}
+  @rtype: list
+
+  """
+  found = [data]
+
+  for key in path:
+    children = []
+
+    for value in found:
+      if key is PATH_ANY:
+        if isinstance(value, dict):
+          children.extend(value.values())
+        elif isinstance(value, list):
+          children.extend(value)
+      elif isinstance(value, dict):
+        if key in value:
+          children.append(value[key])
+      elif isinstance(value, list) and isinstance(key, (int, long)):
+        if -len(value) <= key < len(value):
+          children.append(value[key])
+
+    found = children
+
+  return found
+
+
+def WrapPrivateValuesAt(json, paths):
+  """Wraps private values only within the given subtrees.
+
+  Each path names a container (dictionary or list) in which private fields can
+  appear, at any depth. Containers missing from the document are skipped.
+
+  >>> data = {"ops": [{"osparams_private": {"a": 1}}], "osparams_secret": {}}
+  >>> WrapPrivateValuesAt(data, [("ops", PATH_ANY)])
+  >>> type(data["ops"][0]["osparams_private"]).__name__
+  'PrivateDict'
+  >>> type(data["osparams_secret"]).__name__
+  'dict'
+
+  @param json: the json-decoded value to protect
+  @type paths: list of tuples
+  @param paths: Paths as accepted by L{LoadJson}
+
+  """
+  for path in paths:
+    for subtree in _GetSubtrees(json, path):
+      WrapPrivateValues(subtree)
+
+
 def WrapPrivateValues(json):
   """Crawl a JSON decoded structure for private values and wrap them.
 
@@ -43,6 +43,7 @@ import sys
 import logging
 import signal
 import codecs
+import time
 
 from optparse import OptionParser
 
@@ -57,14 +58,39 @@ from ganeti import utils
 from ganeti.storage import container
 from ganeti import serializer
 from ganeti import netutils
+from ganeti import nodecache
 from ganeti import pathutils
 from ganeti import ssconf
+from ganeti.rpc import stats as rpc_stats
 
 import ganeti.http.server # pylint: disable=W0611
 
 
 queue_lock = None
 
+#: Default minimum size and compression level for compressing RPC responses
+_RESPONSE_COMPRESSION_DEFAULT = (4096, http.DEFLATE_DEFAULT_LEVEL)
+
+#: Per-procedure settings for compressing RPC responses as tuples of minimum
+#: size and compression level; C{None} disables compression
+_RESPONSE_COMPRESSION = {
+  # Large and well compressible results, also requested from many nodes
+  "all_instances_info": (1024, http.DEFLATE_DEFAULT_LEVEL),
+  "blockdev_getmirrorstatus_multi": (1024, http.DEFLATE_DEFAULT_LEVEL),
+  "lv_list": (1024, http.DEFLATE_DEFAULT_LEVEL),
+  "node_verify": (1024, http.DEFLATE_DEFAULT_LEVEL),
+  "node_verify_light": (1024, http.DEFLATE_DEFAULT_LEVEL),
+
+  # Already compressed
+  "jobqueue_update": None,
+  "jobqueue_update_many": None,
+  "upload_file": None,
+  "upload_file_single": None,
+  }
+
+#: Interval in seconds for saving statistics collected while handling requests
+_STATS_SAVE_INTERVAL = 60.0
+
 
 def _extendReasonTrail(trail, source, reason=""):
   """Extend the reason trail with noded information
@@ -170,6 +196,8 @@ class NodeRequestHandler(http.server.HttpServerHandler):
   def __init__(self):
     http.server.HttpServerHandler.__init__(self)
     self.noded_pid = os.getpid()
+    self._stats = rpc_stats.RpcStats()
+    self._stats_saved = time.time()
 
   def HandleRequest(self, req):
     """Handle a request.
@@ -187,6 +215,8 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     if method is None:
       raise http.HttpNotFound()
 
+    start = time.time()
+
     try:
       result = (True, method(serializer.LoadJson(req.request_body)))
 
@@ -207,7 +237,70 @@ class NodeRequestHandler(http.server.HttpServerHandler):
       logging.exception("Error in RPC call")
       result = (False, "Error while executing backend function: %s" % str(err))
 
-    return serializer.DumpJson(result)
+    body = serializer.DumpJson(result, compact=True)
+    (encoding, encoded) = self._EncodeResponse(req, path, body)
+
+    self._stats.Record(path, None, time.time() - start,
+                       len(req.request_body or ""), len(encoded),
+                       resp_raw_size=len(body), encoding=encoding,
+                       failed=not (result and result[0]))
+
+    # Statistics are kept in memory, saving them for every request would
+    # serialize all requests on the statistics files
+    if time.time() - self._stats_saved >= _STATS_SAVE_INTERVAL:
+      self._SaveStats()
+
+    return encoded
+
+  def PreExit(self):
+    """Saves the collected statistics before the process exits.
+
+    """
+    self._SaveStats()
+
+  def _SaveStats(self):
+    """Merges the collected statistics into the statistics files.
+
+    """
+    self._stats_saved = time.time()
+    self._stats.SaveTo(pathutils.NODED_RPC_STATS_FILE)
+    nodecache.SaveStats()
+
+  @staticmethod
+  def _EncodeResponse(req, procedure, body):
+    """Compresses a response body if the client supports it.
+
+    @type procedure: string
+    @param procedure: Name of the RPC procedure
+    @type body: string
+    @param body: Serialized result
+    @rtype: tuple; (string or None, string)
+    @return: Content coding (C{None} if not compressed) and response body
+
+    """
+    settings = _RESPONSE_COMPRESSION.get(procedure,
+                                         _RESPONSE_COMPRESSION_DEFAULT)
+    if settings is None:
+      return (None, body)
+
+    (min_size, level) = settings
+
+    if len(body) < min_size or not req.request_headers:
+      return (None, body)
+
+    encoding = \
+      http.ChooseEncoding(req.request_headers.get(http.HTTP_ACCEPT_ENCODING))
+    if encoding is None:
+      return (None, body)
+
+    encoded = http.EncodeBody(encoding, body, level=level)
+
+    logging.debug("Encoded response to '%s' using %s, %s of %s bytes",
+                  procedure, encoding, len(encoded), len(body))
+
+    req.resp_headers[http.HTTP_CONTENT_ENCODING] = encoding
+
+    return (encoding, encoded)
 
   # the new block devices  --------------------------
 
@@ -978,6 +1071,24 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     """
     return constants.PROTOCOL_VERSION
 
+  def perspective_rpc_stats(self, params):
+    """Returns statistics about RPC calls handled by the node daemon.
+
+    Statistics of other processes are included once they have been saved.
+
+    """
+    self._SaveStats()
+    return rpc_stats.ReadFile(pathutils.NODED_RPC_STATS_FILE)
+
+  def perspective_node_cache_stats(self, params):
+    """Returns statistics about the node daemon's cache.
+
+    Statistics of other processes are included once they have been saved.
+
+    """
+    self._SaveStats()
+    return nodecache.ReadStats(pathutils.NODED_CACHE_STATS_FILE)
+
   @staticmethod
   def perspective_upload_file(params):
     """Upload a file.
@@ -1172,6 +1283,16 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     (file_name, content) = params
     return backend.JobQueueUpdate(file_name, content)
 
+  @staticmethod
+  @_RequireJobQueueLock
+  def perspective_jobqueue_update_many(params):
+    """Update several job queue files.
+
+    """
+    (files, ) = params
+    for (file_name, content) in files:
+      backend.JobQueueUpdate(file_name, content)
+
   @staticmethod
   @_RequireJobQueueLock
   def perspective_jobqueue_purge(params):
@@ -1283,7 +1404,7 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     return backend.CleanupImportExport(params[0])
 
 
-def CheckNoded(_, args):
+def CheckNoded(options, args):
   """Initial checks whether to run or exit with a failure.
 
   """
@@ -1298,6 +1419,12 @@ def CheckNoded(_, args):
                           " of the Python installation. Is your installation"
                           " complete/correct? Aborting.")
     sys.exit(constants.EXIT_FAILURE)
+  if options.workers < 0:
+    print >> sys.stderr, "The number of workers can't be negative"
+    sys.exit(constants.EXIT_FAILURE)
+  if options.request_timeout is not None and options.request_timeout <= 0:
+    print >> sys.stderr, "The request timeout must be positive"
+    sys.exit(constants.EXIT_FAILURE)
 
 
 def SSLVerifyPeer(conn, cert, errnum, errdepth, ok):
@@ -1401,6 +1528,10 @@ def PrepNoded(options, _):
     # startup of the whole node daemon because of this
     logging.critical("Can't init/verify the queue, proceeding anyway: %s", err)
 
+  if options.workers:
+    # Only worker processes live long enough for cached values to be reused
+    nodecache.Enable()
+
   handler = NodeRequestHandler()
 
   mainloop = daemon.Mainloop()
@@ -1408,7 +1539,9 @@ def PrepNoded(options, _):
     http.server.HttpServer(mainloop, options.bind_address, options.port,
                            handler, ssl_params=ssl_params, ssl_verify_peer=True,
                            request_executor_class=request_executor_class,
-                           ssl_verify_callback=SSLVerifyPeer)
+                           ssl_verify_callback=SSLVerifyPeer,
+                           workers=options.workers,
+                           request_timeout=options.request_timeout)
   server.Start()
 
   return (mainloop, server)
@@ -1437,6 +1570,13 @@ def Main():
   parser.add_option("--no-mlock", dest="mlock",
                     help="Do not mlock the node memory in ram",
                     default=True, action="store_false")
+  parser.add_option("--workers", dest="workers", type="int", default=0,
+                    help=("Number of pre-forked processes handling requests"
+                          " (0 to fork a new process for every request)"))
+  parser.add_option("--request-timeout", dest="request_timeout", type="int",
+                    default=None,
+                    help=("Kill processes handling a request for longer than"
+                          " this many seconds"))
 
   daemon.GenericMain(constants.NODED, parser, CheckNoded, PrepNoded, ExecNoded,
                      default_ssl_cert=pathutils.NODED_CERT_FILE,
@@ -54,7 +54,6 @@ from ganeti import daemon
 from ganeti import ssconf
 import ganeti.rpc.errors as rpcerr
 from ganeti import serializer
-from ganeti import compat
 from ganeti import utils
 from ganeti import pathutils
 from ganeti.rapi import connector
@@ -318,6 +317,14 @@ def CheckRapi(options, args):
                           sys.argv[0])
     sys.exit(constants.EXIT_FAILURE)
 
+  if options.workers < 0:
+    print >> sys.stderr, "The number of workers can't be negative"
+    sys.exit(constants.EXIT_FAILURE)
+
+  if options.request_timeout is not None and options.request_timeout <= 0:
+    print >> sys.stderr, "The request timeout must be positive"
+    sys.exit(constants.EXIT_FAILURE)
+
   ssconf.CheckMaster(options.debug)
 
   # Read SSL certificate (this is a little hackish to read the cert as root)
@@ -338,16 +345,24 @@ def PrepRapi(options, _):
 
   handler = RemoteApiHandler(users.Get, options.reqauth)
 
+  server = \
+    http.server.HttpServer(mainloop, options.bind_address, options.port,
+                           handler,
+                           ssl_params=options.ssl_params, ssl_verify_peer=False,
+                           workers=options.workers,
+                           request_timeout=options.request_timeout)
+
+  def _ReloadUsers():
+    users.Load(pathutils.RAPI_USERS_FILE)
+
+    # Pre-forked workers still use the users loaded when they were started
+    server.RecycleWorkers()
+
   # Setup file watcher (it'll be driven by asyncore)
-  SetupFileWatcher(pathutils.RAPI_USERS_FILE,
-                   compat.partial(users.Load, pathutils.RAPI_USERS_FILE))
+  SetupFileWatcher(pathutils.RAPI_USERS_FILE, _ReloadUsers)
 
   users.Load(pathutils.RAPI_USERS_FILE)
 
-  server = \
-    http.server.HttpServer(mainloop, options.bind_address, options.port,
-                           handler,
-                           ssl_params=options.ssl_params, ssl_verify_peer=False)
   server.Start()
 
   return (mainloop, server)
@@ -377,6 +392,13 @@ def Main():
                     default=False, action="store_true",
                     help=("Disable anonymous HTTP requests and require"
                           " authentication"))
+  parser.add_option("--workers", dest="workers", type="int", default=0,
+                    help=("Number of pre-forked processes handling requests"
+                          " (0 to fork a new process for every request)"))
+  parser.add_option("--request-timeout", dest="request_timeout", type="int",
+                    default=None,
+                    help=("Kill processes handling a request for longer than"
+                          " this many seconds"))
 
   daemon.GenericMain(constants.RAPI, parser, CheckRapi, PrepRapi, ExecRapi,
                      default_ssl_cert=pathutils.RAPI_CERT_FILE,
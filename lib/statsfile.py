@@ -0,0 +1,117 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Statistics files shared by several processes.
+
+Processes collect statistics in memory and merge them into a file from time
+to time. The merge is done with the file locked, so that no process's
+contribution is lost.
+
+"""
+
+import errno
+
+from ganeti import serializer
+from ganeti import utils
+
+
+#: Timeout for locking a statistics file
+_LOCK_TIMEOUT = 10
+
+
+def MergeInto(filename, data, merge_fn):
+  """Merges statistics into a file.
+
+  The file is created if it doesn't exist.
+
+  @type filename: string
+  @param filename: Path to statistics file
+  @param data: Statistics to be added
+  @type merge_fn: callable
+  @param merge_fn: Function adding the statistics given as its second
+    argument to those given as its first argument
+  @raise errors.LockError: if the file can't be locked in time
+
+  """
+  lock = utils.FileLock.Open(filename)
+  try:
+    lock.Exclusive(blocking=True, timeout=_LOCK_TIMEOUT)
+
+    fh = lock.fd
+    fh.seek(0)
+    content = fh.read()
+
+    if content:
+      result = serializer.LoadJson(content, private_paths=[])
+      merge_fn(result, data)
+    else:
+      result = data
+
+    fh.seek(0)
+    fh.truncate()
+    fh.write(serializer.DumpJson(result))
+    fh.flush()
+  finally:
+    lock.Close()
+
+
+def Read(filename, merge_fn, result, _lock_timeout=_LOCK_TIMEOUT):
+  """Reads statistics from a file.
+
+  The file is locked in shared mode, as L{MergeInto} rewrites it in place.
+
+  @type filename: string
+  @param filename: Path to statistics file
+  @type merge_fn: callable
+  @param merge_fn: Function adding the statistics given as its second
+    argument to those given as its first argument
+  @param result: Statistics the file's contents are added to
+  @return: C{result}, unchanged if the file doesn't exist or is empty
+  @raise errors.LockError: if the file can't be locked in time
+
+  """
+  try:
+    fh = open(filename, "r")
+  except EnvironmentError, err:
+    if err.errno != errno.ENOENT:
+      raise
+    return result
+
+  lock = utils.FileLock(fh, filename)
+  try:
+    lock.Shared(blocking=True, timeout=_lock_timeout)
+    content = fh.read()
+  finally:
+    lock.Close()
+
+  if content:
+    merge_fn(result, serializer.LoadJson(content, private_paths=[]))
+
+  return result
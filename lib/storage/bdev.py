@@ -35,6 +35,7 @@
 import re
 import stat
 import os
+import sys
 import logging
 import math
 
@@ -45,10 +46,6 @@ from ganeti import objects
 from ganeti import compat
 from ganeti import serializer
 from ganeti.storage import base
-from ganeti.storage import drbd
-from ganeti.storage.filestorage import FileStorage
-from ganeti.storage.gluster import GlusterStorage
-from ganeti.storage.extstorage import ExtStorageDevice
 
 
 class RbdShowmappedJsonError(Exception):
@@ -1295,6 +1292,25 @@ def _VerifyDiskType(dev_type):
     raise errors.ProgrammerError("Invalid block device type '%s'" % dev_type)
 
 
+def _GetDeviceClass(dev_type):
+  """Returns the class implementing a disk type.
+
+  Classes defined in other modules are imported on first use.
+
+  @type dev_type: string
+  @param dev_type: the disk type
+  @rtype: class
+
+  """
+  _VerifyDiskType(dev_type)
+  dev_class = DEV_MAP[dev_type]
+  if isinstance(dev_class, tuple):
+    (module_name, class_name) = dev_class
+    __import__(module_name)
+    dev_class = getattr(sys.modules[module_name], class_name)
+  return dev_class
+
+
 def _VerifyDiskParams(disk):
   """Verifies if all disk parameters are set.
 
@@ -1318,10 +1334,10 @@ def FindDevice(disk, children):
                   represented by the disk parameter
 
   """
-  _VerifyDiskType(disk.dev_type)
-  device = DEV_MAP[disk.dev_type](disk.logical_id, children, disk.size,
-                                  disk.params, disk.dynamic_params,
-                                  disk.name, disk.uuid)
+  dev_class = _GetDeviceClass(disk.dev_type)
+  device = dev_class(disk.logical_id, children, disk.size,
+                     disk.params, disk.dynamic_params,
+                     disk.name, disk.uuid)
   if not device.attached:
     return None
   return device
@@ -1340,11 +1356,11 @@ def Assemble(disk, children):
                   represented by the disk parameter
 
   """
-  _VerifyDiskType(disk.dev_type)
+  dev_class = _GetDeviceClass(disk.dev_type)
   _VerifyDiskParams(disk)
-  device = DEV_MAP[disk.dev_type](disk.logical_id, children, disk.size,
-                                  disk.params, disk.dynamic_params,
-                                  disk.name, disk.uuid)
+  device = dev_class(disk.logical_id, children, disk.size,
+                     disk.params, disk.dynamic_params,
+                     disk.name, disk.uuid)
   device.Assemble()
   return device
 
@@ -1363,25 +1379,28 @@ def Create(disk, children, excl_stor):
   @return: the created device, or C{None} in case of an error
 
   """
-  _VerifyDiskType(disk.dev_type)
+  dev_class = _GetDeviceClass(disk.dev_type)
   _VerifyDiskParams(disk)
-  device = DEV_MAP[disk.dev_type].Create(disk.logical_id, children, disk.size,
-                                         disk.spindles, disk.params, excl_stor,
-                                         disk.dynamic_params,
-                                         disk.name, disk.uuid)
+  device = dev_class.Create(disk.logical_id, children, disk.size,
+                            disk.spindles, disk.params, excl_stor,
+                            disk.dynamic_params,
+                            disk.name, disk.uuid)
   return device
 
 # Please keep this at the bottom of the file for visibility.
 DEV_MAP = {
   constants.DT_PLAIN: LogicalVolume,
-  constants.DT_DRBD8: drbd.DRBD8Dev,
+  constants.DT_DRBD8: ("ganeti.storage.drbd", "DRBD8Dev"),
   constants.DT_BLOCK: PersistentBlockDevice,
   constants.DT_RBD: RADOSBlockDevice,
-  constants.DT_EXT: ExtStorageDevice,
-  constants.DT_FILE: FileStorage,
-  constants.DT_SHARED_FILE: FileStorage,
-  constants.DT_GLUSTER: GlusterStorage,
+  constants.DT_EXT: ("ganeti.storage.extstorage", "ExtStorageDevice"),
+  constants.DT_FILE: ("ganeti.storage.filestorage", "FileStorage"),
+  constants.DT_SHARED_FILE: ("ganeti.storage.filestorage", "FileStorage"),
+  constants.DT_GLUSTER: ("ganeti.storage.gluster", "GlusterStorage"),
 }
 """Map disk types to disk type classes.
 
+Classes defined in other modules are given by their module and class names,
+see L{_GetDeviceClass}.
+
 @see: L{Assemble}, L{FindDevice}, L{Create}.""" # pylint: disable=W0105
@@ -31,6 +31,7 @@
 
 """
 
+import errno
 import os
 import os.path
 import optparse
@@ -49,12 +50,14 @@ from ganeti import compat
 
 (DIR,
  FILE,
- QUEUE_DIR) = range(1, 4)
+ QUEUE_DIR,
+ SHARED_FILE) = range(1, 5)
 
 ALL_TYPES = compat.UniqueFrozenset([
   DIR,
   FILE,
   QUEUE_DIR,
+  SHARED_FILE,
   ])
 
 
@@ -100,6 +103,29 @@ def EnsureQueueDir(path, mode, uid, gid):
                               gid=gid)
 
 
+def EnsureSharedFile(path, mode, uid, gid):
+  """Creates a file written to by processes of several users.
+
+  The file is created empty if it doesn't exist, so that it doesn't get
+  the owner and permissions of whichever process happens to write it first.
+
+  @param path: File path
+  @param mode: Wanted file mode
+  @param uid: Wanted user ID
+  @param gid: Wanted group ID
+
+  """
+  try:
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+  except EnvironmentError, err:
+    if err.errno != errno.EEXIST:
+      raise errors.GenericError("Can't create %s: %s" % (path, err))
+  else:
+    os.close(fd)
+
+  utils.EnforcePermission(path, mode, uid=uid, gid=gid)
+
+
 def ProcessPath(path):
   """Processes a path component.
 
@@ -110,13 +136,15 @@ def ProcessPath(path):
 
   assert pathtype in ALL_TYPES
 
-  if pathtype in (DIR, QUEUE_DIR):
+  if pathtype in (DIR, QUEUE_DIR, SHARED_FILE):
     # No additional parameters
     assert len(path) == 5
     if pathtype == DIR:
       utils.MakeDirWithPerm(pathname, mode, uid, gid)
     elif pathtype == QUEUE_DIR:
       EnsureQueueDir(pathname, mode, uid, gid)
+    elif pathtype == SHARED_FILE:
+      EnsureSharedFile(pathname, mode, uid, gid)
   elif pathtype == FILE:
     (must_exist, ) = path[5:]
     utils.EnforcePermission(pathname, mode, uid=uid, gid=gid,
@@ -189,6 +217,9 @@ def GetPaths():
     (pathutils.RAPI_USERS_FILE, FILE, 0640,
      getent.rapi_uid, getent.masterd_gid, False),
     (pathutils.RUN_DIR, DIR, 0775, getent.masterd_uid, getent.daemons_gid),
+    # Written by command line tools as well as job processes
+    (pathutils.RPC_CLIENT_STATS_FILE, SHARED_FILE, 0660,
+     getent.masterd_uid, getent.daemons_gid),
     (pathutils.SOCKET_DIR, DIR, 0770, getent.masterd_uid, getent.daemons_gid),
     (pathutils.MASTER_SOCKET, FILE, 0660,
      getent.masterd_uid, getent.daemons_gid, False),
@@ -196,6 +227,8 @@ def GetPaths():
      getent.luxid_uid, getent.daemons_gid, False),
     (pathutils.BDEV_CACHE_DIR, DIR, 0755,
      getent.noded_uid, getent.masterd_gid),
+    (pathutils.NODED_CACHE_DIR, DIR, 0755,
+     getent.noded_uid, getent.masterd_gid),
     (pathutils.UIDPOOL_LOCKDIR, DIR, 0750,
      getent.noded_uid, getent.masterd_gid),
     (pathutils.DISK_LINKS_DIR, DIR, 0755,
@@ -40,6 +40,14 @@ import ganeti.rpc.client as cl
 import ganeti.rpc.stub.wconfd as stub
 from ganeti.rpc.transport import Transport
 from ganeti.rpc import errors
+from ganeti import serializer
+
+
+#: The only configuration objects carrying private OS parameters
+CONFIG_PRIVATE_PATHS = [
+  ("cluster", ),
+  ("instances", serializer.PATH_ANY),
+  ]
 
 
 class Client(cl.AbstractStubClient, stub.ClientRpcStub):
@@ -51,6 +59,13 @@ class Client(cl.AbstractStubClient, stub.ClientRpcStub):
   implements data serialization/deserialization.
 
   """
+  _PRIVATE_PATHS = {
+    "readConfig": CONFIG_PRIVATE_PATHS,
+    "lockConfig": CONFIG_PRIVATE_PATHS,
+    # the configuration is the second item of the result
+    "lockConfigIfChanged": [(1, ) + path for path in CONFIG_PRIVATE_PATHS],
+    }
+
   def __init__(self, timeouts=None, transport=Transport, allow_non_master=None):
     """Constructor for the Client class.
 
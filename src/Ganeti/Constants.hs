@@ -4325,6 +4325,12 @@ luxidRetryForkCount = 5
 luxidRetryForkStepUS :: Int
 luxidRetryForkStepUS = 500000
 
+-- | The number of job processes luxid keeps started in advance, waiting
+-- for jobs. Such a process has already loaded the Python code and
+-- connected to the configuration, so a job assigned to it starts faster.
+luxidJobExecutorPoolSize :: Int
+luxidJobExecutorPoolSize = 2
+
 -- * Luxid job death testing
 
 -- | The number of attempts to prove that a job is dead after sending it a
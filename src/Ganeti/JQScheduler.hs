@@ -77,6 +77,7 @@ import Ganeti.Lens hiding (chosen)
 import Ganeti.Logging
 import Ganeti.Objects
 import Ganeti.Path
+import qualified Ganeti.Query.Exec as Exec
 import Ganeti.Types
 import Ganeti.Utils
 import Ganeti.Utils.Livelock
@@ -98,6 +99,7 @@ data JQStatus = JQStatus
   , jqConfig :: IORef (Result ConfigData)
   , jqLivelock :: Livelock
   , jqForkLock :: Lock
+  , jqExecutors :: Exec.JobExecutorPool
   }
 
 
@@ -106,8 +108,9 @@ emptyJQStatus config = do
   jqJ <- newIORef Queue { qEnqueued = [], qRunning = [], qManipulated = [] }
   (_, livelock) <- mkLivelockFile C.luxiLivelockPrefix
   forkLock <- newLock
+  executors <- Exec.newJobExecutorPool C.luxidJobExecutorPoolSize
   return JQStatus { jqJobs = jqJ, jqConfig = config, jqLivelock = livelock
-                  , jqForkLock = forkLock }
+                  , jqForkLock = forkLock, jqExecutors = executors }
 
 -- | Apply a function on the running jobs.
 onRunningJobs :: ([JobWithStat] -> [JobWithStat]) -> Queue -> Queue
@@ -415,7 +418,8 @@ scheduleSomeJobs qstate = do
       mapM_ (attachWatcher qstate) chosen
 
       -- Start the jobs.
-      result <- JQ.startJobs (jqLivelock qstate) (jqForkLock qstate) jobs
+      result <- JQ.startJobs (jqLivelock qstate) (jqForkLock qstate)
+                             (jqExecutors qstate) jobs
       let badWith (x, Bad y) = Just (x, y)
           badWith _          = Nothing
       let failed = mapMaybe badWith $ zip chosen result
@@ -522,6 +526,7 @@ initJQScheduler qstate = do
   modifyJobs qstate (onQueuedJobs (++ queued) . onRunningJobs (++ running))
   jqjobs <- readIORef (jqJobs qstate)
   logInfo $ showQueue jqjobs
+  Exec.refillJobExecutorPool (jqForkLock qstate) (jqExecutors qstate)
   scheduleSomeJobs qstate
   logInfo "Starting time-based job queue watcher"
   _ <- forkIO $ onTimeWatcher qstate
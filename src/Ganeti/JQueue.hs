@@ -60,6 +60,7 @@ module Ganeti.JQueue
     , determineJobDirectories
     , getJobIDs
     , sortJobIDs
+    , decodeJobFile
     , loadJobFromDisk
     , noSuchJob
     , readSerialFromDisk
@@ -122,7 +123,8 @@ import Ganeti.OpCodes.Lens (metaParamsL, opReasonL)
 import Ganeti.Path
 import Ganeti.Query.Exec as Exec
 import Ganeti.Rpc (executeRpcCall, ERpcError, logRpcErrors,
-                   RpcCallJobqueueUpdate(..), RpcCallJobqueueRename(..))
+                   RpcCallJobqueueUpdate(..), RpcCallJobqueueUpdateMany(..),
+                   RpcCallJobqueueRename(..))
 import Ganeti.Runtime (GanetiDaemon(..), GanetiGroup(..), MiscGroup(..))
 import Ganeti.Types
 import Ganeti.Utils
@@ -444,6 +446,37 @@ readJobDataFromDisk rootdir archived jid = do
 noSuchJob :: Result (QueuedJob, Bool)
 noSuchJob = Bad "Can't load job file"
 
+-- | Parses the contents of a job file: the serialized job, followed by
+-- the journal records appended since the job was last written in full,
+-- one per line (see @AppendJobLogUnlocked@ in @lib/jqueue@). The records
+-- are replayed on the job; a last record that isn't valid JSON, as left by
+-- an interrupted append, is ignored.
+decodeJobFile :: String -> Text.JSON.Result QueuedJob
+decodeJobFile str =
+  case filter (not . null) (lines str) of
+    [] -> Text.JSON.Error "Empty job file"
+    header:records -> do
+      job <- Text.JSON.decode header
+      values <- sequence . dropIncomplete $ map Text.JSON.decode records
+      entries <- mapM decodeJournalRecord values
+      let addLog idx op =
+            op { qoLog = qoLog op ++ [ e | (i, e) <- entries, i == idx ] }
+      return job { qjOps = zipWith addLog [0..] (qjOps job) }
+  where dropIncomplete rs = case reverse rs of
+                              Text.JSON.Error _ : rest -> reverse rest
+                              _ -> rs
+
+-- | Decodes a journal record of a job file, i.e., a log entry together
+-- with the index of the opcode it belongs to.
+decodeJournalRecord :: JSValue
+                    -> Text.JSON.Result
+                         (Int, (Int, Timestamp, ELogType, JSValue))
+decodeJournalRecord value = do
+  (kind, idx, entry) <- Text.JSON.readJSON value
+  if kind == "log"
+    then return (idx, entry)
+    else Text.JSON.Error $ "Unknown journal record kind " ++ kind
+
 -- | Loads a job from disk.
 loadJobFromDisk :: FilePath -> Bool -> JobId -> IO (Result (QueuedJob, Bool))
 loadJobFromDisk rootdir archived jid = do
@@ -455,7 +488,7 @@ loadJobFromDisk rootdir archived jid = do
              Nothing -> noSuchJob
              Just (str, arch) ->
                liftM (\qj -> (qj, arch)) .
-               fromJResult "Parsing job file" $ Text.JSON.decode str
+               fromJResult "Parsing job file" $ decodeJobFile str
 
 -- | Write a job to disk.
 writeJobToDisk :: FilePath -> QueuedJob -> IO (Result ())
@@ -477,10 +510,26 @@ replicateJob rootdir mastercandidates job = do
   _ <- logRpcErrors result
   return result
 
--- | Replicate many jobs to all master candidates.
+-- | Replicate many jobs to all master candidates. Several jobs are sent
+-- in a single call to each node; nodes failing that call are sent the
+-- jobs one by one.
 replicateManyJobs :: FilePath -> [Node] -> [QueuedJob] -> IO ()
-replicateManyJobs rootdir mastercandidates =
-  mapM_ (replicateJob rootdir mastercandidates)
+replicateManyJobs _ _ [] = return ()
+replicateManyJobs rootdir mastercandidates [job] =
+  void $ replicateJob rootdir mastercandidates job
+replicateManyJobs rootdir mastercandidates jobs = do
+  files <- forM jobs $ \job -> do
+    filename' <- makeVirtualPath . liveJobFile rootdir $ qjId job
+    return (filename', Text.JSON.encode $ Text.JSON.showJSON job)
+  callresult <- executeRpcCall mastercandidates
+                  $ RpcCallJobqueueUpdateMany files
+  let failed = [node | (node, Left _) <- callresult]
+  void . logRpcErrors $ map (second (() <$)) callresult
+  -- Nodes not (yet) supporting the batched call, e.g., during an upgrade,
+  -- get the files one by one
+  unless (null failed) . forM_ files $ \(filename', content) -> do
+    single <- executeRpcCall failed $ RpcCallJobqueueUpdate filename' content
+    void . logRpcErrors $ map (second (() <$)) single
 
 -- | Writes a job to a file and replicates it to master candidates.
 writeAndReplicateJob :: (Error e)
@@ -538,18 +587,21 @@ isQueueOpen = liftM not (jobQueueDrainFile >>= doesFileExist)
 -- | Start enqueued jobs by executing the Python code.
 startJobs :: Livelock -- ^ Luxi's livelock path
           -> Lock -- ^ lock for forking new processes
+          -> Exec.JobExecutorPool -- ^ processes waiting for jobs
           -> [QueuedJob] -- ^ the list of jobs to start
           -> IO [ErrorResult QueuedJob]
-startJobs luxiLivelock forkLock jobs = do
+startJobs luxiLivelock forkLock pool jobs = do
   qdir <- queueDir
   let updateJob job llfile =
         void . mkResultT . writeJobToDisk qdir
           $ job { qjLivelock = Just llfile }
-  let runJob job = withLock forkLock $ do
-        (llfile, _) <- Exec.forkJobProcess job luxiLivelock
+  let runJob job = do
+        (llfile, _) <- Exec.forkJobProcess job luxiLivelock forkLock pool
                                            (updateJob job)
         return $ job { qjLivelock = Just llfile }
-  mapM (runResultT . runJob) jobs
+  results <- mapM (runResultT . runJob) jobs
+  unless (null jobs) $ Exec.refillJobExecutorPool forkLock pool
+  return results
 
 -- | Try to prove that a queued job is dead. This function needs to know
 -- the livelock of the caller (i.e., luxid) to avoid considering a job dead
@@ -2,27 +2,34 @@
 
 The protocol works as follows (MP = master process, FP = forked process):
 
-* MP sets its own livelock as the livelock of the job to be executed.
-
 * FP creates its own lock file and sends its name to the MP.
 
-* MP updates the lock file name in the job file and confirms the FP it can
-  start.
+* MP confirms the FP it can start.
 
 * FP calls 'executeFile' and replaces the process with a Python process
 
 * FP sends an empty message to the MP to signal it's ready to receive
   the necessary information.
 
-* MP sends the FP its job ID.
+* MP sends the FP its live lock file name (since it was known only to the
+  Haskell process, but not the Python process).
+
+* FP prepares everything not depending on its job, e.g., the connection
+  to WConfd, and sends an empty message to the MP again.
+
+* Once the MP has a job for the FP, it sets the lock file of the FP as the
+  livelock of the job and sends the FP its job ID. Until then, the FP waits.
+  To start jobs faster, the MP keeps a pool of FPs waiting for jobs.
 
 * FP sends an empty message to the MP again.
 
-* MP sends the FP its live lock file name (since it was known only to the
-  Haskell process, but not the Python process).
+* MP sends the FP the secret parameters of the job.
 
 * Both MP and FP close the communication channel.
 
+For a job started in a newly forked FP, the MP sets its own livelock as the
+livelock of the job before forking.
+
  -}
 
 {-
@@ -57,15 +64,19 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 module Ganeti.Query.Exec
   ( isForkSupported
+  , JobExecutorPool
+  , newJobExecutorPool
+  , refillJobExecutorPool
   , forkJobProcess
   ) where
 
-import Control.Concurrent (rtsSupportsBoundThreads)
+import Control.Concurrent (forkIO, rtsSupportsBoundThreads)
 import Control.Concurrent.Lifted (threadDelay)
 import Control.Exception (finally)
 import Control.Monad
 import Control.Monad.Error
 import Data.Functor
+import Data.IORef
 import qualified Data.Map as M
 import Data.Maybe (listToMaybe, mapMaybe)
 import System.Directory (getDirectoryContents)
@@ -92,6 +103,7 @@ import Ganeti.Types
 import Ganeti.UDSServer
 import Ganeti.Utils
 import Ganeti.Utils.Monad
+import Ganeti.Utils.MVarLock
 import Ganeti.Utils.Random (delayRandom)
 
 isForkSupported :: IO Bool
@@ -127,9 +139,10 @@ rethrowAnnotateIOError desc =
   modifyIOError (\e -> annotateIOError e desc Nothing Nothing)
 
 -- Code that is executed in a @fork@-ed process and that the replaces iteself
--- with the actual job process
-runJobProcess :: JobId -> Client -> IO ()
-runJobProcess jid s = withErrorLogAt CRITICAL (show jid) $
+-- with the actual job process. The job ID is known only if the process
+-- is forked for a particular job.
+runJobProcess :: Maybe JobId -> Client -> IO ()
+runJobProcess mjid s = withErrorLogAt CRITICAL (show mjid) $
   do
     -- Close the standard error to prevent anything being written there
     -- (for example by exceptions when closing unneeded FDs).
@@ -141,11 +154,16 @@ runJobProcess jid s = withErrorLogAt CRITICAL (show jid) $
     -- Later we might direct them to an appropriate file.
     let logLater _ = return ()
 
-    logLater $ "Forking a new process for job " ++ show (fromJobId jid)
+    logLater $ "Forking a new process for job " ++ show mjid
 
     -- Create a livelock file for the job
     (TOD ts _) <- getClockTime
-    lockfile <- P.livelockFile $ printf "job_%06d_%d" (fromJobId jid) ts
+    lockname <- case mjid of
+      Just jid -> return $ printf "job_%06d_%d" (fromJobId jid) ts
+      Nothing -> do
+        pid <- getProcessID
+        return $ printf "job_pool_%d_%d" (fromIntegral pid :: Int) ts
+    lockfile <- P.livelockFile lockname
 
     -- Lock the livelock file
     logLater $ "Locking livelock file " ++ show lockfile
@@ -173,9 +191,9 @@ runJobProcess jid s = withErrorLogAt CRITICAL (show jid) $
     logLater $ "Closing every superfluous file descriptor: " ++ show fds
     mapM_ (tryIOError . closeFd) fds
 
-    -- the master process will send the job id and the livelock file name
+    -- the master process will send the livelock file name and the job id
     -- using the same protocol to the job process
-    -- we pass the job id as the first argument to the process;
+    -- we pass the job id, if known, as the first argument to the process;
     -- while the process never uses it, it's very convenient when listing
     -- job processes
     use_debug <- isDebugMode
@@ -186,8 +204,8 @@ runJobProcess jid s = withErrorLogAt CRITICAL (show jid) $
     execPy <- P.jqueueExecutorPy
     logLater $ "Executing " ++ AC.pythonPath ++ " " ++ execPy
                ++ " with PYTHONPATH=" ++ AC.versionedsharedir
-    () <- executeFile AC.pythonPath True [execPy, show (fromJobId jid)]
-                      (Just $ M.toList env)
+    let args = execPy : maybe [] (\jid -> [show (fromJobId jid)]) mjid
+    () <- executeFile AC.pythonPath True args (Just $ M.toList env)
 
     failError $ "Failed to execute " ++ AC.pythonPath ++ " " ++ execPy
 
@@ -222,88 +240,245 @@ forkWithPipe conf childAction = do
            $ closeClient child
   return (pid, master)
 
--- | Forks the job process and starts processing of the given job.
--- Returns the livelock of the job and its process ID.
-forkJobProcess :: (Error e, Show e)
-               => QueuedJob -- ^ a job to process
-               -> FilePath  -- ^ the daemons own livelock file
-               -> (FilePath -> ResultT e IO ())
-                  -- ^ a callback function to update the livelock file
-                  -- and process id in the job file
-               -> ResultT e IO (FilePath, ProcessID)
-forkJobProcess job luxiLivelock update = do
-  let jidStr = show . fromJobId . qjId $ job
-
-  -- Retrieve secret parameters if present
-  let secretParams = encodeStrict . filterSecretParameters . qjOps $ job
-
-  logDebug $ "Setting the lockfile temporarily to " ++ luxiLivelock
-             ++ " for job " ++ jidStr
-  update luxiLivelock
+-- | A forked job process running the Python code, which has been given
+-- its livelock and waits for a job.
+data JobExecutor = JobExecutor
+  { jeProcessId :: ProcessID -- ^ the ID of the process
+  , jeLivelock  :: FilePath  -- ^ the livelock file of the process
+  , jeClient    :: Client    -- ^ our end of the pipe to the process
+  }
+
+-- | Statistics about starting jobs.
+data JobExecutorStats = JobExecutorStats
+  { jesPoolHits    :: Int     -- ^ jobs started by a process from the pool
+  , jesPoolMisses  :: Int     -- ^ jobs started by a newly forked process
+  , jesStartupUSec :: Integer -- ^ total time spent starting jobs
+  }
+
+-- | A pool of job processes waiting for jobs.
+data JobExecutorPool = JobExecutorPool
+  { jpSize  :: Int
+    -- ^ the number of processes to keep waiting
+  , jpState :: IORef ([JobExecutor], Int)
+    -- ^ the processes waiting for a job and the number of processes
+    -- being started for the pool
+  , jpStats :: IORef JobExecutorStats
+  }
+
+-- | Creates an empty pool of job processes.
+newJobExecutorPool :: Int -> IO JobExecutorPool
+newJobExecutorPool size = do
+  state <- newIORef ([], 0)
+  stats <- newIORef $ JobExecutorStats 0 0 0
+  return $ JobExecutorPool size state stats
+
+-- | The prefix of the log messages about starting a job process.
+startLogPrefix :: String -> ProcessID -> String
+startLogPrefix what pid = "[start:" ++ what ++ ",pid=" ++ show pid ++ "] "
+
+-- | Runs an IO action communicating with a job process, logging it and
+-- annotating the errors with the given message.
+annotatedIO :: (Error e) => String -> String -> IO a
+            -> ResultT e (WriterLogT IO) a
+annotatedIO logPrefix msg k = do
+  logDebug $ logPrefix ++ msg
+  liftIO $ rethrowAnnotateIOError (logPrefix ++ msg) k
+
+-- | Closes the pipe to a job process, which failed to start, and kills the
+-- process if it is still running.
+abortJobProcess :: (Error e, Show e)
+                => String -> ProcessID -> Client
+                -> ResultT e (WriterLogT IO) ()
+abortJobProcess logPrefix pid master = do
+  let logDebugJob = logDebug . (logPrefix ++)
+      killIfAlive [] = return ()
+      killIfAlive (sig : sigs) = do
+        logDebugJob "Getting the status of the process"
+        status <- tryError . liftIO $ getProcessStatus False True pid
+        case status of
+          Left e -> logDebugJob $ "Job process already gone: " ++ show e
+          Right (Just s) -> logDebugJob $ "Child process status: " ++ show s
+          Right Nothing -> do
+              logDebugJob $ "Child process running, killing by " ++ show sig
+              liftIO $ signalProcess sig pid
+              unless (null sigs) $ do
+                threadDelay 100000 -- wait for 0.1s and check again
+                killIfAlive sigs
+
+  logDebugJob "Closing the pipe to the client"
+  withErrorLogAt WARNING "Closing the communication pipe failed"
+      (liftIO (closeClient master)) `orElse` return ()
+  killIfAlive [sigTERM, sigABRT, sigKILL]
+
+-- | Forks a new job process and lets it start the Python code. The process
+-- is given its livelock, after which it prepares for executing a job and
+-- waits for it. If the process is forked for a particular job, its ID is
+-- used to name the livelock file.
+forkJobExecutor :: (Error e, Show e)
+                => Lock -- ^ lock for forking new processes
+                -> Maybe JobId -- ^ the job the process is forked for
+                -> ResultT e IO JobExecutor
+forkJobExecutor forkLock mjid = do
+  let what = maybe "executor" (("job-" ++) . show . fromJobId) mjid
+      execWriterLogInside k = ResultT . execWriterLogT $ runResultT k
 
   -- Due to a bug in GHC forking process, we want to retry,
   -- if the forked process fails to start.
   -- If it fails later on, the failure is handled by 'ResultT'
   -- and no retry is performed.
-  let execWriterLogInside = ResultT . execWriterLogT . runResultT
-  retryErrorN C.luxidRetryForkCount
-               $ \tryNo -> execWriterLogInside $ do
+  (pid, master, lockfile) <- withLock forkLock
+    . retryErrorN C.luxidRetryForkCount $ \tryNo -> execWriterLogInside $ do
     let maxWaitUS = 2^(tryNo - 1) * C.luxidRetryForkStepUS
     when (tryNo >= 2) . liftIO $ delayRandom (0, maxWaitUS)
 
-    (pid, master) <- liftIO $ forkWithPipe connectConfig (runJobProcess
-                                                          . qjId $ job)
-
-    let jobLogPrefix = "[start:job-" ++ jidStr ++ ",pid=" ++ show pid ++ "] "
-        logDebugJob = logDebug . (jobLogPrefix ++)
-
-    logDebugJob "Forked a new process"
-
-    let killIfAlive [] = return ()
-        killIfAlive (sig : sigs) = do
-          logDebugJob "Getting the status of the process"
-          status <- tryError . liftIO $ getProcessStatus False True pid
-          case status of
-            Left e -> logDebugJob $ "Job process already gone: " ++ show e
-            Right (Just s) -> logDebugJob $ "Child process status: " ++ show s
-            Right Nothing -> do
-                logDebugJob $ "Child process running, killing by " ++ show sig
-                liftIO $ signalProcess sig pid
-                unless (null sigs) $ do
-                  threadDelay 100000 -- wait for 0.1s and check again
-                  killIfAlive sigs
-
-    let onError = do
-          logDebugJob "Closing the pipe to the client"
-          withErrorLogAt WARNING "Closing the communication pipe failed"
-              (liftIO (closeClient master)) `orElse` return ()
-          killIfAlive [sigTERM, sigABRT, sigKILL]
-
-    flip catchError (\e -> onError >> throwError e)
-      $ do
-      let annotatedIO msg k = do
-            logDebugJob msg
-            liftIO $ rethrowAnnotateIOError (jobLogPrefix ++ msg) k
-      let recv msg = annotatedIO msg (recvMsg master)
-          send msg x = annotatedIO msg (sendMsg master x)
-
-      lockfile <- recv "Getting the lockfile of the client"
-
-      logDebugJob $ "Setting the lockfile to the final " ++ lockfile
-      toErrorBase $ update lockfile
-      send "Confirming the client it can start" ""
-
-      -- from now on, we communicate with the job's Python process
-
-      _ <- recv "Waiting for the job to ask for the job id"
-      send "Writing job id to the client" jidStr
-
-      _ <- recv "Waiting for the job to ask for the lock file name"
-      send "Writing the lock file name to the client" lockfile
-
-      _ <- recv "Waiting for the job to ask for secret parameters"
-      send "Writing secret parameters to the client" secretParams
+    (pid, master) <- liftIO $ forkWithPipe connectConfig (runJobProcess mjid)
+
+    let logPrefix = startLogPrefix what pid
+    logDebug $ logPrefix ++ "Forked a new process"
+
+    flip catchError (\e -> abortJobProcess logPrefix pid master
+                           >> throwError e) $ do
+      lockfile <- annotatedIO logPrefix "Getting the lockfile of the client"
+                    (recvMsg master)
+      annotatedIO logPrefix "Confirming the client it can start"
+        (sendMsg master "")
+      return (pid, master, lockfile)
+
+  -- from now on, we communicate with the job's Python process, which
+  -- doesn't involve forking anymore
+  let logPrefix = startLogPrefix what pid
+  execWriterLogInside
+    . flip catchError (\e -> abortJobProcess logPrefix pid master
+                             >> throwError e) $ do
+    _ <- annotatedIO logPrefix
+           "Waiting for the job to ask for the lock file name"
+           (recvMsg master)
+    annotatedIO logPrefix "Writing the lock file name to the client"
+      (sendMsg master lockfile)
+
+  return $ JobExecutor pid lockfile master
+
+-- | Hands a job to a job process prepared by 'forkJobExecutor'.
+-- Returns the livelock of the job and its process ID.
+startJobOnExecutor :: (Error e, Show e)
+                   => QueuedJob -- ^ a job to process
+                   -> (FilePath -> ResultT e IO ())
+                      -- ^ a callback function to update the livelock file
+                      -- and process id in the job file
+                   -> JobExecutor -- ^ the process to execute the job
+                   -> ResultT e IO (FilePath, ProcessID)
+startJobOnExecutor job update executor = do
+  let pid = jeProcessId executor
+      lockfile = jeLivelock executor
+      master = jeClient executor
+      jidStr = show . fromJobId . qjId $ job
+      logPrefix = startLogPrefix ("job-" ++ jidStr) pid
+      execWriterLogInside = ResultT . execWriterLogT . runResultT
 
-      liftIO $ closeClient master
+  -- Retrieve secret parameters if present
+  let secretParams = encodeStrict . filterSecretParameters . qjOps $ job
 
-      return (lockfile, pid)
+  execWriterLogInside
+    . flip catchError (\e -> abortJobProcess logPrefix pid master
+                             >> throwError e) $ do
+    logDebug $ logPrefix ++ "Setting the lockfile to the final " ++ lockfile
+    toErrorBase $ update lockfile
+
+    _ <- annotatedIO logPrefix "Waiting for the job to ask for the job id"
+           (recvMsg master)
+    annotatedIO logPrefix "Writing job id to the client"
+      (sendMsg master jidStr)
+
+    _ <- annotatedIO logPrefix
+           "Waiting for the job to ask for secret parameters"
+           (recvMsg master)
+    annotatedIO logPrefix "Writing secret parameters to the client"
+      (sendMsg master secretParams)
+
+    liftIO $ closeClient master
+
+    return (lockfile, pid)
+
+-- | Takes a process waiting for a job from the pool, if there is one.
+-- Processes that have died in the meantime are discarded.
+takeJobExecutor :: JobExecutorPool -> IO (Maybe JobExecutor)
+takeJobExecutor pool = do
+  taken <- atomicModifyIORef (jpState pool) $ \state ->
+    case state of
+      (executor : rest, starting) -> ((rest, starting), Just executor)
+      _ -> (state, Nothing)
+  case taken of
+    Nothing -> return Nothing
+    Just executor -> do
+      status <- tryIOError $ getProcessStatus False False (jeProcessId executor)
+      case status of
+        Right Nothing -> return taken
+        _ -> do
+          logWarning $ "Job process " ++ show (jeProcessId executor)
+                       ++ " from the pool has died, discarding it"
+          _ <- tryIOError . closeClient $ jeClient executor
+          takeJobExecutor pool
+
+-- | Starts new processes in the background, until the pool is full again.
+refillJobExecutorPool :: Lock -- ^ lock for forking new processes
+                      -> JobExecutorPool -> IO ()
+refillJobExecutorPool forkLock pool = do
+  missing <- atomicModifyIORef (jpState pool) $ \(idle, starting) ->
+    let n = max 0 (jpSize pool - length idle - starting)
+    in ((idle, starting + n), n)
+  replicateM_ missing . forkIO $ do
+    result <- runResultT $ forkJobExecutor forkLock Nothing
+    case result of
+      Ok executor ->
+        atomicModifyIORef (jpState pool) $ \(idle, starting) ->
+          ((idle ++ [executor], starting - 1), ())
+      Bad msg -> do
+        atomicModifyIORef (jpState pool) $ \(idle, starting) ->
+          ((idle, starting - 1), ())
+        logWarning $ "Failed to start a job process for the pool: " ++ msg
+
+-- | Starts processing of the given job, preferably by a process from the
+-- pool, and otherwise by a newly forked process.
+-- Returns the livelock of the job and its process ID.
+forkJobProcess :: (Error e, Show e)
+               => QueuedJob -- ^ a job to process
+               -> FilePath  -- ^ the daemons own livelock file
+               -> Lock -- ^ lock for forking new processes
+               -> JobExecutorPool -- ^ processes waiting for jobs
+               -> (FilePath -> ResultT e IO ())
+                  -- ^ a callback function to update the livelock file
+                  -- and process id in the job file
+               -> ResultT e IO (FilePath, ProcessID)
+forkJobProcess job luxiLivelock forkLock pool update = do
+  let jid = qjId job
+      jidStr = show $ fromJobId jid
+      forkNew = do
+        logDebug $ "Setting the lockfile temporarily to " ++ luxiLivelock
+                   ++ " for job " ++ jidStr
+        update luxiLivelock
+        forkJobExecutor forkLock (Just jid) >>= startJobOnExecutor job update
+      pooledOrNew executor =
+        liftM ((,) True) (startJobOnExecutor job update executor)
+          `orElse` liftM ((,) False) forkNew
+
+  startTime <- liftIO getCurrentTimeUSec
+  pooled <- liftIO $ takeJobExecutor pool
+  (hit, result) <- maybe (liftM ((,) False) forkNew) pooledOrNew pooled
+  endTime <- liftIO getCurrentTimeUSec
+
+  let addStats s =
+        s { jesPoolHits = jesPoolHits s + (if hit then 1 else 0)
+          , jesPoolMisses = jesPoolMisses s + (if hit then 0 else 1)
+          , jesStartupUSec = jesStartupUSec s + endTime - startTime
+          }
+  stats <- liftIO . atomicModifyIORef (jpStats pool) $ \s ->
+    let s' = addStats s in (s', s')
+  let started = jesPoolHits stats + jesPoolMisses stats
+  logInfo $ printf "Started job %s in %.3fs by a %s process; %d of %d jobs\
+                   \ started by pooled processes, %.3fs on average"
+              jidStr (fromIntegral (endTime - startTime) / 1e6 :: Double)
+              (if hit then "pooled" else "new") (jesPoolHits stats) started
+              (fromIntegral (jesStartupUSec stats) / 1e6
+                 / fromIntegral started :: Double)
+
+  return result
@@ -332,7 +332,7 @@ handleCall _ status _ (ReplaceFilter mUuid priority predicates action
 
     -- Ask WConfd to change the config for us.
     cid <- liftIO $ makeLuxidClientId status
-    withLockedWconfdConfig cid $ \lockedCfg -> do
+    void . withLockedWconfdConfig cid $ \lockedCfg -> do
       -- Reading the latest JobID inside the Wconfd lock to really get the
       -- most recent one (locking may block us for some time).
       serial <- liftIO readSerialFromDisk
@@ -362,7 +362,7 @@ handleCall _ status cfg (DeleteFilter uuid) = runResultT $ do
 
   -- Ask WConfd to change the config for us.
   cid <- liftIO $ makeLuxidClientId status
-  withLockedWconfdConfig cid $ \lockedCfg ->
+  void . withLockedWconfdConfig cid $ \lockedCfg ->
     writeConfig cid
       . (configFiltersL . alterContainerL uuid .~ Nothing)
       $ lockedCfg
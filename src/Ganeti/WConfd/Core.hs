@@ -43,7 +43,7 @@ module Ganeti.WConfd.Core where
 
 import Control.Arrow ((&&&))
 import Control.Concurrent (myThreadId)
-import Control.Lens.Setter (set)
+import Control.Lens.Setter (set, over)
 import Control.Monad (liftM, unless, when)
 import qualified Data.Map as M
 import qualified Data.Set as S
@@ -62,10 +62,14 @@ import Ganeti.Locking.Locks ( GanetiLocks(ConfigLock, BGL)
                             , ClientType(ClientOther), ClientId(..) )
 import qualified Ganeti.Locking.Waiting as LW
 import Ganeti.Objects ( ConfigData, DRBDSecret, LogicalVolume, Ip4Address
+                      , Cluster, Node, NodeGroup, Instance, Network, Disk
                       , configMaintenance, maintRoundDelay, maintJobs
                       )
-import Ganeti.Objects.Lens (configClusterL, clusterMasterNodeL)
-import Ganeti.Types (JobId)
+import Ganeti.Objects.Lens ( configClusterL, clusterMasterNodeL
+                           , configNodesL, configNodegroupsL
+                           , configInstancesL, configNetworksL, configDisksL
+                           )
+import Ganeti.Types (JobId, SerialNoObject(..), TimeStampObject(..))
 import Ganeti.WConfd.ConfigState (csConfigDataL)
 import qualified Ganeti.WConfd.ConfigVerify as V
 import Ganeti.WConfd.DeathDetection (cleanupLocks)
@@ -94,13 +98,22 @@ checkConfigLock cid state = do
 readConfig :: WConfdMonad ConfigData
 readConfig = CW.readConfig
 
+-- | Returns the serial number and modification time of the configuration,
+-- so that clients can bring their copy up to date after writing it.
+configVersion :: WConfdMonad (Int, J.TimeAsDoubleJSON)
+configVersion = liftM (serialOf &&& J.TimeAsDoubleJSON . mTimeOf)
+                      CW.readConfig
+
 -- | Write the configuration, checking that an exclusive lock is held.
--- If not, the call fails.
-writeConfig :: ClientId -> ConfigData -> WConfdMonad ()
+-- If not, the call fails. Returns the new serial number and modification
+-- time of the configuration.
+writeConfig :: ClientId -> ConfigData
+            -> WConfdMonad (Int, J.TimeAsDoubleJSON)
 writeConfig ident cdata = do
   checkConfigLock ident L.OwnExclusive
   -- V.verifyConfigErr cdata
   CW.writeConfig cdata
+  configVersion
 
 -- | Explicitly run verification of the configuration.
 -- The caller doesn't need to hold the configuration lock.
@@ -131,26 +144,111 @@ lockConfig cid shared = do
     []  -> liftM Just CW.readConfig
     _   -> return Nothing
 
+-- | Tries to acquire 'ConfigLock' for the client, like 'lockConfig'.
+--
+-- The first component of the result tells if the lock was acquired. If
+-- so, the second component is the current configuration, or @null@ if
+-- its serial number is still the given one, so that the client can keep
+-- using its copy.
+lockConfigIfChanged
+    :: ClientId
+    -> Bool -- ^ set to 'True' if the lock should be shared
+    -> Int -- ^ the serial number of the client's copy
+    -> WConfdMonad (Bool, J.MaybeForJSON ConfigData)
+lockConfigIfChanged cid shared serial = do
+  r <- lockConfig cid shared
+  return $ case J.unMaybeForJSON r of
+    Nothing -> (False, J.MaybeForJSON Nothing)
+    Just cdata | serialOf cdata == serial -> (True, J.MaybeForJSON Nothing)
+               | otherwise -> (True, J.MaybeForJSON $ Just cdata)
+
 -- | Release the config lock, if the client currently holds it.
 unlockConfig
   :: ClientId -> WConfdMonad ()
 unlockConfig cid = freeLocksLevel cid LevelConfig
 
 -- | Write the configuration, if the config lock is held exclusively,
--- and release the config lock. It the caller does not have the config
--- lock, return False.
-writeConfigAndUnlock :: ClientId -> ConfigData -> WConfdMonad Bool
+-- and release the config lock. Returns the new serial number and
+-- modification time of the configuration, or @null@ if the caller does
+-- not have the config lock.
+writeConfigAndUnlock :: ClientId -> ConfigData
+                     -> WConfdMonad (J.MaybeForJSON (Int, J.TimeAsDoubleJSON))
 writeConfigAndUnlock cid cdata = do
   la <- readLockAllocation
   if L.holdsLock cid ConfigLock L.OwnExclusive la
     then do
       CW.writeConfig cdata
+      version <- configVersion
       unlockConfig cid
-      return True
+      return . J.MaybeForJSON $ Just version
     else do
       logWarning $ show cid ++ " tried writeConfigAndUnlock without owning"
                    ++ " the config lock"
-      return False
+      return $ J.MaybeForJSON Nothing
+
+-- | Changes to the object containers of the configuration, in the order
+-- nodes, node groups, instances, networks and disks. Each container maps
+-- the UUID of a changed object to its new version, or to @null@ if the
+-- object has been removed.
+type ContainerDeltas = J.Tuple5 (J.Container (J.MaybeForJSON Node))
+                                (J.Container (J.MaybeForJSON NodeGroup))
+                                (J.Container (J.MaybeForJSON Instance))
+                                (J.Container (J.MaybeForJSON Network))
+                                (J.Container (J.MaybeForJSON Disk))
+
+-- | Applies the changes of a single container delta.
+applyContainerDelta :: J.Container (J.MaybeForJSON a)
+                    -> J.Container a -> J.Container a
+applyContainerDelta (J.GenericContainer delta) (J.GenericContainer m) =
+  J.GenericContainer
+    $ M.foldrWithKey (\k v -> M.alter (const $ J.unMaybeForJSON v) k) m delta
+
+-- | Applies a delta to the configuration. The cluster object is replaced
+-- only if a new version of it is given.
+applyConfigDelta :: J.MaybeForJSON Cluster -> ContainerDeltas
+                 -> ConfigData -> ConfigData
+applyConfigDelta cluster (J.Tuple5 (nodes, groups, insts, nets, disks)) =
+  maybe id (set configClusterL) (J.unMaybeForJSON cluster)
+  . over configNodesL (applyContainerDelta nodes)
+  . over configNodegroupsL (applyContainerDelta groups)
+  . over configInstancesL (applyContainerDelta insts)
+  . over configNetworksL (applyContainerDelta nets)
+  . over configDisksL (applyContainerDelta disks)
+
+-- | Write the changes to the configuration given as a delta, checking
+-- that an exclusive lock is held. If not, the call fails.
+--
+-- This is equivalent to 'writeConfig' with the whole configuration, but
+-- only the objects that actually changed need to be sent.
+writeConfigDelta :: ClientId -> J.MaybeForJSON Cluster -> ContainerDeltas
+                 -> WConfdMonad (Int, J.TimeAsDoubleJSON)
+writeConfigDelta ident cluster deltas = do
+  checkConfigLock ident L.OwnExclusive
+  modifyConfigState $ (,) () . over csConfigDataL
+                                    (applyConfigDelta cluster deltas)
+  configVersion
+
+-- | Write the changes to the configuration given as a delta, if the config
+-- lock is held exclusively, and release the config lock. Returns the new
+-- serial number and modification time of the configuration, or @null@ if
+-- the caller does not have the config lock.
+writeConfigDeltaAndUnlock :: ClientId -> J.MaybeForJSON Cluster
+                          -> ContainerDeltas
+                          -> WConfdMonad (J.MaybeForJSON
+                                            (Int, J.TimeAsDoubleJSON))
+writeConfigDeltaAndUnlock cid cluster deltas = do
+  la <- readLockAllocation
+  if L.holdsLock cid ConfigLock L.OwnExclusive la
+    then do
+      modifyConfigState $ (,) () . over csConfigDataL
+                                        (applyConfigDelta cluster deltas)
+      version <- configVersion
+      unlockConfig cid
+      return . J.MaybeForJSON $ Just version
+    else do
+      logWarning $ show cid ++ " tried writeConfigDeltaAndUnlock without"
+                   ++ " owning the config lock"
+      return $ J.MaybeForJSON Nothing
 
 -- | Force the distribution of configuration without actually modifying it.
 -- It is not necessary to hold a lock for this operation.
@@ -395,8 +493,11 @@ exportedFunctions = [ 'echo
                     , 'writeConfig
                     , 'verifyConfig
                     , 'lockConfig
+                    , 'lockConfigIfChanged
                     , 'unlockConfig
                     , 'writeConfigAndUnlock
+                    , 'writeConfigDelta
+                    , 'writeConfigDeltaAndUnlock
                     , 'flushConfig
                     , 'maintenanceRoundDelay
                     , 'maintenanceJobs
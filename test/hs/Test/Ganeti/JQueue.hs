@@ -214,6 +214,31 @@ prop_LoadJobs = monadicIO $ do
                  , counterexample "broken job" (isBad broken)
                  ]
 
+-- | Tests replaying the log entries journaled in a job file.
+prop_DecodeJobFile :: Property
+prop_DecodeJobFile =
+  forAll (resize 5 (listOf1 genQueuedOpCode)) $ \ops ->
+  forAll genJobId $ \jid ->
+  let job = QueuedJob jid ops justNoTs justNoTs justNoTs Nothing Nothing
+      entry = (1 :: Int, (0, 0) :: Timestamp, ELogMessage, showJSON "msg")
+      record = encode ("log", 0 :: Int, entry)
+      (op0:rest) = ops
+      logged = job { qjOps = op0 { qoLog = qoLog op0 ++ [entry] } : rest }
+  in conjoin
+       [ decodeJobFile (encode job) ==? Text.JSON.Ok job
+       , decodeJobFile (unlines [encode job, record]) ==? Text.JSON.Ok logged
+         -- an incomplete last record is ignored
+       , decodeJobFile (unlines [encode job, record, take 5 record])
+           ==? Text.JSON.Ok logged
+       , counterexample "unknown record" . isJsonError . decodeJobFile $
+           unlines [encode job, encode ("other", 0 :: Int, entry), record]
+         -- only a last record that isn't valid JSON is ignored
+       , counterexample "unknown last record" . isJsonError . decodeJobFile $
+           unlines [encode job, record, encode ("other", 0 :: Int, entry)]
+       ]
+  where isJsonError (Text.JSON.Error _) = True
+        isJsonError _ = False
+
 -- | Tests computing job directories. Creates random directories,
 -- files and stale symlinks in a directory, and checks that we return
 -- \"the right thing\".
@@ -281,6 +306,7 @@ testSuite "JQueue"
             , 'case_JobStatusPri_py_equiv
             , 'prop_ListJobIDs
             , 'prop_LoadJobs
+            , 'prop_DecodeJobFile
             , 'prop_DetermineDirs
             , 'prop_InputOpCode
             , 'prop_extractOpSummary
@@ -32,6 +32,7 @@
 
 
 import mock
+import sys
 import unittest
 import itertools
 import copy
@@ -134,9 +135,27 @@ class TestIAllocatorChecks(testutils.GanetiTestCase):
     self.assertRaises(errors.OpPrereqError, c_i)
 
 
+class TestGetLogicalUnit(unittest.TestCase):
+  def testAllListed(self):
+    for (module, _) in cmdlib._LU_MODULES:
+      module_name = "ganeti.cmdlib.%s" % module
+      __import__(module_name)
+      for (name, value) in vars(sys.modules[module_name]).items():
+        if (name.startswith("LU") and isinstance(value, type) and
+            issubclass(value, cmdlib.LogicalUnit) and
+            value.__module__ == module_name):
+          self.assertTrue(cmdlib.GetLogicalUnit(name) is value,
+                          msg="%s not listed in cmdlib" % name)
+
+  def testUnknown(self):
+    self.assertRaises(errors.ProgrammerError, cmdlib.GetLogicalUnit,
+                      "LUDoesNotExist")
+
+
 class TestLUTestJqueue(unittest.TestCase):
   def test(self):
-    self.assert_(cmdlib.LUTestJqueue._CLIENT_CONNECT_TIMEOUT <
+    lu = cmdlib.GetLogicalUnit("LUTestJqueue")
+    self.assert_(lu._CLIENT_CONNECT_TIMEOUT <
                  (luxi.WFJC_TIMEOUT * 0.75),
                  msg=("Client timeout too high, might not notice bugs"
                       " in WaitForJobChange"))
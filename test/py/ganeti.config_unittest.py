@@ -35,6 +35,8 @@ import unittest
 import os
 import tempfile
 import operator
+import copy
+import time
 
 from ganeti import bootstrap
 from ganeti import config
@@ -47,6 +49,7 @@ from ganeti import compat
 from ganeti import serializer
 
 from ganeti.config import TemporaryReservationManager
+from ganeti.config.indexes import NameIndex, InstanceIndex
 
 import testutils
 import mocks
@@ -58,6 +61,58 @@ def _StubGetEntResolver():
   return mocks.FakeGetentResolver()
 
 
+class _FakeWConfd(object):
+  """Serves a configuration and records the writes to it.
+
+  Like WConfd, the serial number is bumped on every write.
+
+  """
+  def __init__(self, data):
+    self.data = data
+    self.writes = []
+    self.locks = []
+    self.reads = 0
+
+  def _Write(self):
+    self.data["serial_no"] += 1
+    self.data["mtime"] = time.time()
+    return (self.data["serial_no"], self.data["mtime"])
+
+  def ReadConfig(self):
+    self.reads += 1
+    return copy.deepcopy(self.data)
+
+  def LockConfig(self, _ctx, _shared):
+    self.locks.append(None)
+    return copy.deepcopy(self.data)
+
+  def LockConfigIfChanged(self, _ctx, _shared, serial):
+    self.locks.append(serial)
+    if serial == self.data["serial_no"]:
+      return (True, None)
+    return (True, copy.deepcopy(self.data))
+
+  def UnlockConfig(self, _ctx):
+    pass
+
+  def WriteConfigAndUnlock(self, _ctx, data):
+    self.writes.append(("full", data))
+    self.data = copy.deepcopy(data)
+    return self._Write()
+
+  def WriteConfigDeltaAndUnlock(self, _ctx, cluster, containers):
+    self.writes.append(("delta", cluster, containers))
+    if cluster is not None:
+      self.data["cluster"] = copy.deepcopy(cluster)
+    for (kind, delta) in zip(config._CONFIG_DELTA_CONTAINERS, containers):
+      for (uuid, obj) in delta.items():
+        if obj is None:
+          del self.data[kind][uuid]
+        else:
+          self.data[kind][uuid] = copy.deepcopy(obj)
+    return self._Write()
+
+
 class TestConfigRunner(unittest.TestCase):
   """Testing case for HooksRunner"""
   def setUp(self):
@@ -219,6 +274,119 @@ class TestConfigRunner(unittest.TestCase):
 
     self.assertRaises(errors.ConfigurationError, cfg.GetDiskInfoByName, "name0")
 
+  def testGetByNameAfterChanges(self):
+    cfg = self._get_object_mock()
+    node = cfg.AddNewNode(name="node1.example.com")
+    inst = cfg.AddNewInstance(name="inst1.example.com", primary_node=node)
+
+    self.assertEqual(cfg.GetNodeInfoByName("node1.example.com"), node)
+    self.assertEqual(cfg.ExpandNodeName("node1"), (node.uuid, node.name))
+    self.assertEqual(cfg.GetInstanceInfoByName("inst1.example.com"), inst)
+    self.assertEqual(cfg.ExpandInstanceName("inst1"), (inst.uuid, inst.name))
+
+    cfg.RenameInstance(inst.uuid, "inst2.example.com")
+    self.assertEqual(cfg.GetInstanceInfoByName("inst1.example.com"), None)
+    self.assertEqual(cfg.GetInstanceInfoByName("inst2.example.com"), inst)
+    self.assertEqual(cfg.ExpandInstanceName("inst1"), (None, None))
+    self.assertEqual(cfg.ExpandInstanceName("inst2"),
+                     (inst.uuid, "inst2.example.com"))
+
+    # Objects renamed without notifying the configuration are still found
+    node.name = "node2.example.com"
+    self.assertEqual(cfg.GetNodeInfoByName("node1.example.com"), None)
+    self.assertEqual(cfg.GetNodeInfoByName("node2.example.com"), node)
+
+    cfg.RemoveNode(node.uuid)
+    self.assertEqual(cfg.GetNodeInfoByName("node2.example.com"), None)
+    self.assertEqual(cfg.ExpandNodeName("node2"), (None, None))
+
+  def testConfigDelta(self):
+    offline_cfg = self._get_object()
+    master_uuid = offline_cfg.GetMasterNode()
+    data = offline_cfg._ConfigData().ToDict()
+    wconfd = _FakeWConfd(data)
+    cfg = config.ConfigWriter(cfg_file=self.cfg_file, offline=False,
+                              _getents=_StubGetEntResolver, wconfd=wconfd)
+
+    cfg.SetVGName("othervg")
+    self.assertEqual(len(wconfd.writes), 1)
+    (kind, cluster, containers) = wconfd.writes[-1]
+    self.assertEqual(kind, "delta")
+    self.assertEqual(cluster["volume_group_name"], "othervg")
+    self.assertEqual(containers, [{}, {}, {}, {}, {}])
+
+    group = objects.NodeGroup(name="group2", uuid="group2-uuid", members=[])
+    cfg.AddNodeGroup(group, None, check_uuid=False)
+    (kind, cluster, containers) = wconfd.writes[-1]
+    self.assertEqual(kind, "delta")
+    self.assertEqual(containers[1].keys(), ["group2-uuid"])
+    self.assertEqual(containers[1]["group2-uuid"]["name"], "group2")
+
+    cfg.RemoveNode(master_uuid)
+    (kind, cluster, containers) = wconfd.writes[-1]
+    self.assertEqual(kind, "delta")
+    self.assertEqual(containers[0], {master_uuid: None})
+
+    # Changes not recorded by the outer section require a full write
+    with cfg.GetConfigManager():
+      cfg.SetVGName("thirdvg")
+      cfg._ConfigData().cluster.drbd_usermode_helper = "/bin/false"
+    (kind, data) = wconfd.writes[-1]
+    self.assertEqual(kind, "full")
+    self.assertEqual(data["cluster"]["volume_group_name"], "thirdvg")
+    self.assertEqual(data["cluster"]["drbd_usermode_helper"], "/bin/false")
+
+  def testLockUnchangedConfig(self):
+    offline_cfg = self._get_object()
+    data = offline_cfg._ConfigData().ToDict()
+    serial = data["serial_no"]
+    wconfd = _FakeWConfd(data)
+    cfg = config.ConfigWriter(cfg_file=self.cfg_file, offline=False,
+                              _getents=_StubGetEntResolver, wconfd=wconfd)
+
+    cfg.SetVGName("othervg")
+    self.assertEqual(wconfd.locks, [None])
+    self.assertEqual(cfg._ConfigData().serial_no, serial + 1)
+    self.assertEqual(cfg._ConfigData().mtime, wconfd.data["mtime"])
+
+    # Our copy has the serial number set by WConfd, so it's still current
+    cfg.SetDRBDHelper("/bin/false")
+    self.assertEqual(wconfd.locks, [None, serial + 1])
+    (_, cluster, _) = wconfd.writes[-1]
+    self.assertEqual(cluster["volume_group_name"], "othervg")
+    self.assertEqual(cluster["drbd_usermode_helper"], "/bin/false")
+
+    # Only shared access without the lock reads an outdated copy again
+    cfg.OutDate()
+    cfg.SetDRBDHelper("/bin/sh")
+    self.assertEqual(wconfd.locks, [None, serial + 1, serial + 2])
+    self.assertEqual(wconfd.reads, 0)
+    cfg.OutDate()
+    self.assertEqual(cfg.GetVGName(), "othervg")
+    self.assertEqual(wconfd.reads, 1)
+    cfg.SetDRBDHelper("/bin/false")
+    self.assertEqual(wconfd.locks[-1], serial + 3)
+
+    # The configuration has been changed by someone else
+    wconfd.data["cluster"]["volume_group_name"] = "extvg"
+    wconfd.data["serial_no"] += 1
+    cfg.SetDRBDHelper("/bin/true")
+    self.assertEqual(wconfd.locks[-1], serial + 4)
+    self.assertEqual(cfg.GetVGName(), "extvg")
+    (_, cluster, _) = wconfd.writes[-1]
+    self.assertEqual(cluster["volume_group_name"], "extvg")
+
+    # Changes that were not written make our copy unusable
+    def _Abort():
+      with cfg.GetConfigManager():
+        cfg._ConfigData().cluster.volume_group_name = "lostvg"
+        raise errors.OpExecError("Aborted")
+    self.assertRaises(errors.OpExecError, _Abort)
+    cfg.SetDRBDHelper("/bin/false")
+    self.assertEqual(wconfd.locks[-1], None)
+    (_, cluster, _) = wconfd.writes[-1]
+    self.assertEqual(cluster["volume_group_name"], "extvg")
+
   def testInstNodesNoDisks(self):
     """Test all_nodes/secondary_nodes when there are no disks"""
     # construct instance
@@ -303,6 +471,74 @@ class TestConfigRunner(unittest.TestCase):
       node2.uuid: ["myxenvg/disk0", "myxenvg/meta0"],
       })
 
+  def testInstanceIndex(self):
+    cfg = self._get_object_mock()
+    node_group = cfg.LookupNodeGroup(None)
+    master_uuid = cfg.GetMasterNode()
+    node2 = objects.Node(name="node2.example.com", group=node_group,
+                         ndparams={}, uuid="node2-uuid")
+    cfg.AddNode(node2, "my-job")
+
+    inst = self._create_instance(cfg)
+    disk = objects.Disk(dev_type=constants.DT_DRBD8, size=128,
+                        logical_id=(master_uuid, node2.uuid,
+                                    12300, 0, 0, "secret"),
+                        children=[], iv_name="disk/0", uuid="disk0")
+    cfg.AddInstance(inst, "my-job")
+
+    self.assertEqual(cfg.GetNodeInstances(master_uuid), ([inst.uuid], []))
+    self.assertEqual(cfg.GetNodeInstances(node2.uuid), ([], []))
+    self.assertEqual(cfg.GetInstanceForDisk("disk0"), None)
+
+    cfg.AddInstanceDisk(inst.uuid, disk)
+
+    self.assertEqual(cfg.GetNodeInstances(node2.uuid), ([], [inst.uuid]))
+    self.assertEqual(cfg.GetInstanceForDisk("disk0"), inst.uuid)
+    self.assertEqual(cfg.GetNodeGroupInstances(node_group),
+                     frozenset([inst.uuid]))
+    self.assertEqual(cfg.GetNodeGroupInstances(node_group, primary_only=True),
+                     frozenset([inst.uuid]))
+    self.assertEqual(cfg.GetNodeGroupInstances("other-group"), frozenset())
+    self.assertFalse(_IsErrorInList("Instance index", cfg.VerifyConfig()))
+
+    # Changes not reported to the configuration are found by the verification
+    inst.primary_node = node2.uuid
+    self.assertTrue(_IsErrorInList("Instance index for primary",
+                                   cfg.VerifyConfig()))
+    self.assertEqual(cfg.GetNodeInstances(node2.uuid), ([inst.uuid], []))
+
+    cfg.SetInstancePrimaryNode(inst.uuid, master_uuid)
+    cfg.DetachInstanceDisk(inst.uuid, disk.uuid)
+    self.assertEqual(cfg.GetNodeInstances(node2.uuid), ([], []))
+    self.assertEqual(cfg.GetInstanceForDisk("disk0"), None)
+
+  def testIncrementalVerify(self):
+    cfg = self._get_object_mock()
+    node_group = cfg.LookupNodeGroup(None)
+    node2 = objects.Node(name="node2.example.com", group=node_group,
+                         ndparams={}, uuid="node2-uuid")
+    cfg.AddNode(node2, "my-job")
+    self.assertEqual(cfg._UnlockedVerifyConfig(incremental=True), [])
+
+    # An in-place change without a new serial number is only seen by a full
+    # verification
+    key = list(constants.NDC_GLOBALS)[0]
+    node2.ndparams[key] = constants.NDC_DEFAULTS[key]
+    errs = cfg._UnlockedVerifyConfig(incremental=True)
+    self.assertFalse(_IsErrorInList("global parameters", errs))
+    self.assertTrue(_IsErrorInList("global parameters", cfg.VerifyConfig()))
+
+    # Once the node is updated, the error is reported in either mode
+    node2.serial_no += 1
+    errs = cfg._UnlockedVerifyConfig(incremental=True)
+    self.assertTrue(_IsErrorInList("global parameters", errs))
+
+    # Changes done through the configuration drop the cached result
+    del node2.ndparams[key]
+    cfg._UnlockedRecordChange("nodes", node2.uuid)
+    errs = cfg._UnlockedVerifyConfig(incremental=True)
+    self.assertFalse(_IsErrorInList("global parameters", errs))
+
   def testUpgradeSave(self):
     """Test that any modification done during upgrading is saved back"""
     cfg = self._get_object()
@@ -680,6 +916,108 @@ class TestTRM(unittest.TestCase):
     self.assertFalse(t.Reserved("a"))
 
 
+class TestNameIndex(unittest.TestCase):
+  @staticmethod
+  def _MakeNodes(names):
+    return dict(("uuid-%s" % name, objects.Node(uuid="uuid-%s" % name,
+                                                 name=name))
+                for name in names)
+
+  def testLookup(self):
+    nodes = self._MakeNodes(["node1.example.com", "node2.example.com"])
+    index = NameIndex(nodes)
+    self.assertTrue(index.IsCurrent(nodes))
+    self.assertEqual(index.Lookup("node1.example.com"),
+                     ["uuid-node1.example.com"])
+    self.assertEqual(index.Lookup("node1"), [])
+
+    nodes["uuid-node3"] = objects.Node(uuid="uuid-node3", name="node3")
+    self.assertFalse(index.IsCurrent(nodes))
+    self.assertFalse(index.IsCurrent(dict(nodes)))
+
+  def testExpand(self):
+    names = ["node1.example.com", "node1.example.org", "node2.example.com",
+             "node10.example.com", "Node3.Example.com", "node4"]
+    index = NameIndex(self._MakeNodes(names))
+
+    for short_name in ["node1", "node1.example", "node2.ex", "node3.ex",
+                       "node2.example.com", "node3", "NODE3.EXAMPLE",
+                       "node4", "node4.example.com", "Node1.Example.Org",
+                       "node10", "node", "missing"]:
+      self.assertEqual(index.Expand(short_name),
+                       utils.MatchNameComponent(short_name, names,
+                                                case_sensitive=False),
+                       msg="Mismatch for %s" % short_name)
+
+  def testUpdates(self):
+    nodes = self._MakeNodes(["node1.example.com", "node2.example.com"])
+    index = NameIndex(nodes)
+    self.assertEqual(index.Expand("node1"), "node1.example.com")
+
+    nodes["uuid-node3"] = objects.Node(uuid="uuid-node3",
+                                       name="node3.example.com")
+    index.Add("uuid-node3", "node3.example.com")
+    self.assertTrue(index.IsCurrent(nodes))
+    self.assertEqual(index.Expand("node3"), "node3.example.com")
+
+    index.Rename("uuid-node3", "node3.example.com", "node1.example.org")
+    self.assertEqual(index.Lookup("node3.example.com"), [])
+    self.assertEqual(index.Lookup("node1.example.org"), ["uuid-node3"])
+    self.assertEqual(index.Expand("node3"), None)
+    self.assertEqual(index.Expand("node1"), None)
+
+    del nodes["uuid-node1.example.com"]
+    index.Remove("uuid-node1.example.com", "node1.example.com")
+    self.assertTrue(index.IsCurrent(nodes))
+    self.assertEqual(index.Expand("node1"), "node1.example.org")
+
+
+class TestInstanceIndex(unittest.TestCase):
+  def _MakeData(self):
+    disks = {
+      "drbd": objects.Disk(uuid="drbd", dev_type=constants.DT_DRBD8,
+                           logical_id=("node1", "node2", 11000, 0, 0, "x")),
+      "plain": objects.Disk(uuid="plain", dev_type=constants.DT_PLAIN,
+                            logical_id=("xenvg", "lv")),
+      }
+    instances = {
+      "inst1": objects.Instance(uuid="inst1", primary_node="node1",
+                                disks=["drbd"]),
+      "inst2": objects.Instance(uuid="inst2", primary_node="node2",
+                                disks=["plain", "missing"]),
+      }
+    return objects.ConfigData(instances=instances, disks=disks)
+
+  def testLookup(self):
+    data = self._MakeData()
+    index = InstanceIndex(data)
+    self.assertTrue(index.IsCurrent(data))
+    self.assertEqual(index.GetPrimaryInstances("node1"), frozenset(["inst1"]))
+    self.assertEqual(index.GetPrimaryInstances("node2"), frozenset(["inst2"]))
+    self.assertEqual(index.GetSecondaryInstances("node1"), frozenset())
+    self.assertEqual(index.GetSecondaryInstances("node2"),
+                     frozenset(["inst1"]))
+    self.assertEqual(index.GetDiskInstances("plain"), frozenset(["inst2"]))
+    self.assertEqual(index.GetDiskInstances("other"), frozenset())
+    self.assertEqual(index.Verify(data), [])
+
+    del data.instances["inst2"]
+    self.assertFalse(index.IsCurrent(data))
+
+  def testVerify(self):
+    data = self._MakeData()
+    index = InstanceIndex(data)
+
+    data.instances["inst2"].disks.append("drbd")
+    errs = index.Verify(data)
+    self.assertTrue(_IsErrorInList("Instance index for secondary 'node1'",
+                                   errs))
+    self.assertTrue(_IsErrorInList("Instance index for disk 'drbd'", errs))
+    self.assertTrue(_IsErrorInList("Disk 'drbd' is attached to multiple"
+                                   " instances: inst1, inst2", errs))
+    self.assertFalse(_IsErrorInList("'plain'", errs))
+
+
 class TestCheckInstanceDiskIvNames(unittest.TestCase):
   @staticmethod
   def _MakeDisks(names):
@@ -32,6 +32,8 @@
 
 
 import os
+import signal
+import socket
 import unittest
 import time
 import tempfile
@@ -64,6 +66,33 @@ class TestStartLines(unittest.TestCase):
     self.assertEqual(str(start_line), "HTTP/1.1 200 OK")
 
 
+class TestContentEncoding(unittest.TestCase):
+  def testChooseEncoding(self):
+    for value in [None, "", "identity", "gzip, br", "deflate;q=0",
+                  "deflate; q=0.0, x-lz4;q=0"]:
+      self.assertTrue(http.ChooseEncoding(value) is None)
+
+    for value in ["deflate", "gzip, deflate", "DEFLATE;q=0.5",
+                  "x-unknown, deflate; q=1"]:
+      self.assertEqual(http.ChooseEncoding(value), http.HTTP_ENCODING_DEFLATE)
+
+  def testEncodeDecode(self):
+    data = "".join(chr(i % 256) for i in range(10000))
+    for encoding in http.GetSupportedEncodings():
+      encoded = http.EncodeBody(encoding, data)
+      self.assertEqual(http.DecodeBody(encoding, encoded), data)
+      self.assertEqual(http.DecodeBody(encoding.upper(), encoded), data)
+
+    for encoding in [None, "", http.HTTP_ENCODING_IDENTITY]:
+      self.assertEqual(http.DecodeBody(encoding, data), data)
+
+  def testErrors(self):
+    self.assertRaises(http.HttpError, http.EncodeBody, "x-unknown", "")
+    self.assertRaises(http.HttpError, http.DecodeBody, "x-unknown", "")
+    self.assertRaises(http.HttpError, http.DecodeBody,
+                      http.HTTP_ENCODING_DEFLATE, "invalid data")
+
+
 class TestMisc(unittest.TestCase):
   """Miscellaneous tests"""
 
@@ -330,6 +359,212 @@ class TestReadPasswordFile(unittest.TestCase):
     self.assertEqual(users["user2"].options, ["write", "read"])
 
 
+class _FakeStatusReader:
+  def __init__(self):
+    self.closed = False
+
+  def close(self):
+    assert not self.closed
+    self.closed = True
+
+
+class TestWorkerPool(unittest.TestCase):
+  def setUp(self):
+    self.now = 100.0
+    self.pids = itertools.count(1000)
+    self.readers = {}
+    self.signals = []
+    self.exited = set()
+    self.pool = http.server._WorkerPool(3, self._Spawn, _kill_fn=self._Kill,
+                                        _time_fn=lambda: self.now,
+                                        _waitpid_fn=self._WaitPid,
+                                        _sleep_fn=self._Sleep)
+
+  def _Spawn(self, status_fn):
+    pid = self.pids.next()
+    self.readers[pid] = _FakeStatusReader()
+    self.status_fn = status_fn
+    return (pid, self.readers[pid])
+
+  def _Kill(self, pid, signum):
+    self.signals.append((pid, signum))
+    if signum == signal.SIGKILL:
+      self.exited.add(pid)
+
+  def _WaitPid(self, pid, options):
+    if pid in self.exited:
+      return (pid, 0)
+    self.assertEqual(options, os.WNOHANG)
+    return (0, 0)
+
+  def _Sleep(self, duration):
+    self.now += duration
+    # The first worker exits after a while
+    if self.now > 103:
+      self.exited.add(1000)
+
+  def testFill(self):
+    self.assertEqual(len(self.pool), 0)
+    self.assertFalse(self.pool.HasIdle())
+    self.pool.Fill()
+    self.assertEqual(sorted(self.pool.GetPids()), [1000, 1001, 1002])
+    self.assertTrue(self.pool.HasIdle())
+    self.pool.Fill()
+    self.assertEqual(len(self.pool), 3)
+
+  def testBusy(self):
+    self.pool.Fill()
+    for pid in [1000, 1001]:
+      self.status_fn(pid, http.server._WORKER_BUSY)
+    self.assertTrue(self.pool.HasIdle())
+    self.status_fn(1002, http.server._WORKER_BUSY)
+    self.assertFalse(self.pool.HasIdle())
+
+    # Workers waiting on a persistent connection can't take new ones
+    self.status_fn(1001, http.server._WORKER_WAITING)
+    self.assertFalse(self.pool.HasIdle())
+    self.status_fn(1001, http.server._WORKER_IDLE)
+    self.assertTrue(self.pool.HasIdle())
+
+    # Unknown workers are ignored
+    self.status_fn(1, http.server._WORKER_BUSY)
+
+  def testRemove(self):
+    self.pool.Fill()
+    self.pool.Remove(1001)
+    self.assertTrue(self.readers[1001].closed)
+    self.assertFalse(1001 in self.pool)
+    self.pool.Remove(1001)
+    self.pool.Fill()
+    self.assertEqual(sorted(self.pool.GetPids()), [1000, 1002, 1003])
+
+  def testSignal(self):
+    self.pool.Fill()
+    self.pool.Signal(signal.SIGTERM)
+    self.assertEqual(sorted(self.signals),
+                     [(pid, signal.SIGTERM) for pid in [1000, 1001, 1002]])
+
+  def testKillStuck(self):
+    self.pool.Fill()
+    self.status_fn(1000, http.server._WORKER_BUSY)
+    self.now += 20
+    self.status_fn(1001, http.server._WORKER_BUSY)
+    self.status_fn(1002, http.server._WORKER_BUSY)
+    self.status_fn(1002, http.server._WORKER_WAITING)
+    self.now += 20
+    self.assertEqual(self.pool.KillStuck(60), [])
+    self.assertEqual(self.pool.KillStuck(30), [1000])
+    self.assertEqual(self.signals, [(1000, signal.SIGKILL)])
+
+    # Killed workers are only removed once they have been reaped
+    self.assertTrue(1000 in self.pool)
+
+  def testTerminate(self):
+    self.pool.Fill()
+    self.exited.add(1001)
+    self.assertEqual(self.pool.Terminate(10), [1002])
+    self.assertEqual(len(self.pool), 0)
+    self.assertTrue(compat.all(reader.closed
+                               for reader in self.readers.values()))
+    self.assertEqual(sorted(self.signals),
+                     [(1000, signal.SIGTERM), (1001, signal.SIGTERM),
+                      (1002, signal.SIGKILL), (1002, signal.SIGTERM)])
+    self.assertTrue(self.now >= 110)
+
+  def testTerminateInTime(self):
+    self.pool.Fill()
+    self.exited.update([1001, 1002])
+    self.assertEqual(self.pool.Terminate(10), [])
+    self.assertEqual(len(self.pool), 0)
+    self.assertTrue(self.now < 104)
+
+
+class _EchoHandler(http.server.HttpServerHandler):
+  def HandleRequest(self, req):
+    return "%s %s %s" % (req.request_method, req.request_path,
+                         req.request_body)
+
+
+class _FakeServer:
+  using_ssl = False
+
+
+class _ShortKeepAliveExecutor(http.server.HttpServerRequestExecutor):
+  KEEP_ALIVE_MAX_REQUESTS = 2
+
+
+class TestRequestExecutor(unittest.TestCase):
+  def _Run(self, data, executor=http.server.HttpServerRequestExecutor,
+           keep_alive=True, status_fn=None):
+    (server_sock, client_sock) = socket.socketpair()
+    try:
+      client_sock.sendall(data)
+      client_sock.shutdown(socket.SHUT_WR)
+
+      executor(_FakeServer(), _EchoHandler(), server_sock, ("127.0.0.1", 1234),
+               keep_alive=keep_alive, status_fn=status_fn)
+
+      buf = StringIO()
+      while True:
+        received = client_sock.recv(4096)
+        if not received:
+          break
+        buf.write(received)
+
+      return buf.getvalue()
+    finally:
+      server_sock.close()
+      client_sock.close()
+
+  def testPipelined(self):
+    response = self._Run("GET /a HTTP/1.1\r\nHost: x\r\n\r\n"
+                         "PUT /b HTTP/1.1\r\nHost: x\r\n"
+                         "Content-Length: 3\r\n\r\nabc"
+                         "GET /c HTTP/1.1\r\nHost: x\r\n\r\n")
+    self.assertEqual(response.count("HTTP/1.1 200 OK\r\n"), 3)
+    self.assertEqual(response.count("Connection: keep-alive\r\n"), 3)
+    self.assertTrue(response.index("GET /a ") < response.index("PUT /b abc") <
+                    response.index("GET /c "))
+
+  def testConnectionClose(self):
+    response = self._Run("GET /a HTTP/1.1\r\nHost: x\r\n"
+                         "Connection: close\r\n\r\n"
+                         "GET /b HTTP/1.1\r\nHost: x\r\n\r\n")
+    self.assertEqual(response.count("HTTP/1.1 200 OK\r\n"), 1)
+    self.assertTrue("Connection: close\r\n" in response)
+    self.assertFalse("GET /b" in response)
+
+  def testHttp10(self):
+    response = self._Run("GET /a HTTP/1.0\r\n\r\nGET /b HTTP/1.0\r\n\r\n")
+    self.assertEqual(response.count("HTTP/1.0 200 OK\r\n"), 1)
+
+    response = self._Run("GET /a HTTP/1.0\r\nConnection: keep-alive\r\n\r\n"
+                         "GET /b HTTP/1.0\r\n\r\n")
+    self.assertEqual(response.count("HTTP/1.0 200 OK\r\n"), 2)
+
+  def testMaxRequests(self):
+    response = self._Run("GET /a HTTP/1.1\r\nHost: x\r\n\r\n" * 3,
+                         executor=_ShortKeepAliveExecutor)
+    self.assertEqual(response.count("HTTP/1.1 200 OK\r\n"), 2)
+    self.assertTrue(response.endswith("GET /a "))
+    self.assertEqual(response.count("Connection: keep-alive\r\n"), 1)
+    self.assertEqual(response.count("Connection: close\r\n"), 1)
+
+  def testNoKeepAlive(self):
+    response = self._Run("GET /a HTTP/1.1\r\nHost: x\r\n\r\n" * 2,
+                         keep_alive=False)
+    self.assertEqual(response.count("HTTP/1.1 200 OK\r\n"), 1)
+    self.assertTrue("Connection: close\r\n" in response)
+
+  def testStatus(self):
+    status = []
+    self._Run("GET /a HTTP/1.1\r\nHost: x\r\n\r\n" * 2,
+              status_fn=status.append)
+    # Pipelined requests follow each other directly; only after the last one
+    # the executor waits for the connection to be closed
+    self.assertEqual(status, [True, True, False])
+
+
 class TestClientRequest(unittest.TestCase):
   def testRepr(self):
     cr = http.client.HttpClientRequest("localhost", 1234, "GET", "/version",
@@ -461,6 +696,7 @@ class TestClientStartRequest(unittest.TestCase):
           self.assertFalse(opts.pop(pycurl.HTTPHEADER))
           write_fn = opts.pop(pycurl.WRITEFUNCTION)
           self.assertTrue(callable(write_fn))
+          self.assertTrue(callable(opts.pop(pycurl.HEADERFUNCTION)))
           if hasattr(pycurl, "SSL_SESSIONID_CACHE"):
             self.assertFalse(opts.pop(pycurl.SSL_SESSIONID_CACHE))
           if curl_config_fn:
@@ -510,6 +746,44 @@ class TestClientStartRequest(unittest.TestCase):
                            msg="Previous checks did not consume all options")
           assert id(opts) == id(curl.opts)
 
+  def testContentEncoding(self):
+    data = "Hello World\n" * 1000
+
+    for encoding in http.GetSupportedEncodings() + [None, "unknown"]:
+      req = http.client.HttpClientRequest("localhost", 1811, "POST",
+                                          "/version")
+      curl = _FakeCurl()
+      pending = http.client._StartRequest(curl, req)
+
+      header_fn = curl.opts[pycurl.HEADERFUNCTION]
+      header_fn("HTTP/1.1 200 OK\r\n")
+      if encoding is None:
+        body = data
+      else:
+        header_fn("%s: %s\r\n" % (http.HTTP_CONTENT_ENCODING, encoding))
+        if encoding == "unknown":
+          body = data
+        else:
+          body = http.EncodeBody(encoding, data)
+      header_fn("\r\n")
+
+      curl.opts[pycurl.WRITEFUNCTION](body)
+      curl.info = {
+        pycurl.RESPONSE_CODE: http.HTTP_OK,
+        }
+      curl.opts.clear()
+
+      pending.Done(None)
+
+      self.assertEqual(req.resp_size, len(body))
+      if encoding == "unknown":
+        self.assertFalse(req.success)
+        self.assertTrue("unknown" in req.error)
+      else:
+        self.assertTrue(req.success)
+        self.assertEqual(req.resp_encoding, encoding)
+        self.assertEqual(req.resp_body, data)
+
   def _TestWrongTypes(self, *args, **kwargs):
     req = http.client.HttpClientRequest(*args, **kwargs)
     self.assertRaises(AssertionError, http.client._StartRequest,
@@ -618,6 +892,224 @@ class TestProcessCurlRequests(unittest.TestCase):
     self.assertFalse(multi.handles)
     self.assertEqual(multi._expect, ["select"])
 
+  class _WindowCurlMulti:
+    def __init__(self):
+      self.handles = []
+      self.max_handles = 0
+      self.selects = 0
+
+    def add_handle(self, curl):
+      assert curl not in self.handles
+      self.handles.append(curl)
+      self.max_handles = max(self.max_handles, len(self.handles))
+
+    def remove_handle(self, curl):
+      self.handles.remove(curl)
+
+    def perform(self):
+      return (pycurl.E_MULTI_OK, len(self.handles))
+
+    def info_read(self):
+      # Complete one request per call
+      if self.handles:
+        return (0, [self.handles[0]], [])
+      return (0, [], [])
+
+    def select(self, timeout):
+      self.selects += 1
+
+  def testWindow(self):
+    for (count, max_active) in [(0, 1), (1, 1), (10, 1), (10, 3), (10, 10),
+                                (10, 100)]:
+      started = []
+
+      def _GetRequests():
+        for _ in range(count):
+          curl = _FakeCurl()
+          started.append(curl)
+          yield curl
+
+      multi = self._WindowCurlMulti()
+      done = []
+      for (curl, errmsg) in \
+          http.client._ProcessCurlRequests(multi, _GetRequests(),
+                                           max_active=max_active):
+        self.assertTrue(errmsg is None)
+        self.assertTrue(curl not in multi.handles)
+        # Requests are only started once there is room for them
+        self.assertTrue(len(started) - len(done) <= max_active)
+        done.append(curl)
+
+      self.assertEqual(done, started)
+      self.assertEqual(len(done), count)
+      self.assertEqual(multi.max_handles, min(count, max_active))
+      self.assertFalse(multi.handles)
+
+
+class _FakeClosableCurl(_FakeCurl):
+  def __init__(self):
+    _FakeCurl.__init__(self)
+    self.closed = False
+
+  def setopt(self, opt, value):
+    assert not self.closed
+    # Pooled handles are configured once per request
+    self.opts[opt] = value
+
+  def close(self):
+    assert not self.closed
+    self.closed = True
+
+
+class TestCurlHandlePool(unittest.TestCase):
+  def setUp(self):
+    self.now = 1000.0
+    self.pool = http.client.CurlHandlePool(60, max_idle_per_key=2,
+                                           _curl=_FakeClosableCurl,
+                                           _time_fn=lambda: self.now)
+
+  def testReuse(self):
+    key = ("192.0.2.1", 1811)
+    curl = self.pool.Acquire(key)
+    self.assertEqual(len(self.pool), 0)
+    self.pool.Release(key, curl)
+    self.assertEqual(len(self.pool), 1)
+    self.assertTrue(self.pool.Acquire(key) is curl)
+    self.assertFalse(curl.closed)
+    self.assertEqual(len(self.pool), 0)
+
+  def testDifferentKeys(self):
+    curl = self.pool.Acquire(("192.0.2.1", 1811))
+    self.pool.Release(("192.0.2.1", 1811), curl)
+    other = self.pool.Acquire(("192.0.2.2", 1811))
+    self.assertFalse(other is curl)
+    self.assertEqual(len(self.pool), 1)
+
+  def testNotReusable(self):
+    key = ("192.0.2.1", 1811)
+    curl = self.pool.Acquire(key)
+    self.pool.Release(key, curl, reusable=False)
+    self.assertTrue(curl.closed)
+    self.assertEqual(len(self.pool), 0)
+
+  def testMaxIdle(self):
+    key = ("node1", 1811)
+    handles = [self.pool.Acquire(key) for _ in range(5)]
+    for curl in handles:
+      self.pool.Release(key, curl)
+    self.assertEqual(len(self.pool), 2)
+    self.assertEqual([curl.closed for curl in handles],
+                     [False, False, True, True, True])
+
+  def testIdleTimeout(self):
+    key = ("node1", 1811)
+    curl = self.pool.Acquire(key)
+    self.pool.Release(key, curl)
+    self.now += 61
+    other = self.pool.Acquire(key)
+    self.assertTrue(curl.closed)
+    self.assertFalse(other is curl)
+    self.assertEqual(len(self.pool), 0)
+
+  def testIdentity(self):
+    key = ("node1", 1811)
+    self.pool.CheckIdentity("cert1")
+    curl = self.pool.Acquire(key)
+    self.pool.Release(key, curl)
+    self.pool.CheckIdentity("cert1")
+    self.assertFalse(curl.closed)
+    self.assertEqual(len(self.pool), 1)
+    self.pool.CheckIdentity("cert2")
+    self.assertTrue(curl.closed)
+    self.assertEqual(len(self.pool), 0)
+
+  def testMaxIdleTotal(self):
+    pool = http.client.CurlHandlePool(60, max_idle_per_key=2, max_idle=3,
+                                      _curl=_FakeClosableCurl,
+                                      _time_fn=lambda: self.now)
+    handles = [(("node%s" % i, 1811), pool.Acquire(("node%s" % i, 1811)))
+               for i in range(5)]
+    for (key, curl) in handles:
+      pool.Release(key, curl)
+    self.assertEqual(len(pool), 3)
+    self.assertEqual([curl.closed for (_, curl) in handles],
+                     [False, False, False, True, True])
+
+    # Taking a handle makes room for another one
+    self.assertTrue(pool.Acquire(handles[0][0]) is handles[0][1])
+    pool.Release(*handles[0])
+    self.assertEqual(len(pool), 3)
+
+  def testFlush(self):
+    handles = [self.pool.Acquire(("node%s" % i, 1811)) for i in range(3)]
+    for (i, curl) in enumerate(handles):
+      self.pool.Release(("node%s" % i, 1811), curl)
+    self.pool.Flush()
+    self.assertTrue(compat.all(curl.closed for curl in handles))
+    self.assertEqual(len(self.pool), 0)
+
+  def testProcessRequests(self):
+    def _Process(_, handles, max_active):
+      for curl in handles:
+        curl.info = {
+          pycurl.RESPONSE_CODE: http.HTTP_OK,
+          }
+        if curl.opts[pycurl.URL].endswith("/fail"):
+          yield (curl, "test error")
+        else:
+          yield (curl, None)
+
+    for _ in range(3):
+      requests = [
+        http.client.HttpClientRequest("node%s" % i, 1811, "POST", path)
+        for i in range(4)
+        for path in ["/version", "/fail"]
+        ]
+      http.client.ProcessRequests(requests, curl_pool=self.pool,
+                                  _curl_multi=NotImplemented,
+                                  _curl_process=_Process)
+      self.assertEqual(len(self.pool), 4)
+
+    for req in requests:
+      self.assertEqual(req.success, req.path != "/fail")
+
+  def testProcessRequestsWindow(self):
+    created = []
+
+    def _NewCurl():
+      curl = _FakeClosableCurl()
+      created.append(curl)
+      return curl
+
+    pool = http.client.CurlHandlePool(60, _curl=_NewCurl,
+                                      _time_fn=lambda: self.now)
+
+    def _Process(multi, handles, max_active):
+      self.assertEqual(max_active, 2)
+      return http.client._ProcessCurlRequests(multi, handles,
+                                              max_active=max_active)
+
+    def _SetInfo(multi):
+      for curl in multi.handles:
+        curl.info = {
+          pycurl.RESPONSE_CODE: http.HTTP_OK,
+          }
+      return TestProcessCurlRequests._WindowCurlMulti.info_read(multi)
+
+    class _Multi(TestProcessCurlRequests._WindowCurlMulti):
+      info_read = _SetInfo
+
+    requests = [http.client.HttpClientRequest("node1", 1811, "POST", "/version")
+                for _ in range(10)]
+    http.client.ProcessRequests(requests, curl_pool=pool, max_active=2,
+                                _curl_multi=_Multi, _curl_process=_Process)
+
+    self.assertTrue(compat.all(req.success for req in requests))
+
+    # Handles of completed requests are reused for the following ones
+    self.assertEqual(len(created), 2)
+    self.assertEqual(len(pool), 2)
+
 
 class TestProcessRequests(unittest.TestCase):
   class _DummyCurlMulti:
@@ -670,8 +1162,9 @@ class TestProcessRequests(unittest.TestCase):
     else:
       lock_monitor_cb = None
 
-    def _ProcessRequests(multi, handles):
+    def _ProcessRequests(multi, handles, max_active):
       self.assertTrue(isinstance(multi, self._DummyCurlMulti))
+      self.assertTrue(max_active is None)
       self.assertEqual(len(requests), len(handles))
       self.assertTrue(compat.all(isinstance(curl, _FakeCurl)
                                  for curl in handles))
@@ -53,7 +53,8 @@ import testutils
 
 
 # Map from hypervisor class to hypervisor name
-HVCLASS_TO_HVNAME = utils.InvertDict(hypervisor._HYPERVISOR_MAP)
+HVCLASS_TO_HVNAME = dict((hypervisor.GetHypervisorClass(hvname), hvname)
+                         for hvname in hypervisor._HYPERVISOR_MAP)
 
 
 class TestConsole(unittest.TestCase):
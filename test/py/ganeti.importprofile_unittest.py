@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the ganeti.importprofile module"""
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from ganeti import importprofile
+from ganeti import utils
+
+import testutils
+
+
+class TestImportProfiler(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.added = []
+    self.profiler = importprofile.ImportProfiler(self._FakeImport)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+    for name in self.added:
+      sys.modules.pop(name, None)
+
+  def _FakeImport(self, name, globals_, locals_, fromlist, level):
+    # pylint: disable=W0613
+    if name == "outer":
+      self.profiler("inner")
+    if name != "cached":
+      module_name = "_importprofile_test_%s" % name
+      sys.modules[module_name] = None
+      self.added.append(module_name)
+    return name
+
+  def testNested(self):
+    self.assertEqual(self.profiler("outer"), "outer")
+    self.assertEqual(self.profiler("cached"), "cached")
+    self.assertEqual(self.profiler("other", fromlist=["a", "b"]), "other")
+
+    self.assertEqual([(depth, name)
+                      for (_, _, depth, name) in self.profiler.records],
+                     [(1, "inner"), (0, "outer"), (0, "other.{a,b}")])
+    for (self_time, cumulative, _, _) in self.profiler.records:
+      self.assertTrue(0 <= self_time <= cumulative)
+
+  def testReport(self):
+    self.profiler("outer")
+    filename = os.path.join(self.tmpdir, "report")
+    self.profiler.WriteReport(filename)
+    self.profiler.WriteReport(filename)
+
+    lines = [line for line in utils.ReadFile(filename).splitlines()
+             if not line.startswith("#")]
+    self.assertEqual(len(lines), 6)
+    self.assertTrue(lines[1].endswith("|   inner"))
+    self.assertTrue(lines[2].endswith("| outer"))
+
+  def testWriteError(self):
+    self.profiler.WriteReport(os.path.join(self.tmpdir, "none", "report"))
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
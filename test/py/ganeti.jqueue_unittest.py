@@ -39,6 +39,7 @@ import errno
 import itertools
 import random
 import operator
+import threading
 
 try:
   # pylint: disable=E0611
@@ -54,7 +55,9 @@ from ganeti import opcodes
 from ganeti import compat
 from ganeti import mcpu
 from ganeti import query
+from ganeti import serializer
 from ganeti import workerpool
+import ganeti.rpc.node as rpc
 
 import testutils
 
@@ -462,6 +465,151 @@ class TestQueuedJob(unittest.TestCase):
         self.assertEqual(job.CalcStatus(), status)
 
 
+class TestParseJobFile(unittest.TestCase):
+  def setUp(self):
+    self.job = jqueue._QueuedJob(None, 9381, [opcodes.OpTestDelay(),
+                                              opcodes.OpTestDelay()], True)
+    self.raw = serializer.DumpJson(self.job.Serialize(), compact=True)
+    self.entries = [
+      (1, [1234, 0], constants.ELOG_MESSAGE, "first"),
+      (2, [1235, 10], constants.ELOG_MESSAGE, "second\nline"),
+      ]
+
+  def _Record(self, op_index, entry):
+    return "\n" + serializer.DumpJson(["log", op_index, entry], compact=True)
+
+  def _Restore(self, raw_data):
+    data = jqueue._ParseJobFile(raw_data)
+    return jqueue._QueuedJob.Restore(None, data, True, False)
+
+  def testNoJournal(self):
+    for raw in [self.raw, self.raw + "\n"]:
+      job = self._Restore(raw)
+      self.assertEqual(job.Serialize(), self.job.Serialize())
+
+  def testJournal(self):
+    raw = (self.raw + self._Record(1, self.entries[0]) +
+           self._Record(0, self.entries[1]))
+    job = self._Restore(raw)
+    self.assertEqual([map(tuple, op.log) for op in job.ops],
+                     [[(2, [1235, 10], constants.ELOG_MESSAGE,
+                        "second\nline")],
+                      [(1, [1234, 0], constants.ELOG_MESSAGE, "first")]])
+    self.assertEqual(job.log_serial, 2)
+
+  def testIncompleteRecord(self):
+    record = self._Record(0, self.entries[1])
+    job = self._Restore(self.raw + self._Record(0, self.entries[0]) +
+                        record[:-3])
+    self.assertEqual(len(job.ops[0].log), 1)
+    self.assertEqual(job.log_serial, 1)
+
+    # Only the last record can be incomplete
+    self.assertRaises(ValueError, jqueue._ParseJobFile,
+                      self.raw + record[:-3] + record)
+
+  def testUnknownRecord(self):
+    raw = self.raw + "\n" + serializer.DumpJson(["foo", 0, None])
+    self.assertRaises(errors.JobFileCorrupted, jqueue._ParseJobFile,
+                      raw + self._Record(0, self.entries[0]))
+
+    # Only records which aren't valid JSON are ignored at the end
+    self.assertRaises(errors.JobFileCorrupted, jqueue._ParseJobFile, raw)
+
+
+class _FakeReplication:
+  def __init__(self):
+    self.finished = False
+
+  def Wait(self, timeout=None):
+    if timeout is None:
+      self.finished = True
+    return self.finished
+
+
+class _FakeJqRunner:
+  def __init__(self, calls):
+    self._calls = calls
+
+  def call_jobqueue_update(self, names, file_name, content):
+    self._calls.append((names, [(file_name, content)]))
+    return dict((name, rpc.RpcResult(data=(True, None), node=name))
+                for name in names)
+
+  def call_jobqueue_update_many(self, names, files):
+    self._calls.append((names, files))
+
+
+class TestReplication(unittest.TestCase):
+  def setUp(self):
+    self.calls = []
+    self.queue = jqueue.JobQueue.__new__(jqueue.JobQueue)
+    self.queue._nodes = {"node2.example.com": "192.0.2.2"}
+    self.queue._replication = None
+    self.queue._pending_files = {}
+    self.queue._pending_order = []
+    self.queue._replication_lock = threading.Lock()
+    self.queue._GetRpc = \
+      lambda _, quorum=None: _FakeJqRunner(self.calls)
+
+  def testIdle(self):
+    self.queue._ReplicateFile("/job-1", "a", False)
+    self.assertEqual(self.calls, [(["node2.example.com"], [("/job-1", "a")])])
+
+  def testCoalesce(self):
+    inflight = _FakeReplication()
+    self.queue._replication = inflight
+
+    self.queue._ReplicateFile("/job-1", "a", False)
+    self.queue._ReplicateFile("/job-2", "b", False)
+    self.queue._ReplicateFile("/job-1", "c", False)
+    self.assertEqual(self.calls, [])
+
+    # Once the previous call has finished, all changes are sent together
+    inflight.finished = True
+    self.queue._ReplicateFile("/job-3", "d", False)
+    self.assertEqual(self.calls, [(["node2.example.com"],
+                                   [("/job-1", "c"), ("/job-2", "b"),
+                                    ("/job-3", "d")])])
+
+  def testFlush(self):
+    self.queue._replication = _FakeReplication()
+    self.queue._ReplicateFile("/job-1", "a", False)
+    self.assertEqual(self.calls, [])
+    self.queue._ReplicateFile("/job-1", "b", True)
+    self.assertEqual(self.calls, [(["node2.example.com"], [("/job-1", "b")])])
+
+  def testWaitForReplication(self):
+    self.queue._replication = _FakeReplication()
+    self.queue._ReplicateFile("/job-1", "a", False)
+    self.queue.WaitForReplication()
+    self.assertEqual(self.calls, [(["node2.example.com"], [("/job-1", "a")])])
+    self.assertTrue(self.queue._replication is None)
+
+  def testDoneFlushes(self):
+    self.queue._replication = _FakeReplication()
+    self.queue._ReplicateFile("/job-1", "a", False)
+    self.queue._ReplicateFile("/job-2", "b", False)
+    self.assertEqual(self.calls, [])
+
+    # Pending changes are sent once the previous call has finished
+    self.queue._ReplicationDone({}, [], "test", None)
+    self.assertEqual(self.calls, [(["node2.example.com"],
+                                   [("/job-1", "a"), ("/job-2", "b")])])
+    self.assertEqual(self.queue._pending_order, [])
+
+  def testDoneFallback(self):
+    files = [("/job-1", "a"), ("/job-2", "b")]
+    result = {
+      "node2.example.com":
+        rpc.RpcResult(data="Unknown procedure", failed=True,
+                      node="node2.example.com"),
+      }
+    self.queue._ReplicationDone(result, ["node2.example.com"], "test", files)
+    self.assertEqual(self.calls, [(["node2.example.com"], [("/job-1", "a")]),
+                                  (["node2.example.com"], [("/job-2", "b")])])
+
+
 class _FakeDependencyManager:
   def __init__(self):
     self._checks = []
@@ -535,6 +683,10 @@ class _FakeQueueForProc:
   def UpdateJobUnlocked(self, job, replicate=True):
     self._updates.append((job, bool(replicate)))
 
+  def AppendJobLogUnlocked(self, job, op, entry):
+    assert entry in op.log
+    self._updates.append((job, False))
+
   def SubmitManyJobs(self, jobs):
     job_ids = [self._submit_count.next() for _ in jobs]
     self._submitted.extend(zip(job_ids, jobs))
@@ -214,5 +214,86 @@ class TestSecretParams(unittest.TestCase):
     self.assertRaises(errors.OpPrereqError, mcpu._CheckSecretParameters, op)
 
 
+class TestLockNotifier(unittest.TestCase):
+  def testNotify(self):
+    notifier = mcpu.LockNotifier()
+    self.assertFalse(notifier.Clear())
+    notifier.Notify()
+    notifier.Notify()
+    self.assertTrue(notifier.Wait(60.0))
+    self.assertFalse(notifier.Wait(0.0))
+
+  def testNotifyBeforeClear(self):
+    notifier = mcpu.LockNotifier()
+    notifier.Notify()
+    self.assertTrue(notifier.Clear())
+    self.assertFalse(notifier.Clear())
+
+
+class _FakeWConfdClient:
+  def __init__(self, pending, notify_fn):
+    self.pending = pending
+    self.notify_fn = notify_fn
+    self.count = 0
+
+  def HasPendingRequest(self, _cid):
+    self.count += 1
+    if self.count > self.pending:
+      return False
+    if self.notify_fn:
+      self.notify_fn()
+    return True
+
+
+class _FakeWConfd:
+  def __init__(self, client):
+    self.client = client
+
+  def Client(self):
+    return self.client
+
+
+class TestWaitForLocks(unittest.TestCase):
+  def _MakeProcessor(self, pending, notify):
+    proc = mcpu.Processor.__new__(mcpu.Processor)
+    proc._notifier = mcpu.LockNotifier()
+    proc._notifier.Clear()
+    proc._wconfdcontext = None
+    if notify:
+      notify_fn = proc._notifier.Notify
+    else:
+      notify_fn = None
+    client = _FakeWConfdClient(pending, notify_fn)
+    proc.wconfd = _FakeWConfd(client)
+    return (proc, client)
+
+  def testGranted(self):
+    (proc, client) = self._MakeProcessor(3, True)
+    # Each notification wakes up the process immediately
+    self.assertFalse(proc._WaitForLocks(None))
+    self.assertEqual(client.count, 4)
+
+  def testTimeout(self):
+    (proc, client) = self._MakeProcessor(10, False)
+    self.assertTrue(proc._WaitForLocks(0.0))
+    self.assertEqual(client.count, 1)
+
+  def testNoNotification(self):
+    (proc, client) = self._MakeProcessor(3, False)
+    # Without a timeout, WConfD is asked again until the request is granted
+    old_interval = mcpu._LOCK_RECHECK_INTERVAL
+    mcpu._LOCK_RECHECK_INTERVAL = 0.01
+    try:
+      self.assertFalse(proc._WaitForLocks(None))
+    finally:
+      mcpu._LOCK_RECHECK_INTERVAL = old_interval
+    self.assertEqual(client.count, 4)
+
+  def testTimeoutWaiting(self):
+    (proc, client) = self._MakeProcessor(10, False)
+    self.assertTrue(proc._WaitForLocks(0.1))
+    self.assertEqual(client.count, 2)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -0,0 +1,237 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the ganeti.nodecache module"""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ganeti import nodecache
+from ganeti import utils
+
+import testutils
+
+
+class _FakeWatcher:
+  def __init__(self, change_fn):
+    self.change_fn = change_fn
+    self.watched = []
+    self.checked = 0
+    self.closed = False
+
+  def Close(self):
+    self.closed = True
+
+  def GetNames(self):
+    return set(name for (name, _) in self.watched)
+
+  def Watch(self, name, path):
+    self.watched.append((name, path))
+    return True
+
+  def Check(self):
+    self.checked += 1
+
+
+class TestNodeCache(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.now = 100.0
+    self.watchers = []
+    self.calls = 0
+    self.cache = self._NewCache()
+    self.cache.Enable()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _NewCache(self):
+    return nodecache.NodeCache(state_dir=self.tmpdir,
+                               _time_fn=lambda: self.now,
+                               _watcher_cls=self._NewWatcher)
+
+  def _NewWatcher(self, change_fn):
+    watcher = _FakeWatcher(change_fn)
+    self.watchers.append(watcher)
+    return watcher
+
+  def _Compute(self):
+    self.calls += 1
+    return [self.calls]
+
+  def _Get(self, cache=None, name=nodecache.CN_LVM, key="key", paths=None):
+    if cache is None:
+      cache = self.cache
+    return cache.Get(name, key, self._Compute, 10, paths=paths)
+
+  def testDisabled(self):
+    cache = self._NewCache()
+    self.assertFalse(cache.IsEnabled())
+    self.assertEqual(self._Get(cache=cache), [1])
+    self.assertEqual(self._Get(cache=cache), [2])
+    cache.Invalidate(nodecache.CN_LVM)
+    self.assertEqual(cache.PopStats(), {})
+    self.assertEqual(os.listdir(self.tmpdir), [])
+
+  def testTtl(self):
+    self.assertEqual(self._Get(), [1])
+    self.now += 9
+    self.assertEqual(self._Get(), [1])
+    self.assertEqual(self._Get(key="other"), [2])
+    self.now += 2
+    self.assertEqual(self._Get(), [3])
+
+    self.assertEqual(self.cache.PopStats(), {
+      nodecache.CN_LVM: {
+        nodecache.STAT_HITS: 1,
+        nodecache.STAT_MISSES: 3,
+        nodecache.STAT_INVALIDATIONS: 0,
+        },
+      })
+    self.assertEqual(self.cache.PopStats(), {})
+
+  def testCopies(self):
+    value = self._Get()
+    value.append("modified")
+    self.assertEqual(self._Get(), [1])
+
+  def testErrors(self):
+    def _Fail():
+      raise EnvironmentError("failed")
+
+    self.assertRaises(EnvironmentError, self.cache.Get, nodecache.CN_LVM,
+                      "key", _Fail, 10)
+    self.assertEqual(self._Get(), [1])
+
+  def testInvalidate(self):
+    self.assertEqual(self._Get(), [1])
+    self.assertEqual(self._Get(name=nodecache.CN_OS), [2])
+    self.cache.Invalidate(nodecache.CN_LVM)
+    self.assertEqual(self._Get(), [3])
+    self.assertEqual(self._Get(name=nodecache.CN_OS), [2])
+    self.assertEqual(os.listdir(self.tmpdir), [nodecache.CN_LVM])
+
+    stats = self.cache.PopStats()
+    self.assertEqual(stats[nodecache.CN_LVM][nodecache.STAT_INVALIDATIONS], 1)
+
+  def testInvalidateOtherProcess(self):
+    other = self._NewCache()
+    other.Enable()
+
+    self.assertEqual(self._Get(), [1])
+    self.assertEqual(self._Get(cache=other), [2])
+
+    self.cache.Invalidate(nodecache.CN_LVM)
+    self.assertEqual(self._Get(cache=other), [3])
+    self.assertEqual(self._Get(cache=other), [3])
+
+    # Invalidating again must be noticed, too
+    self.assertEqual(self._Get(), [4])
+    self.cache.Invalidate(nodecache.CN_LVM)
+    self.assertEqual(self._Get(cache=other), [5])
+
+  def testPaths(self):
+    self.assertEqual(self._Get(name=nodecache.CN_OS, paths=["/a", "/b"]), [1])
+    self.assertEqual(len(self.watchers), 1)
+    (watcher, ) = self.watchers
+    self.assertEqual(watcher.watched,
+                     [(nodecache.CN_OS, "/a"), (nodecache.CN_OS, "/b")])
+
+    self.assertEqual(self._Get(name=nodecache.CN_OS, paths=["/a", "/b"]), [1])
+    self.assertEqual(watcher.checked, 2)
+
+    watcher.change_fn(nodecache.CN_OS)
+    self.assertEqual(self._Get(name=nodecache.CN_OS, paths=["/a", "/b"]), [2])
+
+    stats = self.cache.PopStats()
+    self.assertEqual(stats[nodecache.CN_OS], {
+      nodecache.STAT_HITS: 1,
+      nodecache.STAT_MISSES: 2,
+      nodecache.STAT_INVALIDATIONS: 1,
+      })
+
+
+class TestInvalidates(unittest.TestCase):
+  def test(self):
+    invalidated = []
+
+    orig_invalidate = nodecache.Invalidate
+    nodecache.Invalidate = invalidated.append
+    try:
+      @nodecache.Invalidates(nodecache.CN_LVM, nodecache.CN_OS)
+      def _Fn(value):
+        if value is None:
+          raise ValueError()
+        return value
+
+      self.assertEqual(_Fn(123), 123)
+      self.assertEqual(invalidated, [nodecache.CN_LVM, nodecache.CN_OS])
+      self.assertRaises(ValueError, _Fn, None)
+      self.assertEqual(len(invalidated), 4)
+    finally:
+      nodecache.Invalidate = orig_invalidate
+
+
+class TestStatsFile(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = utils.PathJoin(self.tmpdir, "stats")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test(self):
+    self.assertEqual(nodecache.ReadStats(self.filename), {})
+
+    cache = nodecache.NodeCache(state_dir=self.tmpdir)
+    cache.Enable()
+
+    for _ in range(2):
+      cache.Get(nodecache.CN_LVM, "key", lambda: 1, 10)
+      cache.Get(nodecache.CN_LVM, "key", lambda: 1, 10)
+      nodecache.SaveStatsTo(cache, self.filename)
+
+    # Nothing to save
+    nodecache.SaveStatsTo(cache, self.filename)
+
+    self.assertEqual(nodecache.ReadStats(self.filename), {
+      nodecache.CN_LVM: {
+        nodecache.STAT_HITS: 3,
+        nodecache.STAT_MISSES: 1,
+        nodecache.STAT_INVALIDATIONS: 0,
+        },
+      })
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
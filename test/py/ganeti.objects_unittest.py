@@ -62,6 +62,110 @@ class TestDictState(unittest.TestCase):
     self.assertEquals(o1.ToDict(), {"a": 2, "b": 5})
 
 
+class TestFillDict(unittest.TestCase):
+  def testFlat(self):
+    defaults = {"a": 1, "b": "x", "c": None, "d": 1.5}
+    result = objects.FillDict(defaults, {"b": "y"})
+    self.assertEqual(result, {"a": 1, "b": "y", "c": None, "d": 1.5})
+    self.assertEqual(defaults["b"], "x")
+    result["a"] = 2
+    self.assertEqual(defaults["a"], 1)
+
+  def testNested(self):
+    defaults = {"a": {"b": 1}, "c": [1]}
+    result = objects.FillDict(defaults, {}, skip_keys=["d"])
+    self.assertEqual(result, defaults)
+    self.assertFalse(result["a"] is defaults["a"])
+    self.assertFalse(result["c"] is defaults["c"])
+
+  def testPrivate(self):
+    defaults = serializer.PrivateDict({"a": "b"})
+    result = objects.FillDict(defaults, {})
+    self.assertTrue(isinstance(result, serializer.PrivateDict))
+    self.assertEqual(result["a"].Get(), "b")
+
+
+class TestCopy(unittest.TestCase):
+  def _Check(self, obj):
+    """Checks that a copy is the same as a round-trip through a dict.
+
+    """
+    clone = obj.Copy()
+    self.assertFalse(clone is obj)
+    self.assertEqual(clone.__class__, obj.__class__)
+    self.assertEqual(clone.ToDict(),
+                     obj.__class__.FromDict(obj.ToDict()).ToDict())
+    return clone
+
+  def testSimple(self):
+    obj = SimpleObject(a=[1, 2])
+    clone = self._Check(obj)
+    self.assertEqual(clone, obj)
+    self.assertTrue(clone.a is obj.a)
+    self.assertEqual(clone.b, None)
+
+  def testInstance(self):
+    inst = objects.Instance(name="inst1.example.com",
+                            disk_template=constants.DT_PLAIN,
+                            hvparams={}, tags=set(["tag1"]),
+                            nics=[objects.NIC(mac="aa:00:00:00:00:01")],
+                            disks=["disk1-uuid"])
+    clone = self._Check(inst)
+    self.assertEqual(clone.disk_template, None)
+    self.assertEqual(clone.admin_state, constants.ADMINST_DOWN)
+    self.assertEqual(clone.tags, inst.tags)
+    self.assertFalse(clone.tags is inst.tags)
+    self.assertEqual(clone.nics, inst.nics)
+    self.assertFalse(clone.nics[0] is inst.nics[0])
+
+    clone.nics[0].mac = "aa:00:00:00:00:02"
+    self.assertEqual(inst.nics[0].mac, "aa:00:00:00:00:01")
+
+  def testDisk(self):
+    disk = objects.Disk(dev_type=constants.DT_DRBD8, size=128,
+                        logical_id=["node1", "node2", 12300, 0, 0],
+                        dynamic_params={"foo": "bar"},
+                        children=[
+                          objects.Disk(dev_type=constants.DT_PLAIN, size=128,
+                                       logical_id=("xenvg", "data")),
+                          objects.Disk(dev_type=constants.DT_PLAIN, size=128,
+                                       logical_id=("xenvg", "meta")),
+                          ])
+    clone = self._Check(disk)
+    self.assertEqual(clone.logical_id, ("node1", "node2", 12300, 0, 0, None))
+    self.assertEqual(clone.dynamic_params, None)
+    self.assertEqual(clone.children, disk.children)
+    self.assertFalse(clone.children[0] is disk.children[0])
+
+  def testNode(self):
+    node = objects.Node(name="node1.example.com", hv_state={
+      constants.HT_KVM: objects.NodeHvState(cpu_node=1),
+      }, disk_state={
+      constants.DT_PLAIN: {
+        "lv1": objects.NodeDiskState(total=128),
+        },
+      })
+    clone = self._Check(node)
+    self.assertFalse(clone.hv_state[constants.HT_KVM] is
+                     node.hv_state[constants.HT_KVM])
+    self.assertFalse(clone.disk_state[constants.DT_PLAIN]["lv1"] is
+                     node.disk_state[constants.DT_PLAIN]["lv1"])
+
+  def testNodeGroup(self):
+    group = objects.NodeGroup(name="group1", members=["node1-uuid"])
+    clone = self._Check(group)
+    self.assertEqual(clone.members, [])
+    self.assertEqual(group.members, ["node1-uuid"])
+
+  def testCluster(self):
+    cluster = objects.Cluster(tcpudp_port_pool=set([12300]))
+    clone = self._Check(cluster)
+    self.assertEqual(clone.tcpudp_port_pool, set([12300]))
+    self.assertFalse(clone.tcpudp_port_pool is cluster.tcpudp_port_pool)
+
+    self.assertEqual(objects.Cluster().Copy().tcpudp_port_pool, set())
+
+
 class TestClusterObject(unittest.TestCase):
   """Tests done on a L{objects.Cluster}"""
 
@@ -33,6 +33,7 @@
 
 import unittest
 
+from ganeti import compat
 from ganeti import constants
 from ganeti import errors
 from ganeti import serializer
@@ -124,6 +125,33 @@ class TextRPCParsing(testutils.GanetiTestCase):
 
     self.assertEqual(client.ParseResponse(msg), (True, "Hello World", 19991234))
 
+  def testParseResponsePrivatePaths(self):
+    msg = serializer.DumpJson({
+      client.KEY_SUCCESS: True,
+      client.KEY_RESULT: [
+        {"osparams_private": {"password": "a"}},
+        {"osparams_private": {"password": "b"}},
+        ],
+      })
+
+    (_, result, _) = client.ParseResponse(msg)
+    self.assertTrue(compat.all(isinstance(i["osparams_private"],
+                                          serializer.PrivateDict)
+                               for i in result))
+
+    (_, result, _) = client.ParseResponse(msg, private_paths=[(1, )])
+    self.assertFalse(isinstance(result[0]["osparams_private"],
+                                serializer.PrivateDict))
+    self.assertTrue(isinstance(result[1]["osparams_private"],
+                               serializer.PrivateDict))
+    self.assertEqual(result[1]["osparams_private"].GetPrivate("password"), "b")
+
+    (_, result, _) = client.ParseResponse(msg, private_paths=[])
+    self.assertEqual(result, [
+      {"osparams_private": {"password": "a"}},
+      {"osparams_private": {"password": "b"}},
+      ])
+
   def testFormatResponse(self):
     for success, result in [(False, "error"), (True, "abc"),
                             (True, { "a": 123, "b": None, })]:
@@ -257,6 +285,47 @@ class TestCallRPCMethod(unittest.TestCase):
                       _Cb, "fn9", [],
                       version=self.MY_LUXI_VERSION)
 
+  def testPrivatePaths(self):
+    def _Cb(msg):
+      return client.FormatResponse(True, {
+        "a": {"osparams_private": {"password": "x"}},
+        "b": {"osparams_private": {"password": "y"}},
+        })
+
+    result = client.CallRPCMethod(_Cb, "fnPriv", [], private_paths=[("b", )])
+    self.assertFalse(isinstance(result["a"]["osparams_private"],
+                                serializer.PrivateDict))
+    self.assertTrue(isinstance(result["b"]["osparams_private"],
+                               serializer.PrivateDict))
+
+
+class _PrivatePathsClient(client.AbstractClient):
+  _PRIVATE_PATHS = {
+    "fnPriv": [],
+    }
+
+  def __init__(self, response):
+    client.AbstractClient.__init__(self)
+    self._response = response
+
+  def _SendMethodCall(self, data):
+    return self._response
+
+
+class TestAbstractClient(unittest.TestCase):
+  def testPrivatePaths(self):
+    msg = client.FormatResponse(True, {"osparams_private": {"password": "z"}})
+    cl = _PrivatePathsClient(msg)
+
+    result = cl.CallMethod("fnPriv", [])
+    self.assertFalse(isinstance(result["osparams_private"],
+                                serializer.PrivateDict))
+
+    # Other methods' results are searched entirely
+    result = cl.CallMethod("fnOther", [])
+    self.assertTrue(isinstance(result["osparams_private"],
+                               serializer.PrivateDict))
+
 
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
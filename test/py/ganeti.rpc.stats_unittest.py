@@ -0,0 +1,174 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the ganeti.rpc.stats module"""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ganeti import serializer
+from ganeti.rpc import stats
+
+import testutils
+
+
+class TestRpcStats(unittest.TestCase):
+  def testRecord(self):
+    rs = stats.RpcStats()
+    rs.Record("version", "node1", 0.002, 10, 100)
+    rs.Record("version", "node2", 20.0, 10, 50, resp_raw_size=200,
+              encoding="deflate", failed=True)
+    rs.Record("version", None, None, 0, 0)
+
+    data = rs.GetData()
+    self.assertEqual(sorted(data[stats.SK_NODES].keys()), ["node1", "node2"])
+
+    entry = data[stats.SK_PROCEDURES]["version"]
+    self.assertEqual(entry["count"], 3)
+    self.assertEqual(entry["failed"], 1)
+    self.assertEqual(entry["latency_max"], 20.0)
+    self.assertEqual(entry["req_bytes"], 20)
+    self.assertEqual(entry["resp_bytes"], 150)
+    self.assertEqual(entry["resp_raw_bytes"], 300)
+    self.assertEqual(entry["encodings"], { "deflate": 1, })
+    self.assertEqual(entry["latency_hist"],
+                     [1, 1, 0, 0, 0, 0, 0, 0, 0, 1, 0])
+
+    node2 = data[stats.SK_NODES]["node2"]
+    self.assertEqual(node2["count"], 1)
+    self.assertEqual(node2["failed"], 1)
+
+  def testGetDataIsCopy(self):
+    rs = stats.RpcStats()
+    rs.Record("version", "node1", 0.1, 1, 1)
+    rs.GetData()[stats.SK_PROCEDURES].clear()
+    self.assertEqual(rs.GetData()[stats.SK_PROCEDURES]["version"]["count"], 1)
+
+  def testMerge(self):
+    rs1 = stats.RpcStats()
+    rs1.Record("version", "node1", 0.1, 1, 2)
+    rs2 = stats.RpcStats()
+    rs2.Record("version", "node1", 0.3, 3, 4, encoding="x-lz4")
+    rs2.Record("lv_list", "node1", 0.2, 5, 6)
+
+    data = rs1.GetData()
+    stats.MergeStats(data, rs2.GetData())
+
+    self.assertEqual(sorted(data[stats.SK_PROCEDURES].keys()),
+                     ["lv_list", "version"])
+    entry = data[stats.SK_PROCEDURES]["version"]
+    self.assertEqual(entry["count"], 2)
+    self.assertEqual(entry["latency_max"], 0.3)
+    self.assertEqual(entry["req_bytes"], 4)
+    self.assertEqual(entry["resp_bytes"], 6)
+    self.assertEqual(entry["encodings"], { "x-lz4": 1, })
+    self.assertEqual(data[stats.SK_NODES]["node1"]["count"], 3)
+
+
+class TestStatsFile(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, "rpc.stats")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testReadMissing(self):
+    data = stats.ReadFile(self.filename)
+    self.assertEqual(data, { stats.SK_PROCEDURES: {}, stats.SK_NODES: {}, })
+
+  def testSaveEmpty(self):
+    stats.RpcStats().SaveTo(self.filename)
+    self.assertFalse(os.path.exists(self.filename))
+
+  def testSaveAndMerge(self):
+    rs = stats.RpcStats()
+    rs.Record("version", "node1", 0.1, 1, 2)
+    rs.SaveTo(self.filename)
+
+    # Saving resets the in-memory statistics
+    self.assertFalse(rs.GetData()[stats.SK_PROCEDURES])
+
+    rs.Record("version", "node2", 0.2, 1, 2)
+    rs.SaveTo(self.filename)
+
+    data = stats.ReadFile(self.filename)
+    self.assertEqual(data[stats.SK_PROCEDURES]["version"]["count"], 2)
+    self.assertEqual(sorted(data[stats.SK_NODES].keys()), ["node1", "node2"])
+
+    # File contents must be valid JSON
+    serializer.LoadJson(open(self.filename).read())
+
+  def testSaveError(self):
+    rs = stats.RpcStats()
+    rs.Record("version", "node1", 0.1, 1, 2)
+    rs.SaveTo(os.path.join(self.tmpdir, "nonexistent", "rpc.stats"))
+
+
+class TestSummarize(unittest.TestCase):
+  def testEmpty(self):
+    summary = stats.Summarize(stats._NewEntry())
+    self.assertEqual(summary["count"], 0)
+    self.assertEqual(summary["latency_avg"], 0.0)
+    self.assertEqual(summary["latency_p50"], None)
+    self.assertEqual(summary["compression_ratio"], 1.0)
+
+  def test(self):
+    rs = stats.RpcStats()
+    for _ in range(9):
+      rs.Record("version", "node1", 0.003, 10, 50, resp_raw_size=100)
+    rs.Record("version", "node1", 0.4, 10, 50, resp_raw_size=100)
+
+    summary = \
+      stats.Summarize(rs.GetData()[stats.SK_PROCEDURES]["version"])
+    self.assertEqual(summary["count"], 10)
+    self.assertEqual(summary["failed"], 0)
+    self.assertAlmostEqual(summary["latency_avg"], (9 * 0.003 + 0.4) / 10)
+    self.assertEqual(summary["latency_max"], 0.4)
+    self.assertEqual(summary["latency_p50"], 0.005)
+    self.assertEqual(summary["latency_p90"], 0.005)
+    self.assertEqual(summary["latency_p99"], 0.5)
+    self.assertEqual(summary["req_bytes"], 100)
+    self.assertEqual(summary["resp_bytes"], 500)
+    self.assertEqual(summary["compression_ratio"], 2.0)
+
+  def testSlowestBucket(self):
+    rs = stats.RpcStats()
+    rs.Record("version", "node1", 120.0, 0, 0)
+    summary = \
+      stats.Summarize(rs.GetData()[stats.SK_PROCEDURES]["version"])
+    self.assertEqual(summary["latency_p50"], None)
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
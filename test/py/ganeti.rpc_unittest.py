@@ -30,11 +30,13 @@
 
 """Script for testing ganeti.rpc"""
 
+import errno
 import os
 import sys
 import unittest
 import random
 import tempfile
+import threading
 
 from ganeti import constants
 from ganeti import compat
@@ -342,6 +344,88 @@ class TestRpcProcessor(unittest.TestCase):
     self.assertEqual(http_proc.reqcount, 1)
 
 
+class TestRpcQuorum(unittest.TestCase):
+  def setUp(self):
+    self.release = threading.Event()
+    self.done = []
+
+  def _Respond(self, req):
+    if req.host == "192.0.2.3":
+      # Slow node
+      self.release.wait()
+
+    req.success = (req.host != "192.0.2.2")
+    if req.success:
+      req.resp_status_code = http.HTTP_OK
+      req.resp_body = serializer.DumpJson((True, req.host))
+    else:
+      req.error = "test error"
+
+    if req.completion_cb:
+      req.completion_cb(req)
+
+  def _Process(self, reqs, lock_monitor_cb=None):
+    # Requests are processed in order, the slow node comes last
+    for req in sorted(reqs, key=lambda req: req.host):
+      self._Respond(req)
+
+  def _Call(self, quorum, addresses):
+    resolver = rpc._StaticResolver(addresses)
+    proc = rpc._RpcProcessor(resolver, 18700, _stats=rpc.stats.RpcStats())
+    nodes = ["node%s" % addr.split(".")[-1] for addr in addresses]
+    body = dict((name, "") for name in nodes)
+    return proc(nodes, "version", body, 30, NotImplemented,
+                _req_process_fn=self._Process, quorum=quorum)
+
+  def testEarlyReturn(self):
+    quorum = rpc.RpcQuorum(1, done_cb=self.done.append)
+    result = self._Call(quorum, ["192.0.2.1", "192.0.2.2", "192.0.2.3"])
+    self.assertEqual(result["node1"].payload, "192.0.2.1")
+    self.assertFalse("node3" in result)
+    self.assertFalse(quorum.Wait(timeout=0.01))
+    self.assertFalse(self.done)
+
+    self.release.set()
+    self.assertTrue(quorum.Wait())
+    self.assertEqual(len(self.done), 1)
+    self.assertEqual(sorted(self.done[0].keys()), ["node1", "node2", "node3"])
+    self.assertTrue(self.done[0]["node2"].fail_msg)
+    self.assertEqual(self.done[0]["node3"].payload, "192.0.2.3")
+
+  def testQuorumNotReached(self):
+    self.release.set()
+    quorum = rpc.RpcQuorum(3, done_cb=self.done.append)
+    result = self._Call(quorum, ["192.0.2.1", "192.0.2.2", "192.0.2.3"])
+    self.assertEqual(sorted(result.keys()), ["node1", "node2", "node3"])
+    self.assertTrue(quorum.Wait())
+    self.assertEqual(len(self.done), 1)
+    self.assertEqual(sorted(self.done[0].keys()), ["node1", "node2", "node3"])
+
+  def testNoNodes(self):
+    quorum = rpc.RpcQuorum(1, done_cb=self.done.append)
+    self.assertEqual(self._Call(quorum, []), {})
+    self.assertTrue(quorum.Wait())
+    self.assertEqual(self.done, [{}])
+
+  def testProcessingError(self):
+    quorum = rpc.RpcQuorum(2, done_cb=self.done.append)
+    requests = {
+      "node1": http.client.HttpClientRequest("192.0.2.1", 18700, "POST", "/x"),
+      }
+
+    def _Process(_):
+      raise errors.GenericError("test")
+
+    def _GetResult(name, req):
+      return rpc.RpcResult(data=req.error, failed=True, node=name, call="x")
+
+    result = quorum.Process(_Process, requests, {}, _GetResult)
+    self.assertEqual(result.keys(), ["node1"])
+    self.assertTrue(result["node1"].fail_msg)
+    self.assertTrue(quorum.Wait())
+    self.assertEqual(self.done[0].keys(), ["node1"])
+
+
 class TestSsconfResolver(unittest.TestCase):
   def testSsconfLookup(self):
     addr_list = ["192.0.2.%d" % n for n in range(0, 255, 13)]
@@ -394,6 +478,106 @@ class TestSsconfResolver(unittest.TestCase):
     self.assertEqual(result, zip(node_list, addr_list, node_list))
 
 
+class TestSsconfResolverCache(unittest.TestCase):
+  class _FakeStore:
+    def __init__(self, data):
+      self._data = data
+      self.reads = []
+
+    def KeyToFilename(self, key):
+      return "/ssconf/%s" % key
+
+    def GetPrimaryIPFamily(self):
+      self.reads.append(constants.SS_PRIMARY_IP_FAMILY)
+      return self._data[constants.SS_PRIMARY_IP_FAMILY]
+
+    def GetNodePrimaryIPList(self):
+      self.reads.append(constants.SS_NODE_PRIMARY_IPS)
+      return self._data[constants.SS_NODE_PRIMARY_IPS]
+
+  def setUp(self):
+    self.now = 1000.0
+    self.file_ids = {
+      "/ssconf/%s" % constants.SS_PRIMARY_IP_FAMILY: (1, 100, 1.0),
+      "/ssconf/%s" % constants.SS_NODE_PRIMARY_IPS: (1, 101, 1.0),
+      }
+    self.data = {
+      constants.SS_PRIMARY_IP_FAMILY: 2,
+      constants.SS_NODE_PRIMARY_IPS: ["node1 192.0.2.1", "node2 192.0.2.2"],
+      }
+    self.ss = self._FakeStore(self.data)
+    self.cache = rpc._SsconfResolverCache(10, _time_fn=lambda: self.now,
+                                          _get_file_id=self._GetFileId)
+
+  def _GetFileId(self, path=None):
+    try:
+      return self.file_ids[path]
+    except KeyError:
+      raise EnvironmentError(errno.ENOENT, "No such file")
+
+  def _Resolve(self, ssconf_ips, nodes, nslookup_fn=NotImplemented):
+    return rpc._SsconfResolver(ssconf_ips, nodes, NotImplemented,
+                               ssc=lambda: self.ss, nslookup_fn=nslookup_fn,
+                               cache=self.cache)
+
+  def testFileIdentity(self):
+    for _ in range(3):
+      self.assertEqual(self._Resolve(True, ["node2", "node1"]),
+                       [("node2", "192.0.2.2", "node2"),
+                        ("node1", "192.0.2.1", "node1")])
+    self.assertEqual(sorted(self.ss.reads),
+                     sorted([constants.SS_PRIMARY_IP_FAMILY,
+                             constants.SS_NODE_PRIMARY_IPS]))
+
+    # Replace node list
+    self.data[constants.SS_NODE_PRIMARY_IPS] = ["node1 192.0.2.10"]
+    self.assertEqual(self._Resolve(True, ["node1"]),
+                     [("node1", "192.0.2.1", "node1")])
+    self.file_ids["/ssconf/%s" % constants.SS_NODE_PRIMARY_IPS] = \
+      (1, 102, 2.0)
+    self.assertEqual(self._Resolve(True, ["node1"]),
+                     [("node1", "192.0.2.10", "node1")])
+    self.assertEqual(self.ss.reads.count(constants.SS_NODE_PRIMARY_IPS), 2)
+    self.assertEqual(self.ss.reads.count(constants.SS_PRIMARY_IP_FAMILY), 1)
+
+    self.cache.Flush()
+    self._Resolve(True, ["node1"])
+    self.assertEqual(self.ss.reads.count(constants.SS_NODE_PRIMARY_IPS), 3)
+
+  def testMissingFile(self):
+    del self.file_ids["/ssconf/%s" % constants.SS_PRIMARY_IP_FAMILY]
+    for _ in range(3):
+      self._Resolve(False, [])
+    self.assertEqual(self.ss.reads, [constants.SS_PRIMARY_IP_FAMILY] * 3)
+
+  def testNegativeLookup(self):
+    lookups = []
+
+    def _NsLookup(name, family=None):
+      self.assertEqual(family, 2)
+      lookups.append(name)
+      if name == "node3":
+        raise errors.ResolverError(name, 1, "Not found")
+      return "192.0.2.99"
+
+    for _ in range(3):
+      self.assertRaises(errors.ResolverError, self._Resolve, True,
+                        ["node1", "node3"], nslookup_fn=_NsLookup)
+    self.assertEqual(lookups, ["node3"])
+
+    # Successful lookups are not cached
+    for _ in range(2):
+      self.assertEqual(self._Resolve(False, ["node1"], nslookup_fn=_NsLookup),
+                       [("node1", "192.0.2.99", "node1")])
+    self.assertEqual(lookups, ["node3", "node1", "node1"])
+
+    # Failures expire
+    self.now += 11
+    self.assertRaises(errors.ResolverError, self._Resolve, True, ["node3"],
+                      nslookup_fn=_NsLookup)
+    self.assertEqual(lookups, ["node3", "node1", "node1", "node3"])
+
+
 class TestStaticResolver(unittest.TestCase):
   def test(self):
     addresses = ["192.0.2.%d" % n for n in range(0, 123, 7)]
@@ -498,6 +682,14 @@ class TestCompress(unittest.TestCase):
       self.assertEqual(len(compressed), 2)
       self.assertEqual(backend._Decompress(compressed), data)
 
+  def testFiles(self):
+    files = [("job-1", "Hello"), ("job-2", 5242 * "Hello World!\n")]
+    compressed = rpc._CompressFiles(NotImplemented, files)
+    self.assertEqual([name for (name, _) in compressed], ["job-1", "job-2"])
+    self.assertEqual([backend._Decompress(data) for (_, data) in compressed],
+                     [data for (_, data) in files])
+    self.assertEqual(rpc._CompressFiles(NotImplemented, []), [])
+
   def testDecompression(self):
     self.assertRaises(AssertionError, backend._Decompress, "")
     self.assertRaises(AssertionError, backend._Decompress, [""])
@@ -602,6 +794,81 @@ class TestRpcClientBase(unittest.TestCase):
         self.assertEqual(serializer.LoadJson(res.payload),
                          ["foo", hex(num), hash("Hello%s" % num)])
 
+  def testNodeIndependentEncoding(self):
+    resolver = rpc._StaticResolver([
+      "192.0.2.5",
+      "192.0.2.6",
+      "192.0.2.7",
+      ])
+
+    nodes = [
+      "node5.example.com",
+      "node6.example.com",
+      "node7.example.com",
+      ]
+
+    calls = []
+
+    def _Encode(kind, node, value):
+      calls.append((kind, node))
+      return value * 2
+
+    encoders = {
+      rpc_defs.ED_COMPRESS: compat.partial(_Encode, rpc_defs.ED_COMPRESS),
+      rpc_defs.ED_INST_DICT: compat.partial(_Encode, rpc_defs.ED_INST_DICT),
+      }
+
+    bodies = []
+
+    def _VerifyRequest(req):
+      bodies.append(req.post_data)
+      req.success = True
+      req.resp_status_code = http.HTTP_OK
+      req.resp_body = serializer.DumpJson((True, req.post_data))
+
+    http_proc = _FakeRequestProcessor(_VerifyRequest)
+    client = rpc._RpcClientBase(resolver, encoders.get,
+                                _req_process_fn=http_proc)
+
+    tests = [
+      ([rpc_defs.ED_COMPRESS], True, {
+        rpc_defs.ED_COMPRESS: 1,
+        }),
+      ([rpc_defs.ED_INST_DICT], False, {
+        rpc_defs.ED_INST_DICT: len(nodes),
+        }),
+      ([rpc_defs.ED_COMPRESS, rpc_defs.ED_INST_DICT], False, {
+        rpc_defs.ED_COMPRESS: 1,
+        rpc_defs.ED_INST_DICT: len(nodes),
+        }),
+      ]
+
+    for (argkinds, exp_independent, exp_calls) in tests:
+      argdefs = [("arg0", None, NotImplemented)]
+      argdefs.extend(("arg%s" % (idx + 1), argkind, NotImplemented)
+                     for (idx, argkind) in enumerate(argkinds))
+      cdef = ("test_call", NotImplemented, None, constants.RPC_TMO_NORMAL,
+              argdefs, None, None, NotImplemented)
+
+      self.assertEqual(rpc_defs.IsNodeIndependent(argdefs, None),
+                       exp_independent)
+
+      del calls[:]
+      del bodies[:]
+
+      result = client._Call(cdef, nodes, ["foo"] + ["bar"] * len(argkinds))
+      self.assertEqual(len(result), len(nodes))
+      self.assertEqual(len(bodies), len(nodes))
+      self.assertEqual(dict((kind, len([i for (i, _) in calls if i == kind]))
+                            for kind in argkinds), exp_calls)
+      if exp_independent:
+        self.assertEqual(calls, [(rpc_defs.ED_COMPRESS, None)])
+        self.assertTrue(compat.all(body is bodies[0] for body in bodies))
+      for res in result.values():
+        self.assertFalse(res.fail_msg)
+        self.assertEqual(serializer.LoadJson(res.payload),
+                         ["foo"] + ["barbar"] * len(argkinds))
+
   def testPostProc(self):
     def _VerifyRequest(nums, req):
       req.success = True
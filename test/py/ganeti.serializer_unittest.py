@@ -76,6 +76,17 @@ class TestSerializer(testutils.GanetiTestCase):
   def testGeneric(self):
     self._TestSerializer(serializer.Dump, serializer.Load)
 
+  def testCompact(self):
+    for data in self._TESTDATA:
+      dumped = serializer.DumpJson(
+        data, private_encoder=serializer.EncodeWithPrivateFields, compact=True)
+      self.assertFalse(dumped.endswith("\n"))
+      self.assertFalse(", " in dumped or ": " in dumped)
+      self.assertEqualValues(serializer.LoadJson(dumped), data)
+
+    self.assertEqual(serializer.DumpJson({"a": [1, 2]}, compact=True),
+                     "{\"a\":[1,2]}")
+
   def testSignedGeneric(self):
     self._TestSigned(serializer.DumpSigned, serializer.LoadSigned)
 
@@ -152,6 +163,72 @@ class TestLoadAndVerifyJson(unittest.TestCase):
     self.assertEqual(serializer.LoadAndVerifyJson("\"Foo\"", ht.TAny), "Foo")
 
 
+class TestLoadPrivatePaths(unittest.TestCase):
+  _DATA = {
+    "cluster": {
+      "osparams_private_cluster": {"debootstrap": {"password": "a"}},
+      },
+    "instances": {
+      "inst1": {"osparams_private": {"password": "b"}},
+      "inst2": {"osparams_private": {"password": "c"}},
+      },
+    "nodes": {
+      "node1": {"osparams_private": {"password": "d"}},
+      },
+    "ops": [
+      {"input": {"osparams_secret": {"password": "e"}}},
+      {"input": {"osparams_secret": {"password": "f"}}},
+      ],
+    }
+
+  def _Load(self, private_paths):
+    return serializer.LoadJson(serializer.DumpJson(self._DATA),
+                               private_paths=private_paths)
+
+  def testDefault(self):
+    data = self._Load(None)
+    self.assertTrue(isinstance(data["nodes"]["node1"]["osparams_private"],
+                               serializer.PrivateDict))
+    self.assertTrue(isinstance(data["ops"][1]["input"]["osparams_secret"],
+                               serializer.PrivateDict))
+
+  def testNoPaths(self):
+    data = self._Load([])
+    self.assertEqual(data, self._DATA)
+    self.assertFalse(isinstance(data["instances"]["inst1"]["osparams_private"],
+                                serializer.PrivateDict))
+
+  def testPaths(self):
+    data = self._Load([
+      ("cluster", ),
+      ("instances", serializer.PATH_ANY),
+      ("ops", 1, "input"),
+      ("missing", serializer.PATH_ANY, "input"),
+      ("ops", 10),
+      ])
+
+    cluster_params = data["cluster"]["osparams_private_cluster"]
+    self.assertTrue(isinstance(cluster_params["debootstrap"],
+                               serializer.PrivateDict))
+    self.assertEqual(cluster_params["debootstrap"].GetPrivate("password"), "a")
+
+    for (name, password) in [("inst1", "b"), ("inst2", "c")]:
+      params = data["instances"][name]["osparams_private"]
+      self.assertTrue(isinstance(params, serializer.PrivateDict))
+      self.assertEqual(params.GetPrivate("password"), password)
+
+    self.assertTrue(isinstance(data["ops"][1]["input"]["osparams_secret"],
+                               serializer.PrivateDict))
+
+    # Fields outside of the given paths are left alone
+    self.assertEqual(data["ops"][0]["input"]["osparams_secret"],
+                     {"password": "e"})
+    self.assertFalse(isinstance(data["ops"][0]["input"]["osparams_secret"],
+                                serializer.PrivateDict))
+    self.assertFalse(isinstance(data["nodes"]["node1"]["osparams_private"],
+                                serializer.PrivateDict))
+
+
 class TestPrivate(unittest.TestCase):
 
   def testEquality(self):
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the ganeti.statsfile module"""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ganeti import errors
+from ganeti import serializer
+from ganeti import statsfile
+from ganeti import utils
+
+import testutils
+
+
+def _Merge(target, source):
+  for (name, value) in source.items():
+    target[name] = target.get(name, 0) + value
+
+
+class TestStatsFile(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, "test.stats")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testReadMissing(self):
+    result = {}
+    self.assertTrue(statsfile.Read(self.filename, _Merge, result) is result)
+    self.assertEqual(result, {})
+
+  def testMerge(self):
+    statsfile.MergeInto(self.filename, { "a": 1, }, _Merge)
+    statsfile.MergeInto(self.filename, { "a": 2, "b": 1, }, _Merge)
+
+    self.assertEqual(statsfile.Read(self.filename, _Merge, { "c": 1, }),
+                     { "a": 3, "b": 1, "c": 1, })
+
+    # File contents must be valid JSON
+    self.assertEqual(serializer.LoadJson(open(self.filename).read()),
+                     { "a": 3, "b": 1, })
+
+  def testReadLocked(self):
+    statsfile.MergeInto(self.filename, { "a": 1, }, _Merge)
+
+    lock = utils.FileLock.Open(self.filename)
+    try:
+      lock.Exclusive(blocking=True)
+      self.assertRaises(errors.LockError, statsfile.Read, self.filename,
+                        _Merge, {}, _lock_timeout=0.1)
+    finally:
+      lock.Close()
+
+    self.assertEqual(statsfile.Read(self.filename, _Merge, {}), { "a": 1, })
+
+  def testMergeError(self):
+    self.assertRaises(EnvironmentError, statsfile.MergeInto,
+                      os.path.join(self.tmpdir, "nonexistent", "test.stats"),
+                      { "a": 1, }, _Merge)
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
@@ -32,6 +32,9 @@
 
 import unittest
 import os.path
+import shutil
+import stat
+import tempfile
 
 from ganeti import utils
 from ganeti.tools import ensure_dirs
@@ -70,7 +73,7 @@ class TestGetPaths(unittest.TestCase):
                              path))
         current_dir = path
 
-      elif pathtype == ensure_dirs.FILE:
+      elif pathtype in (ensure_dirs.FILE, ensure_dirs.SHARED_FILE):
         self.assertFalse(current_dir is None)
         self.assertTrue(dirname in seen,
                         msg=("Directory '%s' of path '%s' has not been seen"
@@ -84,5 +87,25 @@ class TestGetPaths(unittest.TestCase):
         self.fail("Unknown path type '%s'" % (pathtype, ))
 
 
+class TestEnsureSharedFile(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = utils.PathJoin(self.tmpdir, "shared")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test(self):
+    ensure_dirs.EnsureSharedFile(self.path, 0660, os.getuid(), os.getgid())
+    self.assertEqual(utils.ReadFile(self.path), "")
+    self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0660)
+
+    # Existing contents are kept
+    utils.WriteFile(self.path, data="data", mode=0644)
+    ensure_dirs.EnsureSharedFile(self.path, 0660, os.getuid(), os.getgid())
+    self.assertEqual(utils.ReadFile(self.path), "data")
+    self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0660)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for measuring the cost of copying configuration objects"""
+
+import sys
+import time
+import optparse
+
+from ganeti import constants
+from ganeti import objects
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-i", dest="instance_count", default=1000, type="int",
+                    help="Number of instances", metavar="NUM")
+  parser.add_option("-c", dest="nic_count", default=8, type="int",
+                    help="Number of NICs per instance", metavar="NUM")
+  parser.add_option("-n", dest="repeat", default=10, type="int",
+                    help="Number of times the instances are copied",
+                    metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.instance_count < 1:
+    parser.error("Number of instances must be at least 1")
+
+  if opts.nic_count < 0:
+    parser.error("Number of NICs can't be negative")
+
+  if opts.repeat < 1:
+    parser.error("Number of repetitions must be at least 1")
+
+  return (opts, args)
+
+
+def _BuildInstance(idx, nic_count):
+  """Builds an instance object with many children.
+
+  """
+  nics = [objects.NIC(uuid="nic%s-%s" % (idx, i),
+                      mac="aa:00:00:00:%02x:%02x" % (idx % 256, i % 256),
+                      nicparams={constants.NIC_MODE: constants.NIC_MODE_BRIDGED,
+                                 constants.NIC_LINK: "br%s" % i})
+          for i in range(nic_count)]
+
+  return objects.Instance(uuid="inst%s" % idx,
+                          name="inst%s.example.com" % idx,
+                          primary_node="node%s" % (idx % 20),
+                          os="debootstrap+default",
+                          admin_state=constants.ADMINST_UP,
+                          hvparams={"kernel_path": "/boot/vmlinuz",
+                                    "acpi": True},
+                          beparams={"maxmem": 1024, "minmem": 512},
+                          osparams={"dhcp": "yes"},
+                          nics=nics,
+                          disks=["disk%s-%s" % (idx, i) for i in range(4)],
+                          tags=set("tag%s" % i for i in range(10)),
+                          serial_no=1)
+
+
+def _Measure(objs, repeat, fn):
+  """Copies all objects several times, returns the average CPU time.
+
+  """
+  start = time.clock()
+  for _ in range(repeat):
+    for obj in objs:
+      fn(obj)
+  return (time.clock() - start) / repeat
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  instances = [_BuildInstance(i, opts.nic_count)
+               for i in range(opts.instance_count)]
+
+  print "Copying %s instances with %s NICs each" % (opts.instance_count,
+                                                   opts.nic_count)
+  sys.stdout.flush()
+
+  roundtrip = _Measure(instances, opts.repeat,
+                       lambda obj: obj.__class__.FromDict(obj.ToDict()))
+  copy = _Measure(instances, opts.repeat, lambda obj: obj.Copy())
+
+  print "Average time:"
+  print "  Round-trip through ToDict/FromDict: %0.3fs" % roundtrip
+  print "  Copy: %0.3fs (%0.1f%%)" % (copy, 100.0 * copy / roundtrip)
+
+
+if __name__ == "__main__":
+  main()
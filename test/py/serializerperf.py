@@ -0,0 +1,162 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for measuring the cost of wrapping private values on load"""
+
+import sys
+import time
+import optparse
+
+from ganeti import serializer
+from ganeti import wconfd
+from ganeti.rpc import client
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-i", dest="instance_count", default=5000, type="int",
+                    help="Number of instances", metavar="NUM")
+  parser.add_option("-n", dest="repeat", default=10, type="int",
+                    help="Number of times the configuration is loaded",
+                    metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.instance_count < 1:
+    parser.error("Number of instances must be at least 1")
+
+  if opts.repeat < 1:
+    parser.error("Number of repetitions must be at least 1")
+
+  return (opts, args)
+
+
+def _BuildConfig(instance_count):
+  """Builds a configuration-like document of the given size.
+
+  """
+  nodes = dict(("node%s" % i, {
+    "name": "node%s.example.com" % i,
+    "primary_ip": "192.0.2.%s" % (i % 250),
+    "ndparams": {"spindle_count": 1, "oob_program": None},
+    "tags": [],
+    }) for i in range(max(1, instance_count / 20)))
+
+  instances = dict(("inst%s" % i, {
+    "name": "inst%s.example.com" % i,
+    "primary_node": "node%s" % (i % len(nodes)),
+    "os": "debootstrap+default",
+    "hvparams": {"kernel_path": "/boot/vmlinuz", "acpi": True},
+    "beparams": {"maxmem": 1024, "minmem": 512, "vcpus": 1},
+    "osparams": {"dhcp": "yes"},
+    "osparams_private": {"password": "secret%s" % i},
+    "nics": [{"mac": "aa:00:00:00:00:%02x" % (i % 256),
+              "nicparams": {"mode": "bridged", "link": "br0"}}],
+    "disks": ["disk%s-%s" % (i, j) for j in range(2)],
+    "tags": ["tag%s" % j for j in range(3)],
+    }) for i in range(instance_count))
+
+  disks = dict(("disk%s-%s" % (i, j), {
+    "dev_type": "plain",
+    "logical_id": ["xenvg", "disk%s-%s" % (i, j)],
+    "size": 10240,
+    "params": {},
+    "children": [],
+    }) for i in range(instance_count) for j in range(2))
+
+  return {
+    "cluster": {
+      "cluster_name": "cluster.example.com",
+      "osparams_private_cluster": {"debootstrap": {"password": "secret"}},
+      },
+    "nodes": nodes,
+    "instances": instances,
+    "disks": disks,
+    }
+
+
+def _Measure(fn, repeat):
+  """Calls a function several times, returns the average CPU time.
+
+  """
+  start = time.clock()
+  for _ in range(repeat):
+    fn()
+  return (time.clock() - start) / repeat
+
+
+def _Report(title, load_fn, private_paths, repeat):
+  """Compares the load times with and without private paths.
+
+  """
+  full = _Measure(lambda: load_fn(None), repeat)
+  paths = _Measure(lambda: load_fn(private_paths), repeat)
+  none = _Measure(lambda: load_fn([]), repeat)
+
+  print "%s, average load time:" % title
+  print "  Wrapping everywhere: %0.3fs" % full
+  print "  Wrapping configuration paths: %0.3fs (%0.1f%%)" % \
+    (paths, 100.0 * paths / full)
+  print "  Not wrapping: %0.3fs (%0.1f%%)" % (none, 100.0 * none / full)
+  sys.stdout.flush()
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  data = _BuildConfig(opts.instance_count)
+  txt = serializer.DumpJson(data)
+
+  print "Configuration size: %0.1f KiB" % (len(txt) / 1024.0)
+  sys.stdout.flush()
+
+  _Report("Configuration file",
+          lambda paths: serializer.LoadJson(txt, private_paths=paths),
+          wconfd.CONFIG_PRIVATE_PATHS, opts.repeat)
+
+  # The configuration as returned by WConfd when the config lock is acquired
+  response = client.FormatResponse(True, [True, data])
+  response_paths = \
+    wconfd.Client._PRIVATE_PATHS["lockConfigIfChanged"] # pylint: disable=W0212
+  _Report("WConfd response",
+          lambda paths: client.ParseResponse(response, private_paths=paths),
+          response_paths, opts.repeat)
+
+
+if __name__ == "__main__":
+  main()